@@ -11,11 +11,14 @@ class IMEM(object):
         self.size = pow(2, 16)  # Can hold a maximum of 2^16 instructions.
         self.filepath = os.path.abspath(os.path.join(iodir, name))
         self.instructions = []
+        self.lines = []  # Line number in Code.asm of every instruction
 
         try:
             with open(self.filepath, 'r') as insf:
-                self.instructions = [instruction.split('#')[0].strip() for instruction in insf.readlines() if
-                                     not (instruction.startswith('#') or instruction.strip() == '')]
+                lines = [(number, instruction) for number, instruction in enumerate(insf.readlines(), 1) if
+                         not (instruction.startswith('#') or instruction.strip() == '')]
+                self.instructions = [instruction.split('#')[0].strip() for _, instruction in lines]
+                self.lines = [number for number, _ in lines]
             print("IMEM - Instructions loaded from file:", self.filepath)
         except:
             print("IMEM - ERROR: Couldn't open file in path:", self.filepath)
@@ -30,20 +33,31 @@ class IMEM(object):
 
 class DMEM(object):
     # Word addressible - each address contains 32 bits.
-    def __init__(self, name, iodir, addressLen):
+    # A long-running process (see TimingSimulator/service.py) passes `memory`, a zeroed list of size words kept from an
+    # earlier run, instead of allocating one, and `values`, the input file it has already read. The words written are
+    # then recorded, so release() zeroes only those for the next run.
+    def __init__(self, name, iodir, addressLen, memory=None, values=None):
         self.name = name
         self.size = pow(2, addressLen)
         self.min_value = -pow(2, 31)
         self.max_value = pow(2, 31) - 1
         self.ipfilepath = os.path.abspath(os.path.join(iodir, name + ".txt"))
         self.opfilepath = os.path.abspath(os.path.join(iodir, name + "OP.txt"))
-        self.data = []
+        self.data = [] if memory is None else memory
+        self.loaded = 0  # Number of words loaded from the input file
+        self.written = None if memory is None else set()
 
         try:
-            with open(self.ipfilepath, 'r') as ipf:
-                self.data = [int(line.strip()) for line in ipf.readlines()]
-            print(self.name, "- Data loaded from file:", self.ipfilepath)
-            self.data.extend([0x0 for _ in range(self.size - len(self.data))])  # Initialize the remaining as zeroes
+            if values is None:
+                with open(self.ipfilepath, 'r') as ipf:
+                    values = [int(line.strip()) for line in ipf.readlines()]
+                print(self.name, "- Data loaded from file:", self.ipfilepath)
+            self.loaded = len(values)
+            if memory is None:
+                self.data = list(values)
+                self.data.extend([0x0 for _ in range(self.size - len(self.data))])  # Initialize the remaining as zeroes
+            else:
+                memory[:len(values)] = values
         except:
             print(self.name, "- ERROR: Couldn't open input file in path:", self.ipfilepath)
 
@@ -57,10 +71,20 @@ class DMEM(object):
     def Write(self, idx, val):  # Use this to write into DMEM.
         if idx < self.size:
             self.data[idx] = val  # Writing the val at index idx
+            if self.written is not None:
+                self.written.add(idx)
         else:
             print("Error : Memory Out of bounds exception")
             return None  # If out of bounds return None
 
+    def release(self):
+        # Zeroes the words loaded and written by the run and returns the memory passed in for the next one
+        for idx in self.written:
+            self.data[idx] = 0
+        self.data[:self.loaded] = [0x0] * self.loaded
+        self.written = set()
+        return self.data
+
     def dump(self):
         try:
             with open(self.opfilepath, 'w') as opf:
@@ -147,6 +171,7 @@ class Core:
         self.getRegisterFile(Core.VMR).Write(0, [1] * 64)  # changing mask register to all ones
         self.ins = ins.Instructions(self)  # Instruction list
         self.resolvedData = []
+        self.resolvedLines = []  # Code.asm line of every resolved instruction, used to attribute timing results
         # Declaring execution handlers
         self.preInstructionExecutionHandler = None
         self.postInstructionExecutionHandler = None
@@ -187,6 +212,7 @@ class Core:
 
                 if result in [ins.Instructions.SUCCESS, ins.Instructions.SUCCESS_TERMINATION]:
                     self.resolvedData.append(resolvedData)
+                    self.resolvedLines.append(self.IMEM.lines[current_PC])
                     # Execute postInstructionExecutionHanlder if specified and the result of execution of instruction is successful
                     if self.postInstructionExecutionHandler is not None:
                         if not self.postInstructionExecutionHandler(instr, current_PC,
@@ -218,15 +244,16 @@ class Core:
         for rf in self.RFs.values():
             rf.dump(iodir)
 
-    def dumpResolvedData(self, iodir, name="resolvedData"):
-        path = os.path.abspath(os.path.join(iodir, name + ".txt"))
-        try:
-            with open(path, 'w') as opf:
-                lines = [str(data) + '\n' for data in self.resolvedData]
-                opf.writelines(lines)
-            print(name, "- Dumped resolved data into output file in path:", path)
-        except:
-            print(name, "- ERROR: Couldn't open output file in path:", path)
+    def dumpResolvedData(self, iodir, name="resolvedData", linesName="resolvedLines"):
+        for fileName, data in [(name, self.resolvedData), (linesName, self.resolvedLines)]:
+            path = os.path.abspath(os.path.join(iodir, fileName + ".txt"))
+            try:
+                with open(path, 'w') as opf:
+                    lines = [str(line) + '\n' for line in data]
+                    opf.writelines(lines)
+                print(fileName, "- Dumped resolved data into output file in path:", path)
+            except:
+                print(fileName, "- ERROR: Couldn't open output file in path:", path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+import argparse
+import math
+import os
+import time
+from collections import deque
+
+# main first, decode and computeEngine import each other and only load in that order
+from main import Config, dumpOutput, getBankCounts, loadTraces, readFiles, runTasks
+from bounds import getProfile
+from decode import Decode
+from preprocess import PIPELINE_DATA, PIPELINE_SCALAR
+
+
+KIND_SCALAR = 0
+KIND_DATA = 1
+KIND_COMPUTE = 2
+
+
+def getOperations(profile):
+    # Config independent part of every instruction, as tuples for the loop below: kind, pipeline, trace indices of
+    # the instructions it depends on (its RAW and WAW producers from the preprocessed trace), vector length set by an
+    # MTCL (0 for other instructions) and the index of the data instruction. Kept on the profile, so a sweep builds
+    # them once per trace.
+    operations = getattr(profile, "operations", None)
+    if operations is not None:
+        return operations
+    operations = []
+    data = 0
+    trace = profile.trace
+    for instr, pipeline, (raw, waw) in zip(trace.decoded, trace.pipelines, trace.producers):
+        mtcl = int(instr[Decode.INSTR_ARGS][-1]) if instr[Decode.INSTR_NAME] == 'MTCL' else 0
+        kind = KIND_SCALAR if pipeline == PIPELINE_SCALAR else KIND_DATA if pipeline == PIPELINE_DATA else KIND_COMPUTE
+        operations.append((kind, pipeline, raw + waw, mtcl, data))
+        data += kind == KIND_DATA
+    profile.operations = operations
+    return operations
+
+
+def approximate(profile, config):
+    # One pass over the trace in program order, without ticking cycles. Every instruction is fetched one cycle after
+    # the previous one (an MTCL once everything before it completed) and issues once its registers are ready and its
+    # queue has room; younger instructions may issue first, like in the decode window. It then starts on its
+    # pipeline, a single slot per pipeline, in queue order, and holds it for its latency: depth plus vector length
+    # over lanes for compute, and for data the addresses going through the load store pipeline limited by the busiest
+    # bank. Returns the estimated clock cycles.
+    depths = {"add": config.addPipelineDepth, "mul": config.mulPipelineDepth, "div": config.divPipelineDepth}
+    lanes = config.numberOfLanes
+    depth = config.vectorLoadStorePipelineDepth
+    bankBusyTime = config.bankBusyTime
+    # Cycles a data instruction holds the engine after it started, see bounds.getBounds
+    dataCycles = [max(size - 1, depth + (peak - 1) * bankBusyTime) + bankBusyTime if size > depth else size - 1
+                  for size, peak in zip(profile.dataSizes, profile.getBankPeaks(config.numberOfBanks, depth))]
+    computeCycles = {}  # (pipeline, vector length): cycles a compute instruction holds its pipeline
+
+    written = [0] * len(profile.trace.decoded)  # Cycle the register written by every instruction is ready
+    free = {"add": 0, "mul": 0, "div": 0}  # First cycle each compute pipeline can start an instruction
+    dataFree = 0
+    computeStarts = deque(maxlen=config.computeQueueDepth)  # Start cycles of the last instructions of each queue
+    dataStarts = deque(maxlen=config.dataQueueDepth)
+    lastComputeStart = 0
+    fetch = 0
+    last = 0  # Last cycle anything issued or completed
+    done = 0  # Cycle the last started instruction completes
+    vectorLength = 64
+    for index, (kind, pipeline, producers, mtcl, data) in enumerate(getOperations(profile)):
+        fetch += 1
+        if mtcl:
+            if fetch <= done:
+                fetch = done + 1
+            vectorLength = mtcl
+        ready = fetch
+        for producer in producers:
+            if written[producer] > ready:
+                ready = written[producer]
+
+        if kind == KIND_SCALAR:
+            complete = ready
+        elif kind == KIND_DATA:
+            if len(dataStarts) == dataStarts.maxlen and dataStarts[0] > ready:  # Room once the oldest one started
+                ready = dataStarts[0]
+            start = ready + 1
+            if dataFree > start:
+                start = dataFree
+            complete = start + dataCycles[data]
+            dataFree = complete + 1
+            dataStarts.append(start)
+        else:
+            if len(computeStarts) == computeStarts.maxlen and computeStarts[0] > ready:
+                ready = computeStarts[0]
+            start = ready + 1
+            if free[pipeline] > start:
+                start = free[pipeline]
+            if lastComputeStart >= start:  # The compute queue dispatches in order
+                start = lastComputeStart + 1
+            cycles = computeCycles.get((pipeline, vectorLength))
+            if cycles is None:
+                cycles = computeCycles[(pipeline, vectorLength)] = math.ceil(depths[pipeline] +
+                                                                             vectorLength / lanes - 1)
+            complete = start + cycles
+            free[pipeline] = complete + 1
+            lastComputeStart = start
+            computeStarts.append(start)
+
+        written[index] = complete + 1
+        if complete > done:
+            done = complete
+        if ready > last:
+            last = ready
+    return max(done, last) + 1
+
+
+def getCalibration(iodir, tasks, results, profile):
+    # Estimates of the tasks of one trace next to their detailed results, and the error and speedup lines
+    lines = ["==============CALIBRATION==============",
+             "Config Detailed Approximate Error DetailedSeconds ApproximateSeconds"]
+    # The profile is built once per trace and shared by every config, its time is reported on its own
+    startTime = time.perf_counter()
+    getOperations(profile)
+    for _, config, _ in tasks:
+        profile.getBankPeaks(config.numberOfBanks, config.vectorLoadStorePipelineDepth)
+    profileTime = time.perf_counter() - startTime
+    errors = []
+    detailedTime = 0.0
+    approximateTime = 0.0
+    for (_, config, _), result in zip(tasks, results):
+        startTime = time.perf_counter()
+        estimate = approximate(profile, config)
+        seconds = time.perf_counter() - startTime
+        cycles = result["clk"] - 1
+        errors.append((estimate - cycles) / cycles)
+        detailedTime += result["seconds"]
+        approximateTime += seconds
+        lines.append(config.getName() + " " + str(cycles) + " " + str(estimate) + " " +
+                     "{:+.2f}%".format(100 * errors[-1]) + " " + "{:.3f}".format(result["seconds"]) + " " +
+                     "{:.4f}".format(seconds))
+    lines.append("Mean Absolute Error: " + "{:.2f}%".format(100 * sum(abs(error) for error in errors) / len(errors)))
+    lines.append("Max Absolute Error: " + "{:.2f}%".format(100 * max(abs(error) for error in errors)))
+    lines.append("Mean Error (bias): " + "{:+.2f}%".format(100 * sum(errors) / len(errors)))
+    lines.append("Speedup: " + "{:.0f}x".format(detailedTime / max(approximateTime, 1e-9)) + ", " +
+                 "{:.0f}x".format(detailedTime / (approximateTime + profileTime)) + " with the trace profile (" +
+                 "{:.3f}".format(profileTime) + "s)")
+    lines.append("======================================")
+    return lines, errors
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Approximate one pass timing model')
+    parser.add_argument('--iodir', default=["IODir0", "IODir1", "IODir2"], type=str, nargs='+',
+                        help='Path to the folders containing the resolved data and the ConfigN.txt files')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Also run the detailed simulator on every config and write the error of the estimates '
+                             'and the speedup to Calibration.txt')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of detailed simulations run in parallel when calibrating')
+    args = parser.parse_args()
+    args.iodir = [os.path.abspath(iodir) for iodir in args.iodir]
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    allErrors = []
+    for iodir in args.iodir:
+        tasks = [(iodir, Config(iodir, fileName), None) for fileName in readFiles(iodir)]
+        loadTraces([iodir], bankCounts=getBankCounts(tasks))
+        profile = getProfile(iodir)
+        if profile is None:
+            raise SystemExit("Approximate - ERROR: The trace couldn't be preprocessed in path: " + iodir)
+        if args.calibrate:  # Always simulated, the speedup needs the time of the detailed runs
+            lines, errors = getCalibration(iodir, tasks, runTasks(tasks, args.jobs), profile)
+            allErrors += errors
+            fileName = "Calibration.txt"
+        else:
+            lines = ["==============APPROXIMATE=============="] + \
+                    [config.getName() + " " + str(approximate(profile, config)) for _, config, _ in tasks] + \
+                    ["======================================"]
+            fileName = "Approximate.txt"
+        for line in lines:
+            print(line)
+        dumpOutput(iodir, lines, fileName)
+    if allErrors:
+        print("Approximate - Mean absolute error over", len(allErrors), "configs:",
+              "{:.2f}%".format(100 * sum(abs(error) for error in allErrors) / len(allErrors)))
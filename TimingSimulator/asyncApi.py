@@ -0,0 +1,218 @@
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+
+from cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from service import checkJob, Worker
+
+# Usage, from a notebook or any other event loop:
+#     simulator = Simulator(concurrency=4)
+#     handles = [simulator.submit({"type": "timing", "iodir": "IODir1", "config": name}, priority=1)
+#                for name in ["Config1.txt", "Config2.txt"]]
+#     async for event in handles[0].events():
+#         print(event["cycles"], event["eta"])
+#     results = await asyncio.gather(*handles)
+# Jobs are the JSON jobs of service.py as dicts.
+
+worker = None  # Worker of a pool process, with its trace, program and memory caches
+events = None  # Queue of the progress events of all pool processes
+cancelled = None  # Cancellation flag of the job running in every slot
+
+
+class SimulationError(Exception):
+    pass
+
+
+def initProcess(settings, eventQueue, flags):
+    global worker, events, cancelled
+    worker = Worker(settings)
+    events = eventQueue
+    cancelled = flags
+
+
+def runJob(jobId, slot, job, interval):
+    def listener(heartbeat):
+        events.put((jobId, heartbeat))
+        if cancelled[slot]:  # Unwinds the simulation, the worker reports the job as failed
+            raise SimulationError("Cancelled")
+
+    return worker.run(job, listener, interval)
+
+
+class JobHandle(object):
+    # Job submitted to a Simulator. `await handle` gives the result dict of the job, raises SimulationError when it
+    # failed and asyncio.CancelledError when it was cancelled. events() iterates over the progress events: "running"
+    # once it is started, a heartbeat every `interval` seconds while it simulates (the cycles, completed instructions,
+    # speed, trace fraction and ETA of timing runs, the executed instructions of functional ones), and a last one
+    # with the final status. An iterator starts with the latest event published before it was attached.
+    def __init__(self, simulator, jobId, job, priority, loop):
+        self.simulator = simulator
+        self.id = jobId
+        self.job = job
+        self.priority = priority
+        self.status = "pending"
+        self.slot = None
+        self.future = loop.create_future()
+        self.listeners = []  # asyncio.Queue of every events() iterator
+        self.last = None
+
+    def __await__(self):
+        # Shielded, cancelling a task that awaits the job does not cancel the job
+        return asyncio.shield(self.future).__await__()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        return self.future.result()
+
+    def cancel(self):
+        return self.simulator.cancel(self)
+
+    def publish(self, event):
+        self.last = dict(event, job=self.id, status=self.status)
+        for queue in self.listeners:
+            queue.put_nowait(self.last)
+
+    async def events(self):
+        if self.done():
+            yield self.last
+            return
+        queue = asyncio.Queue()
+        if self.last is not None:  # Published before the iterator was attached, e.g. "running" from submit
+            queue.put_nowait(self.last)
+        self.listeners.append(queue)
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if event["status"] not in ["pending", "running"]:
+                    return
+        finally:
+            self.listeners.remove(queue)
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        if status == "cancelled":
+            self.future.cancel()
+        elif error is not None:
+            self.future.set_exception(SimulationError(error))
+        else:
+            self.future.set_result(result)
+        self.publish({} if error is None else {"error": error})
+
+
+class Simulator(object):
+    # asyncio front end of the service workers (service.py): jobs wait in a priority queue, the highest priority
+    # first and in submission order within a priority, and at most `concurrency` of them run at a time, each in a
+    # process of the pool. The processes keep their caches between jobs. Progress events come back over one queue
+    # read by a thread, which hands them to the event loop, so nothing in the loop blocks on a simulation.
+    # Cancelling a pending job drops it, a running one stops at its next progress event.
+    def __init__(self, concurrency=None, interval=1.0, traces=8, programs=8, memories=2, cache=True,
+                 cachedir=DEFAULT_CACHE_DIR, cacheSize=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.concurrency = concurrency or os.cpu_count()
+        self.interval = interval
+        settings = {"traces": traces, "programs": programs, "memories": memories, "cache": cache,
+                    "cachedir": cachedir, "cacheSize": cacheSize}
+        self.events = multiprocessing.Queue()
+        self.flags = multiprocessing.RawArray('b', self.concurrency)
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.concurrency, initializer=initProcess,
+                                                               initargs=(settings, self.events, self.flags))
+        self.queue = []  # (-priority, sequence, handle)
+        self.slots = list(range(self.concurrency))  # Free ones
+        self.handles = {}  # id: handle of the pending and running jobs
+        self.counter = itertools.count(1)
+        self.loop = None
+        self.reader = None
+
+    def submit(self, job, priority=0):
+        # Called from the event loop, the job starts as soon as a slot is free
+        error = checkJob(job)
+        if error is not None:
+            raise ValueError(error)
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.reader = threading.Thread(target=self.readEvents, daemon=True)
+            self.reader.start()
+        job = dict(job, iodir=os.path.abspath(job["iodir"]))
+        if job.get("configdir") is not None:
+            job["configdir"] = os.path.abspath(job["configdir"])
+        sequence = next(self.counter)
+        handle = JobHandle(self, str(sequence), job, priority, self.loop)
+        self.handles[handle.id] = handle
+        heapq.heappush(self.queue, (-priority, sequence, handle))
+        self.dispatch()
+        return handle
+
+    def map(self, jobs, priority=0):
+        return [self.submit(job, priority) for job in jobs]
+
+    def dispatch(self):
+        while self.slots and self.queue:
+            _, _, handle = heapq.heappop(self.queue)
+            if handle.status != "pending":  # Cancelled while waiting
+                continue
+            handle.slot = self.slots.pop()
+            self.flags[handle.slot] = 0
+            handle.status = "running"
+            handle.publish({})
+            future = self.loop.run_in_executor(self.executor, runJob, handle.id, handle.slot, handle.job,
+                                               self.interval)
+            future.add_done_callback(lambda future, handle=handle: self.complete(handle, future))
+
+    def complete(self, handle, future):
+        self.slots.append(handle.slot)
+        del self.handles[handle.id]
+        if handle.status == "cancelling" and (future.exception() is not None or "error" in future.result()):
+            handle.finish("cancelled")
+        elif future.exception() is not None:  # The pool itself failed, e.g. a process was killed
+            handle.finish("failed", error=type(future.exception()).__name__ + ": " + str(future.exception()))
+        elif "error" in future.result():
+            handle.finish("failed", error=future.result()["error"])
+        else:
+            handle.finish("done", future.result())
+        self.dispatch()
+
+    def cancel(self, handle):
+        if handle.status == "pending":
+            del self.handles[handle.id]
+            handle.finish("cancelled")
+            return True
+        if handle.status == "running":
+            handle.status = "cancelling"
+            self.flags[handle.slot] = 1
+            return True
+        return False
+
+    def readEvents(self):
+        while True:
+            item = self.events.get()
+            if item is None:
+                return
+            self.loop.call_soon_threadsafe(self.deliver, *item)
+
+    def deliver(self, jobId, heartbeat):
+        handle = self.handles.get(jobId)
+        if handle is not None and handle.status == "running":
+            handle.publish(heartbeat)
+
+    def getStatus(self):
+        return {"pending": sum(1 for handle in self.handles.values() if handle.status == "pending"),
+                "running": self.concurrency - len(self.slots), "concurrency": self.concurrency}
+
+    async def close(self):
+        # Cancels the jobs left, the pool is shut down off the loop as it waits for the running ones to stop
+        for handle in list(self.handles.values()):
+            self.cancel(handle)
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.events.put(None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
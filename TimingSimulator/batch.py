@@ -0,0 +1,315 @@
+import copy
+import time
+
+from computeEngine import ComputeEngine
+from decode import Decode
+from fetch import Fetch
+from status import Status
+
+# Parameters steering the decisions of fetch and decode: configs agreeing on them can share a single front end. The
+# latencies (pipeline depths, load store depth and bank busy time) only change when an engine finishes.
+STRUCTURAL_PARAMETERS = ["numLanes", "vdmNumBanks", "dataQueueDepth", "computeQueueDepth"]
+
+
+def getBatchKey(config):
+    parameters = config.getParameters()
+    return tuple(parameters[name] for name in STRUCTURAL_PARAMETERS)
+
+
+def isReady(instr, scalarBusyBoard, vectorBusyBoard):
+    # Decode.checkBusyBoard against the busy boards of one member
+    for register in instr.get(Decode.INSTR_SSRC) or []:
+        if scalarBusyBoard[register]:
+            return False
+    for register in instr.get(Decode.INSTR_VSRC) or []:
+        if vectorBusyBoard[register]:
+            return False
+    sdest = instr.get(Decode.INSTR_SDEST)
+    if sdest is not None and scalarBusyBoard[sdest]:
+        return False
+    vdest = instr.get(Decode.INSTR_VDEST)
+    if vdest is not None and vectorBusyBoard[vdest]:
+        return False
+    return True
+
+
+class MemberBoard(object):
+    # Busy board of the shared decode of a group. Decode only runs once every member agrees on its decisions, so reads
+    # see the first member; writes (issuing, retiring a scalar instruction) go to every member.
+    def __init__(self, boards):
+        self.boards = boards
+
+    def __getitem__(self, register):
+        return self.boards[0][register]
+
+    def __setitem__(self, register, value):
+        for board in self.boards:
+            board[register] = value
+
+
+class BatchGroup(object):
+    # Configs of a batch that made the same fetch and decode decisions so far. Fetch and decode are shared, everything
+    # the latencies change is kept per member in lists indexed like `members`: the engine statuses and countdowns, the
+    # load store pipeline, the bank busy board, the addresses left of the current data instruction and the register
+    # busy boards, as members free registers at different cycles. Acts as the compute and data engine of its decode.
+    # While the statuses and busy boards of all members are equal their decisions are too; otherwise the decisions of
+    # the coming cycle are worked out for every member, and the group only splits when they differ.
+    def __init__(self, configs, members, instrMem, records, startAddr=0):
+        first = configs[members[0]]
+        self.numberOfLanes = first.numberOfLanes
+        self.numberOfBanks = first.numberOfBanks
+        self.members = list(members)
+        self.addDepth = [configs[member].addPipelineDepth for member in members]
+        self.mulDepth = [configs[member].mulPipelineDepth for member in members]
+        self.divDepth = [configs[member].divPipelineDepth for member in members]
+        self.bankBusyTime = [configs[member].bankBusyTime for member in members]
+        self.addCycle = [0] * len(members)
+        self.mulCycle = [0] * len(members)
+        self.divCycle = [0] * len(members)
+        self.addStatus = [Status.FREE] * len(members)
+        self.mulStatus = [Status.FREE] * len(members)
+        self.divStatus = [Status.FREE] * len(members)
+        self.dataStatus = [Status.FREE] * len(members)
+        self.bankBusyBoard = [[0] * self.numberOfBanks for _ in members]
+        self.pipeline = [[None] * configs[member].vectorLoadStorePipelineDepth for member in members]
+        self.addresses = [[] for _ in members]
+        self.scalarBusyBoards = [[0] * 8 for _ in members]
+        self.vectorBusyBoards = [[0] * 8 for _ in members]
+        self.currentAddInstr = None
+        self.currentMulInstr = None
+        self.currentDivInstr = None
+        self.dataInstr = None
+        self.decode = Decode(first.computeQueueDepth, first.dataQueueDepth, 8, 8, self, self)
+        self.decode.scalarBusyBoard = MemberBoard(self.scalarBusyBoards)
+        self.decode.vectorBusyBoard = MemberBoard(self.vectorBusyBoards)
+        self.fetch = Fetch(instrMem, self.decode, startAddr, records)
+        self.clk = 1
+
+    # region Engine view for decode, valid for every member once they agree on the decisions
+    def getAddPipelineStatus(self):
+        return self.addStatus[0]
+
+    def getMulPipelineStatus(self):
+        return self.mulStatus[0]
+
+    def getDivPipelineStatus(self):
+        return self.divStatus[0]
+
+    def isDone(self):
+        return self.addStatus[0] == Status.FREE and self.mulStatus[0] == Status.FREE and \
+            self.divStatus[0] == Status.FREE
+
+    def getStatus(self):
+        return self.dataStatus[0]
+    # endregion
+
+    def run(self, clks):
+        # Simulates until every member finished, setting its entry of clks (returns no groups), or the members
+        # disagree on a decision of the coming cycle, in which case it returns one group per outcome, all starting
+        # that cycle.
+        while True:
+            if self.fetch.getStatus() == Status.COMPLETED:
+                done = [self.isClear(member) for member in range(len(self.members))]
+                if any(done):
+                    for member, finished in zip(self.members, done):
+                        if finished:
+                            clks[member] = self.clk
+                    if all(done):
+                        return []
+                    self.select([index for index, finished in enumerate(done) if not finished])
+            if len(self.members) > 1 and not self.isUniform():
+                groups = self.split(self.getDecisions())
+                if groups:
+                    return groups
+            status1, instr = self.fetch.run()
+            status2, computeInstr, dataInstr, scalarInstr = self.decode.run(instr, self.fetch.record)
+            self.runEngines(computeInstr, dataInstr, self.fetch.getCurrentVectorLength())
+            self.clk += 1
+
+    def isUniform(self):
+        for values in [self.addStatus, self.mulStatus, self.divStatus, self.dataStatus, self.scalarBusyBoards,
+                       self.vectorBusyBoards]:
+            first = values[0]
+            for value in values:
+                if value != first:
+                    return False
+        return True
+
+    def isClear(self, member):
+        # Decode.isClear for one member
+        return not self.decode.computeQueue and not self.decode.dataQueue and \
+            self.dataStatus[member] == Status.FREE and self.addStatus[member] == Status.FREE and \
+            self.mulStatus[member] == Status.FREE and self.divStatus[member] == Status.FREE
+
+    def getDecisions(self):
+        # What fetch and decode would do in the coming cycle for every member: whether fetch may take an MTCL, whether
+        # decode pops the compute and data queues, and which instruction of the window it issues (see Decode.run).
+        decode = self.decode
+        if decode.scalarQueue:  # Decode frees it first in every member, doing it now changes nothing
+            decode.freeBusyBoard(decode.scalarQueue[0])
+        fetched = None
+        if self.fetch.getStatus() != Status.COMPLETED:
+            try:
+                line = self.fetch.instrMem[self.fetch.addr]
+                record = self.fetch.records[self.fetch.addr] if self.fetch.records is not None else None
+                fetched = record if record is not None else Decode.decodeInstruction(line)
+            except IndexError:
+                pass
+        mtcl = fetched is not None and fetched[Decode.INSTR_NAME] == 'MTCL'
+        decisions = []
+        for member in range(len(self.members)):
+            clear = self.isClear(member) if mtcl else None
+            decisions.append((clear,) + self.getDecodeDecision(member, fetched if clear is not False else None))
+        return decisions
+
+    def getDecodeDecision(self, member, fetched):
+        decode = self.decode
+        head = decode.computeQueue[0].get(Decode.INSTR_NAME) if decode.computeQueue else None
+        popCompute = head is not None and (
+            (head in ComputeEngine.addPipelineInstr and self.addStatus[member] == Status.FREE) or
+            (head in ComputeEngine.mulPipelineInstr and self.mulStatus[member] == Status.FREE) or
+            (head in ComputeEngine.divPipelineInstr and self.divStatus[member] == Status.FREE))
+        popData = self.dataStatus[member] == Status.FREE
+        computeFree = popCompute or decode.getComputeStatus() == Status.FREE
+        dataFree = popData or decode.getDataStatus() == Status.FREE
+        window = decode.priorityQueue if fetched is None else decode.priorityQueue + [fetched]
+        scalarBusyBoard = self.scalarBusyBoards[member]
+        vectorBusyBoard = self.vectorBusyBoards[member]
+        for index, instr in enumerate(window):
+            kind = instr.get(Decode.INSTR_TYPE)
+            if (kind == Decode.INSTR_COMPUTE and computeFree) or (kind == Decode.INSTR_DATA and dataFree) or \
+                    kind == Decode.INSTR_SCALAR:
+                if isReady(instr, scalarBusyBoard, vectorBusyBoard):
+                    return popCompute, popData, index
+        return popCompute, popData, None
+
+    def freeBusyBoard(self, member, instr):
+        if instr is not None:
+            sdest = instr.get(Decode.INSTR_SDEST)
+            if sdest is not None:
+                self.scalarBusyBoards[member][sdest] = 0
+            vdest = instr.get(Decode.INSTR_VDEST)
+            if vdest is not None:
+                self.vectorBusyBoards[member][vdest] = 0
+
+    def runEngines(self, computeInstr, dataInstr, currentVectorLength):
+        # ComputeEngine.run and DataEngine.run for every member. The instructions popped by decode are the same for
+        # all of them and their engines were free, as the members agreed on the pops.
+        name = computeInstr.get(Decode.INSTR_NAME) if computeInstr is not None else None
+        lanes = currentVectorLength / self.numberOfLanes
+        if computeInstr is not None:
+            if name in ComputeEngine.addPipelineInstr and self.addStatus[0] == Status.FREE:
+                self.currentAddInstr = computeInstr
+            elif name in ComputeEngine.mulPipelineInstr and self.mulStatus[0] == Status.FREE:
+                self.currentMulInstr = computeInstr
+            else:
+                self.currentDivInstr = computeInstr
+        if dataInstr is not None and self.dataStatus[0] == Status.FREE:
+            self.dataInstr = dataInstr
+        numberOfBanks = self.numberOfBanks
+        for member in range(len(self.members)):
+            addCycle = max(0, self.addCycle[member] - 1)
+            mulCycle = max(0, self.mulCycle[member] - 1)
+            divCycle = max(0, self.divCycle[member] - 1)
+            if computeInstr is not None:
+                if name in ComputeEngine.addPipelineInstr and self.addStatus[member] == Status.FREE:
+                    self.addStatus[member] = Status.BUSY
+                    addCycle = self.addDepth[member] + lanes - 1
+                elif name in ComputeEngine.mulPipelineInstr and self.mulStatus[member] == Status.FREE:
+                    self.mulStatus[member] = Status.BUSY
+                    mulCycle = self.mulDepth[member] + lanes - 1
+                else:
+                    self.divStatus[member] = Status.BUSY
+                    divCycle = self.divDepth[member] + lanes - 1
+            if addCycle == 0 and self.addStatus[member] == Status.BUSY:
+                self.freeBusyBoard(member, self.currentAddInstr)
+                self.addStatus[member] = Status.FREE
+            if mulCycle == 0 and self.mulStatus[member] == Status.BUSY:
+                self.freeBusyBoard(member, self.currentMulInstr)
+                self.mulStatus[member] = Status.FREE
+            if divCycle == 0 and self.divStatus[member] == Status.BUSY:
+                self.freeBusyBoard(member, self.currentDivInstr)
+                self.divStatus[member] = Status.FREE
+            self.addCycle[member] = addCycle
+            self.mulCycle[member] = mulCycle
+            self.divCycle[member] = divCycle
+
+            bankBusyBoard = self.bankBusyBoard[member]
+            if any(bankBusyBoard):
+                bankBusyBoard[:] = [cycles - 1 if cycles else 0 for cycles in bankBusyBoard]
+            if dataInstr is not None and self.dataStatus[member] == Status.FREE:
+                self.dataStatus[member] = Status.BUSY
+                self.addresses[member] = list(dataInstr.get(Decode.INSTR_ADDRESS))
+            addresses = self.addresses[member]
+            if self.dataStatus[member] == Status.BUSY and addresses:
+                pipeline = self.pipeline[member]
+                address = pipeline[-1]
+                if address is not None:
+                    bankNo = address % numberOfBanks
+                    if bankBusyBoard[bankNo] == 0:
+                        bankBusyBoard[bankNo] = self.bankBusyTime[member]
+                        pipeline.pop()
+                        pipeline.insert(0, addresses.pop())
+                else:
+                    pipeline.pop()
+                    pipeline.insert(0, addresses.pop())
+            if not addresses and not any(bankBusyBoard):  # Like DataEngine, this also happens on every idle cycle
+                self.freeBusyBoard(member, self.dataInstr)
+                self.dataStatus[member] = Status.FREE
+
+    def split(self, outcomes):
+        # None while every member agrees, else one group per outcome, the first one being this group
+        if all(outcome == outcomes[0] for outcome in outcomes):
+            return None
+        partitions = {}
+        for index, outcome in enumerate(outcomes):
+            partitions.setdefault(outcome, []).append(index)
+        # The trace and its preprocessed records are shared by every group, not copied
+        memo = {id(self.fetch.instrMem): self.fetch.instrMem}
+        if self.fetch.records is not None:
+            memo[id(self.fetch.records)] = self.fetch.records
+        groups = [self] + [copy.deepcopy(self, dict(memo)) for _ in range(len(partitions) - 1)]
+        for group, indices in zip(groups, partitions.values()):
+            group.select(indices)
+        return groups
+
+    def select(self, indices):
+        for name in ["members", "addDepth", "mulDepth", "divDepth", "bankBusyTime", "addCycle", "mulCycle",
+                     "divCycle", "addStatus", "mulStatus", "divStatus", "dataStatus", "bankBusyBoard", "pipeline",
+                     "addresses", "scalarBusyBoards", "vectorBusyBoards"]:
+            values = getattr(self, name)
+            setattr(self, name, [values[index] for index in indices])
+        self.decode.scalarBusyBoard.boards = self.scalarBusyBoards
+        self.decode.vectorBusyBoard.boards = self.vectorBusyBoards
+
+
+class BatchCore(object):
+    # Simulates configs that share their structural parameters (see getBatchKey) in lockstep over one trace, fetching
+    # and decoding once for all of them. Members are split into separate groups as soon as their latencies make
+    # them take different fetch or decode decisions, down to one config per group, so every result is the exact
+    # cycle count.
+    def __init__(self, configs, imem, startAddr=0):
+        if len(set(getBatchKey(config) for config in configs)) > 1:
+            raise ValueError("BatchCore - ERROR: Configs differ in " + ", ".join(STRUCTURAL_PARAMETERS))
+        self.configs = list(configs)
+        self.imem = imem
+        self.startAddr = startAddr
+        self.clks = [None] * len(self.configs)
+        self.splits = 0
+        self.startTime = None
+        self.endTime = None
+
+    def run(self):
+        print("Batched Timing Simulation Started -", len(self.configs), "configs")
+        self.startTime = time.time()
+        pending = [BatchGroup(self.configs, range(len(self.configs)), self.imem.getInstructions(),
+                              self.imem.getRecords(self.configs[0].numberOfBanks), self.startAddr)]
+        while pending:  # Depth first, so at most one group per split is waiting
+            group = pending.pop()
+            groups = group.run(self.clks)
+            if groups:
+                self.splits += len(groups) - 1
+                pending += groups
+        self.endTime = time.time()
+        print("Batched Timing Simulation Successful -", self.splits, "splits")
+        return self.clks
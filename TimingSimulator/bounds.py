@@ -0,0 +1,123 @@
+import argparse
+import math
+import os
+import time
+from collections import Counter
+
+# main first, decode and computeEngine import each other and only load in that order
+from main import Config, dumpOutput, getBankCounts, loadTraces, readFiles, sharedTraces
+from decode import Decode
+from preprocess import PIPELINE_DATA, PIPELINE_SCALAR
+
+COMPUTE_PIPELINES = ["add", "mul", "div"]
+ISSUE = "issue"
+SERIAL_OVERHEAD = 4  # Fetch, issue, queue pop and the cycle freeing the busy board, per serialized instruction
+
+
+class TraceProfile(object):
+    # Config independent totals of a preprocessed trace: the vector lengths in effect for every compute pipeline, the
+    # address count of every data instruction and, per bank count and load store depth, the largest number of
+    # addresses of a data instruction that go to the same bank. Bounds of a config are then a few sums over them.
+    def __init__(self, trace):
+        self.trace = trace
+        self.instructions = len(trace.decoded)
+        self.scalars = 0
+        self.vectorLengths = {name: Counter() for name in COMPUTE_PIPELINES}  # pipeline: vector length: count
+        self.dataIndices = []
+        self.dataSizes = []
+        self.bankPeaks = {}  # (number of banks, load store depth): peak bank count of every data instruction
+        vectorLength = 64  # Same default as Fetch
+        for index, (instr, pipeline) in enumerate(zip(trace.decoded, trace.pipelines)):
+            if pipeline == PIPELINE_DATA:
+                self.dataIndices.append(index)
+                self.dataSizes.append(len(instr[Decode.INSTR_ADDRESS]))
+            elif pipeline == PIPELINE_SCALAR:
+                self.scalars += 1
+                if instr[Decode.INSTR_NAME] == 'MTCL':
+                    vectorLength = int(instr[Decode.INSTR_ARGS][-1])
+            else:
+                self.vectorLengths[pipeline][vectorLength] += 1
+
+    def getBankPeaks(self, numberOfBanks, depth):
+        # The data engine pops addresses from the end of the list and the last `depth` of them never leave the load
+        # store pipeline before the instruction completes, so the addresses reaching the banks are the ones past depth.
+        key = (numberOfBanks, depth)
+        if key not in self.bankPeaks:
+            self.trace.addBankCount(numberOfBanks)
+            residues = self.trace.residues[numberOfBanks]
+            self.bankPeaks[key] = [max(Counter(residues[index][depth:]).values()) if size > depth else 0
+                                   for index, size in zip(self.dataIndices, self.dataSizes)]
+        return self.bankPeaks[key]
+
+
+def getComputeCycles(depth, numberOfLanes, vectorLength):
+    # Cycles between two dispatches into a pipeline: the countdown of ComputeEngine, the cycle freeing it and the
+    # cycle decode pops the next instruction.
+    return math.ceil(depth + vectorLength / numberOfLanes)
+
+
+def getBounds(profile, config):
+    # Lower bound: the busiest of the single issue slot, each compute pipeline and the data engine, every one of them
+    # kept busy back to back (roofline). Upper bound: every instruction serialized, each data address waiting for its
+    # bank. Both are in clock cycles as reported by the timing simulator.
+    depths = {"add": config.addPipelineDepth, "mul": config.mulPipelineDepth, "div": config.divPipelineDepth}
+    lanes = config.numberOfLanes
+    busy = {ISSUE: profile.instructions}
+    serial = profile.scalars * SERIAL_OVERHEAD
+    for name in COMPUTE_PIPELINES:
+        cycles = sum(count * getComputeCycles(depths[name], lanes, vectorLength)
+                     for vectorLength, count in profile.vectorLengths[name].items())
+        busy[name] = cycles
+        serial += cycles + sum(profile.vectorLengths[name].values()) * SERIAL_OVERHEAD
+
+    depth = config.vectorLoadStorePipelineDepth
+    bankBusyTime = config.bankBusyTime
+    dataCycles = 0
+    for size, peak in zip(profile.dataSizes, profile.getBankPeaks(config.numberOfBanks, depth)):
+        if size > depth:
+            dataCycles += max(size - 1, depth + (peak - 1) * bankBusyTime) + bankBusyTime + 1
+        else:
+            dataCycles += size
+        serial += depth + size * max(1, bankBusyTime) + bankBusyTime + SERIAL_OVERHEAD
+    busy[PIPELINE_DATA] = dataCycles
+
+    bottleneck = max(busy, key=busy.get)
+    return {"lower": busy[bottleneck], "upper": serial, "bottleneck": bottleneck, "busy": busy}
+
+
+def getProfile(iodir):
+    # Profiles need the preprocessed trace, streamed traces and trace stores are not preprocessed
+    trace = sharedTraces[iodir].preprocessed
+    return TraceProfile(trace) if trace is not None else None
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Analytic cycle bounds of configurations from the trace alone')
+    parser.add_argument('--iodir', default=["IODir1"], type=str, nargs='+',
+                        help='Path to the folders containing the resolved data and the ConfigN.txt files')
+    args = parser.parse_args()
+    args.iodir = [os.path.abspath(iodir) for iodir in args.iodir]
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    for iodir in args.iodir:
+        tasks = [(iodir, Config(iodir, fileName), None) for fileName in readFiles(iodir)]
+        loadTraces([iodir], bankCounts=getBankCounts(tasks))
+        profile = getProfile(iodir)
+        if profile is None:
+            raise SystemExit("Bounds - ERROR: The trace couldn't be preprocessed in path: " + iodir)
+        startTime = time.perf_counter()
+        lines = ["================BOUNDS================"]
+        for _, config, _ in tasks:
+            bounds = getBounds(profile, config)
+            lines.append(config.getName() + " " + str(bounds["lower"]) + " - " + str(bounds["upper"]) + " (" +
+                         bounds["bottleneck"] + " bound)")
+        lines.append("======================================")
+        elapsed = time.perf_counter() - startTime
+        for line in lines:
+            print(line)
+        print("Bounds -", len(tasks), "configs bounded in", "{:.1f}".format(1000 * elapsed), "ms")
+        dumpOutput(iodir, lines, "Bounds.txt")
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".simcache")
+DEFAULT_CACHE_SIZE = 256  # MB
+EVICT_INTERVAL = 256  # Puts between two scans of the cache, which bound what other processes added meanwhile
+EVICT_TARGET = 0.9  # Fraction of the size limit an eviction goes down to, so the next one is many puts away
+
+
+class ResultCache(object):
+    # On-disk cache of timing results keyed by the trace, the full parameter set and the model version. Entries are
+    # one JSON file each; reading an entry refreshes its modification time, which is the recency used for LRU eviction.
+    # The size of the cache is only scanned on the first put, then kept up to date with the entries written; the
+    # cache is scanned again when that estimate exceeds the limit or every EVICT_INTERVAL puts, as other processes
+    # share it.
+    def __init__(self, directory=DEFAULT_CACHE_DIR, maxBytes=DEFAULT_CACHE_SIZE * 1024 * 1024):
+        self.directory = os.path.abspath(directory)
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.size = None  # Estimated size of the cache in bytes, None until the first scan
+        self.puts = 0  # Since the last scan
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def getKey(traceHash, parameters, modelVersion):
+        content = json.dumps({"trace": traceHash, "parameters": parameters, "model": modelVersion}, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def getPath(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        filepath = self.getPath(key)
+        try:
+            with open(filepath, 'r') as entry:
+                result = json.load(entry)
+            os.utime(filepath)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        filepath = self.getPath(key)
+        tmpPath = filepath + "." + str(os.getpid()) + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(tmpPath, 'w') as entry:
+                json.dump(result, entry)
+                written = entry.tell()
+            os.replace(tmpPath, filepath)  # Readers never see a partially written entry
+        except OSError:
+            print("ResultCache - ERROR: Couldn't write cache entry in path:", filepath)
+            return
+        self.puts += 1
+        if self.size is not None:
+            self.size += written
+        if self.size is None or self.size > self.maxBytes or self.puts >= EVICT_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for fileName in files:
+                if not fileName.endswith(".json"):
+                    continue
+                filepath = os.path.join(root, fileName)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:  # Removed by a concurrent sweep
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filepath))
+                total += stat.st_size
+        entries.sort()
+        if total > self.maxBytes:
+            for _, size, filepath in entries:
+                if total <= self.maxBytes * EVICT_TARGET:
+                    break
+                try:
+                    os.remove(filepath)
+                except OSError:
+                    pass
+                total -= size
+        self.size = total
+        self.puts = 0
+
+    def printReport(self):
+        print("ResultCache - hits:", self.hits, "misses:", self.misses, "in path:", self.directory)
+
+
+def addCacheArguments(parser):
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='Always simulate, without reading or writing the result cache')
+    parser.add_argument('--cachedir', default=DEFAULT_CACHE_DIR, type=str,
+                        help='Folder of the result cache')
+    parser.add_argument('--cache-size', default=DEFAULT_CACHE_SIZE, type=int,
+                        help='Size limit of the result cache in MB, least recently used results are evicted first')
+
+
+def openCache(args):
+    if not args.cache:
+        return None
+    return ResultCache(args.cachedir, args.cache_size * 1024 * 1024)
@@ -0,0 +1,148 @@
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import signal
+
+# Version of the checkpoint format, bump it whenever the state of Core changes.
+VERSION = 1
+CHUNK_CYCLES = 10000  # Cycles simulated between two checks for a due checkpoint or a SIGTERM
+
+
+def getCheckpointDir(iodir):
+    return os.path.join(iodir, "Checkpoints")
+
+
+def getCheckpointPrefix(config):
+    # Configs of different config sets can share a name, their parameters tell them apart
+    parameters = json.dumps(config.getParameters(), sort_keys=True)
+    return config.getName() + "_" + hashlib.sha1(parameters.encode()).hexdigest()[:8] + "_"
+
+
+def readHeader(filepath):
+    # A checkpoint is a header followed by the state of the core, two pickles, so it can be listed without the state
+    try:
+        with open(filepath, 'rb') as inf:
+            return pickle.load(inf)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError):
+        return None
+
+
+def loadState(filepath):
+    with open(filepath, 'rb') as inf:
+        pickle.load(inf)
+        return pickle.load(inf)
+
+
+def findCheckpoints(iodir, config, key):
+    # Checkpoints of runs of the config whose key (trace hash, timing model version and start instruction) matches,
+    # as (header, path) in the order of their clock cycle
+    checkpoints = []
+    for filepath in glob.glob(os.path.join(getCheckpointDir(iodir), getCheckpointPrefix(config) + "*.ckpt")):
+        header = readHeader(filepath)
+        if header is not None and header["version"] == VERSION and header["key"] == key and \
+                header["parameters"] == config.getParameters():
+            checkpoints.append((header, filepath))
+    return sorted(checkpoints, key=lambda checkpoint: checkpoint[0]["clk"])
+
+
+class Checkpointer(object):
+    # Saves the state of a core (Core.getState) every `interval` cycles, and when the process receives SIGTERM, into
+    # Checkpoints/<config>_<parameters hash>_<clk>.ckpt in the IO directory. The run then stops with the exit
+    # status of SIGTERM. Runs resume from their latest checkpoint with identical cycles, and sampled simulation uses
+    # the checkpoints of a config as exact warm starts (sampling.py --checkpoints). Once a run completes only its
+    # latest checkpoint is kept, which a stopped sweep resumes the run from, unless `keep` is set.
+    def __init__(self, iodir, config, key, interval=None, keep=False):
+        self.iodir = iodir
+        self.config = config
+        self.directory = getCheckpointDir(iodir)
+        self.prefix = getCheckpointPrefix(config)
+        self.parameters = config.getParameters()
+        self.key = key
+        self.interval = interval or None  # Only on SIGTERM without one
+        self.keep = keep
+        self.nextClk = None
+        self.terminated = False
+        self.handler = None
+
+    def attach(self, core):
+        self.nextClk = core.clk + self.interval if self.interval else float("inf")
+        try:
+            self.handler = signal.signal(signal.SIGTERM, self.terminate)
+        except ValueError:  # Signals can only be handled on the main thread
+            self.handler = None
+
+    def detach(self):
+        if self.handler is not None:
+            signal.signal(signal.SIGTERM, self.handler)
+            self.handler = None
+
+    def terminate(self, signum, frame):
+        # The cycle in progress is finished first, the state is only consistent between cycles
+        self.terminated = True
+
+    def check(self, core):
+        if self.terminated or core.clk >= self.nextClk:
+            self.save(core)
+            self.nextClk = core.clk + self.interval if self.interval else float("inf")
+        if self.terminated:
+            print("Checkpoint - Stopped by SIGTERM at clock cycle", core.clk - 1)
+            raise SystemExit(128 + signal.SIGTERM)
+
+    def finish(self):
+        if self.keep:
+            return
+        for _, filepath in findCheckpoints(self.iodir, self.config, self.key)[:-1]:
+            try:
+                os.remove(filepath)
+            except OSError:  # Removed by a concurrent run of the same config
+                pass
+
+    def save(self, core):
+        filepath = os.path.join(self.directory, self.prefix + str(core.clk) + ".ckpt")
+        header = {"version": VERSION, "key": self.key, "parameters": self.parameters, "clk": core.clk,
+                  "addr": core.fetch.addr}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = filepath + ".tmp"
+            with open(temporary, 'wb') as opf:
+                pickle.dump(header, opf, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(core.getState(), opf, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, filepath)
+            print("Checkpoint - Saved clock cycle", core.clk - 1, "in path:", filepath)
+        except OSError:
+            print("Checkpoint - ERROR: Couldn't save checkpoint in path:", filepath)
+
+
+class TerminationForwarder(object):
+    # While a sweep waits on its pool of workers, SIGTERM is passed on to them, so they checkpoint their runs and exit,
+    # and the sweep exits once they have. Workers forked later inherit the handler and just exit.
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self.handler = None
+
+    def __enter__(self):
+        if self.enabled:
+            try:
+                self.handler = signal.signal(signal.SIGTERM, self.terminate)
+            except ValueError:  # Signals can only be handled on the main thread
+                self.handler = None
+        return self
+
+    def __exit__(self, *args):
+        if self.handler is not None:
+            signal.signal(signal.SIGTERM, self.handler)
+            self.handler = None
+
+    def terminate(self, signum, frame):
+        if os.getpid() == self.pid:
+            workers = multiprocessing.active_children()
+            for process in workers:
+                process.terminate()
+            for process in workers:
+                process.join()
+            print("Checkpoint - Stopped by SIGTERM after", len(workers), "workers saved their runs")
+        raise SystemExit(128 + signal.SIGTERM)
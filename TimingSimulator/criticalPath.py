@@ -0,0 +1,211 @@
+import os
+
+from decode import Decode
+from timeline import Timeline, SEQUENCE, ADDRESS, NAME, FETCH, ISSUE, DISPATCH, COMPLETE
+
+# Extra record fields: cycles waited per reason, cause of every event and the blocker seen in the last waiting cycle
+WAITS = 8
+CAUSES = 9
+BLOCKER = 10
+
+STAGES = {ISSUE: "window", DISPATCH: "queue", COMPLETE: "execute"}
+QUEUE_FULL = {Decode.INSTR_COMPUTE: "computeQueueFull", Decode.INSTR_DATA: "dataQueueFull"}
+
+
+class CriticalPath(Timeline):
+    # Records why every instruction waited and, for each of its events, the event of another instruction that
+    # released it: the producer of a register (RAW/WAW), the head of a full queue, the instruction ahead in a queue or
+    # holding the pipeline, or the instruction that took the issue slot. Without a wait the cause is the previous
+    # event of the instruction itself. Following the causes back from the last retired instruction gives the chain of
+    # instructions and reasons that set the total cycle count.
+    def __init__(self):
+        super().__init__()
+        self.scalarProducers = {}  # register: record of the last instruction issued writing it
+        self.vectorProducers = {}
+        self.lastFetched = None
+        self.lastCompleted = None
+
+    def attach(self, core):
+        core.data.addBankConflictHandler(self.recordBankConflict)
+
+    def recordBankConflict(self, bankNo):
+        running = self.running.get("data")
+        if running is not None:
+            waits = running[1][WAITS]
+            waits["bankConflict"] = waits.get("bankConflict", 0) + 1
+
+    def setEvent(self, instr, record, event, clk):
+        super().setEvent(instr, record, event, clk)
+        if event == FETCH:
+            record += [{}, [None] * 4, None]
+            previous = self.lastFetched
+            if previous is not None and previous[FETCH] == clk - 1:
+                record[CAUSES][0] = ("fetch", previous, FETCH)
+            elif self.lastCompleted is not None:  # Fetch held MTCL until the core drained
+                record[CAUSES][0] = ("drain", self.lastCompleted, COMPLETE)
+            self.lastFetched = record
+            return
+        blocker = record[BLOCKER]
+        record[CAUSES][event - FETCH] = blocker if blocker is not None else (STAGES[event], record, event - 1)
+        record[BLOCKER] = None
+        if event == ISSUE:
+            sdest = instr.get(Decode.INSTR_SDEST)
+            if sdest is not None:
+                self.scalarProducers[sdest] = record
+            vdest = instr.get(Decode.INSTR_VDEST)
+            if vdest is not None:
+                self.vectorProducers[vdest] = record
+        elif event == COMPLETE:
+            self.lastCompleted = record
+
+    def cycle(self, core, instr, issued, computeInstr, dataInstr, scalarInstr):
+        super().cycle(core, instr, issued, computeInstr, dataInstr, scalarInstr)
+        clk = core.clk
+        inFlight = self.inFlight
+        decode = core.decode
+        issuedRecord = inFlight.get(id(issued)) if issued is not None else None
+        for waiting in decode.priorityQueue:
+            record = inFlight.get(id(waiting))
+            if record is not None:
+                self.wait(record, self.getWindowBlocker(decode, waiting, issuedRecord, clk))
+
+        for queue, unit in [(decode.computeQueue, None), (decode.dataQueue, "data")]:
+            ahead = None
+            for index, queued in enumerate(queue):
+                record = inFlight.get(id(queued))
+                if record is None:
+                    continue
+                if index > 0:
+                    self.wait(record, ("queueOrder", ahead, DISPATCH))
+                else:
+                    running = self.running.get(unit or self.getComputeUnit(queued))
+                    if running is not None:
+                        self.wait(record, ("pipelineBusy", running[1], COMPLETE))
+                    else:
+                        self.wait(record, ("queue", None, None))
+                ahead = record
+
+    @staticmethod
+    def wait(record, blocker):
+        reason = blocker[0]
+        record[WAITS][reason] = record[WAITS].get(reason, 0) + 1
+        if blocker[1] is not None:  # A wait without a blocker is the fixed latency of the stage
+            record[BLOCKER] = blocker
+
+    def getWindowBlocker(self, decode, instr, issuedRecord, clk):
+        # The busy boards decide, the producer maps only name the writer. A register freed during this cycle still
+        # counts as the hazard, decode checked it before the engines ran.
+        for registers, busyBoard, producers, reason in [
+                (instr.get(Decode.INSTR_SSRC), decode.scalarBusyBoard, self.scalarProducers, "raw"),
+                (instr.get(Decode.INSTR_VSRC), decode.vectorBusyBoard, self.vectorProducers, "raw"),
+                ([instr.get(Decode.INSTR_SDEST)], decode.scalarBusyBoard, self.scalarProducers, "waw"),
+                ([instr.get(Decode.INSTR_VDEST)], decode.vectorBusyBoard, self.vectorProducers, "waw")]:
+            for register in registers or []:
+                if register is None:
+                    continue
+                producer = producers.get(register)
+                if busyBoard[register] or (producer is not None and producer[COMPLETE] == clk):
+                    return reason, producer, COMPLETE
+        kind = instr.get(Decode.INSTR_TYPE)
+        if kind == Decode.INSTR_COMPUTE and len(decode.computeQueue) == decode.computeQueueDepth:
+            return QUEUE_FULL[kind], self.inFlight.get(id(decode.computeQueue[0])), DISPATCH
+        if kind == Decode.INSTR_DATA and len(decode.dataQueue) == decode.dataQueueDepth:
+            return QUEUE_FULL[kind], self.inFlight.get(id(decode.dataQueue[0])), DISPATCH
+        if issuedRecord is not None:  # Decode issues one instruction per cycle
+            return "issue", issuedRecord, ISSUE
+        return "window", None, None
+
+    def getPath(self):
+        # List of (reason, record, cycles) from the last retired instruction back to the first cycle
+        if not self.records:
+            return []
+        record = max(self.records, key=lambda record: (record[COMPLETE], record[SEQUENCE]))
+        event = COMPLETE
+        path = []
+        visited = set()
+        while True:
+            visited.add((id(record), event))
+            cause = record[CAUSES][event - FETCH]
+            if cause is None:
+                break
+            reason, blocker, blockerEvent = cause
+            if blocker[blockerEvent] is None or (id(blocker), blockerEvent) in visited:
+                break
+            cycles = max(0, record[event] - blocker[blockerEvent])
+            if reason == "execute":  # Bank conflicts stretch the execution of a memory instruction
+                conflicts = min(cycles, record[WAITS].get("bankConflict", 0))
+                if conflicts:
+                    path.append(("bankConflict", record, conflicts))
+                cycles -= conflicts
+            if cycles:
+                path.append((reason, record, cycles))
+            record, event = blocker, blockerEvent
+        path.append(("start", record, record[event] - 1))
+        return path
+
+    def getReport(self, codeLines=None, source=None, top=15):
+        path = self.getPath()
+        length = sum(cycles for _, _, cycles in path)
+        byReason = {}
+        byOpcode = {}
+        byLine = {}
+        for reason, record, cycles in path:
+            byReason[reason] = byReason.get(reason, 0) + cycles
+            opcode = byOpcode.setdefault(record[NAME], {})
+            opcode[reason] = opcode.get(reason, 0) + cycles
+            if codeLines is not None and record[ADDRESS] < len(codeLines):
+                line = byLine.setdefault(codeLines[record[ADDRESS]], {})
+                line[reason] = line.get(reason, 0) + cycles
+
+        waits = {}  # Stall attribution over every instruction, on the critical path or not
+        for record in self.records:
+            opcode = waits.setdefault(record[NAME], {})
+            for reason, cycles in record[WAITS].items():
+                opcode[reason] = opcode.get(reason, 0) + cycles
+
+        def formatReasons(reasons):
+            return ", ".join(reason + " " + str(cycles)
+                             for reason, cycles in sorted(reasons.items(), key=lambda item: -item[1]))
+
+        def percent(cycles):
+            return "{:.1f}".format(100 * cycles / max(1, length)) + "%"
+
+        report = ["================CRITICAL PATH================",
+                  "Path Length: " + str(length) + " cycles, " +
+                  str(len(set(id(record) for _, record, _ in path))) + " instructions",
+                  "----------------By Reason----------------"]
+        report += [reason + ": " + str(cycles) + " (" + percent(cycles) + ")"
+                   for reason, cycles in sorted(byReason.items(), key=lambda item: -item[1])]
+        report.append("----------------By Opcode----------------")
+        for name, reasons in sorted(byOpcode.items(), key=lambda item: -sum(item[1].values()))[:top]:
+            total = sum(reasons.values())
+            report.append(name + ": " + str(total) + " (" + percent(total) + ") - " + formatReasons(reasons))
+        if byLine:
+            report.append("----------------By Code.asm Line----------------")
+            for line, reasons in sorted(byLine.items(), key=lambda item: -sum(item[1].values()))[:top]:
+                total = sum(reasons.values())
+                text = " " + source[line - 1].split('#')[0].strip() if source and line <= len(source) else ""
+                report.append("Line " + str(line) + text + ": " + str(total) + " (" + percent(total) + ") - " +
+                              formatReasons(reasons))
+        report.append("----------------Stall Cycles By Opcode (All Instructions)----------------")
+        for name, reasons in sorted(waits.items(), key=lambda item: -sum(item[1].values())):
+            if reasons:
+                report.append(name + ": " + formatReasons(reasons))
+        report.append("======================================")
+        return report
+
+
+def loadCodeLines(iodir, fileName="Lines.txt", sourceName="Code.asm"):
+    # Code.asm line of every trace instruction, written by the functional simulator as resolvedLines.txt. The
+    # program itself is optional and only adds the instruction text to the report.
+    codeLines = None
+    source = None
+    filepath = os.path.abspath(os.path.join(iodir, fileName))
+    if os.path.exists(filepath):
+        with open(filepath, 'r') as linf:
+            codeLines = [int(line) for line in linf if line.strip()]
+    sourcePath = os.path.abspath(os.path.join(iodir, sourceName))
+    if os.path.exists(sourcePath):
+        with open(sourcePath, 'r') as srcf:
+            source = srcf.readlines()
+    return codeLines, source
@@ -14,6 +14,7 @@ class DataEngine:
         self.pipeline = [None] * self.loadStorePipeline
         self.element = None
         self.freeBusyBoard = None
+        self.bankConflictHandlers = []
         self.instr = None
         pass
 
@@ -34,6 +35,9 @@ class DataEngine:
                     self.bankBusyBoard[bankNo] = self.bankBusyTime
                     self.pipeline.pop()
                     self.pipeline.insert(0, self.addresses.pop())
+                else:
+                    for handler in self.bankConflictHandlers:
+                        handler(bankNo)
             else:
                 self.pipeline.pop()
                 self.pipeline.insert(0, self.addresses.pop())
@@ -49,6 +53,9 @@ class DataEngine:
     def setFreeBusyBoard(self, freeBusyBoard):
         self.freeBusyBoard = freeBusyBoard
 
+    def addBankConflictHandler(self, bankConflictHandler):
+        self.bankConflictHandlers.append(bankConflictHandler)
+
     def areBanksFree(self):
         for element in self.bankBusyBoard:
             if element != 0:
@@ -15,6 +15,8 @@ class Decode:
     INSTR_NAME = "Name"
     INSTR_ADDRESS = "Address"
     INSTR_ARGS = "Args"
+    HAZARD_RAW = 1  # A source register is still being written
+    HAZARD_WAW = 2  # The destination register is still being written
 
     INS = dict.fromkeys(['LS', 'SS', 'ADD', 'SUB', 'SRA', 'SRL', 'SLL', 'AND', 'OR',
                          'XOR', 'BEQ', 'BNE', 'BGT', 'BLT', 'BGE', 'BLE', 'MFCL', 'MTCL', 'CVM', 'POP', 'HALT'],
@@ -33,7 +35,6 @@ class Decode:
         self.computeQueue = []
         self.dataQueue = []
         self.scalarQueue = []
-        self.args = 0
         self.__computeStatus = Status.FREE
         self.__dataStatus = Status.FREE
         self.instr = None
@@ -41,7 +42,7 @@ class Decode:
         self.scalarBusyBoard = [0] * scalarRegisterLength
         self.priorityQueue = []
 
-    def run(self, instr):
+    def run(self, instr, record=None):
 
         # region Popping out of the queue
         if self.shouldPopCompute():
@@ -62,18 +63,18 @@ class Decode:
 
         # Adding to Queue
         if instr is not None:
-            self.args = instr.split()
-            self.instr = {Decode.INSTR_TYPE: self.INS.get(self.args[0], None),
-                          Decode.INSTR_NAME: self.args[0],
-                          Decode.INSTR_ARGS: instr.split()}
+            if record is not None:  # Preprocessed, only the address list is consumed by the data engine
+                self.instr = dict(record)
+                if Decode.INSTR_ADDRESS in record:
+                    self.instr[Decode.INSTR_ADDRESS] = list(record[Decode.INSTR_ADDRESS])
+            else:
+                self.instr = Decode.decodeInstruction(instr)
             self.priorityQueue.append(self.instr)
             if self.instr.get(Decode.INSTR_TYPE) is None:
                 return Status.FAILED, None, None, None
         toggle = False
         for index, instr in enumerate(self.priorityQueue):
             self.instr = instr
-            self.args = instr.get(Decode.INSTR_ARGS)
-            self.parseInstruction()
             # Compute part
             if self.__computeStatus == Status.FREE and instr.get(Decode.INSTR_TYPE) == Decode.INSTR_COMPUTE:
                 if self.checkBusyBoard():
@@ -147,60 +148,74 @@ class Decode:
             if vdest is not None:
                 self.vectorBusyBoard[vdest] = 0
 
-    def parseInstruction(self):
-        name = self.instr[Decode.INSTR_NAME]
-        type = self.instr[Decode.INSTR_TYPE]
+    # Decoded form of a trace line. It only depends on the line, so it is parsed once when the line enters the window
+    # or ahead of time for a whole trace, see preprocess.py.
+    @staticmethod
+    def decodeInstruction(line):
+        args = line.split()
+        instr = {Decode.INSTR_TYPE: Decode.INS.get(args[0], None),
+                 Decode.INSTR_NAME: args[0],
+                 Decode.INSTR_ARGS: args}
+        if instr[Decode.INSTR_TYPE] is not None:
+            Decode.parseInstruction(instr)
+        return instr
+
+    @staticmethod
+    def parseInstruction(instr):
+        name = instr[Decode.INSTR_NAME]
+        type = instr[Decode.INSTR_TYPE]
+        args = instr[Decode.INSTR_ARGS]
 
         if type == Decode.INSTR_COMPUTE:
             if name in ['ADDVV', 'SUBVV', 'MULVV', 'DIVVV']:
-                self.instr[Decode.INSTR_VDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[2][2:]), int(self.args[3][2:])]
+                instr[Decode.INSTR_VDEST] = int(args[1][2:])
+                instr[Decode.INSTR_VSRC] = [int(args[2][2:]), int(args[3][2:])]
             elif name in ['ADDVS', 'SUBVS', 'MULVS', 'DIVVS']:
-                self.instr[Decode.INSTR_VDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[2][2:])]
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[3][2:])]
+                instr[Decode.INSTR_VDEST] = int(args[1][2:])
+                instr[Decode.INSTR_VSRC] = [int(args[2][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[3][2:])]
             elif name in ['SEQVV', 'SNEVV', 'SGTVV', 'SLTVV', 'SGEVV', 'SLEVV']:
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[1][2:]), int(self.args[2][2:])]
+                instr[Decode.INSTR_VSRC] = [int(args[1][2:]), int(args[2][2:])]
             elif name in ['SEQVS', 'SNEVS', 'SGTVS', 'SLTVS', 'SGEVS', 'SLVES']:
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[1][2:])]
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
+                instr[Decode.INSTR_VSRC] = [int(args[1][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
         elif type == Decode.INSTR_SCALAR:
             if name == 'SS':
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[1][2:]), int(self.args[2][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[1][2:]), int(args[2][2:])]
             elif name == 'LS':
-                self.instr[Decode.INSTR_SDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
+                instr[Decode.INSTR_SDEST] = int(args[1][2:])
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
             elif name in ['ADD', 'SUB', 'AND', 'OR', 'XOR', 'SLL', 'SRL', 'SRA']:
-                self.instr[Decode.INSTR_SDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:]), int(self.args[3][2:])]
+                instr[Decode.INSTR_SDEST] = int(args[1][2:])
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:]), int(args[3][2:])]
             elif name in ['BEQ', 'BNE', 'BGT', 'BLT', 'BGE', 'BLE']:
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[1][2:]), int(self.args[2][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[1][2:]), int(args[2][2:])]
             elif name in ['MFCL', 'POP']:
-                self.instr[Decode.INSTR_SDEST] = int(self.args[1][2:])
+                instr[Decode.INSTR_SDEST] = int(args[1][2:])
             elif name == 'MTCL':
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[1][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[1][2:])]
         else:
-            self.instr[Decode.INSTR_ADDRESS] = [int(num) for num in self.args[-1].strip('()').split(',')]
+            instr[Decode.INSTR_ADDRESS] = [int(num) for num in args[-1].strip('()').split(',')]
             if name == 'LV':
-                self.instr[Decode.INSTR_VDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
+                instr[Decode.INSTR_VDEST] = int(args[1][2:])
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
             elif name == 'LVI':
-                self.instr[Decode.INSTR_VDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[3][2:])]
+                instr[Decode.INSTR_VDEST] = int(args[1][2:])
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
+                instr[Decode.INSTR_VSRC] = [int(args[3][2:])]
             elif name == 'LVWS':
-                self.instr[Decode.INSTR_VDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[3][2:])]
+                instr[Decode.INSTR_VDEST] = int(args[1][2:])
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[3][2:])]
             elif name == 'SV':
-                self.instr[Decode.INSTR_VDEST] = int(self.args[1][2:])
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
+                instr[Decode.INSTR_VDEST] = int(args[1][2:])
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
             elif name == 'SVI':
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:])]
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[1][2:]), int(self.args[3][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:])]
+                instr[Decode.INSTR_VSRC] = [int(args[1][2:]), int(args[3][2:])]
             elif name == 'SVWS':
-                self.instr[Decode.INSTR_VSRC] = [int(self.args[1][2:])]
-                self.instr[Decode.INSTR_SSRC] = [int(self.args[2][2:]), int(self.args[3][2:])]
+                instr[Decode.INSTR_VSRC] = [int(args[1][2:])]
+                instr[Decode.INSTR_SSRC] = [int(args[2][2:]), int(args[3][2:])]
 
     def checkBusyBoard(self):
         ssrc = self.instr.get(Decode.INSTR_SSRC)
@@ -227,6 +242,22 @@ class Decode:
 
         return True
 
+    # Same checks as checkBusyBoard, telling which hazard holds the instruction back. Only used for statistics.
+    def getHazard(self, instr):
+        for i in instr.get(Decode.INSTR_SSRC) or []:
+            if self.scalarBusyBoard[i]:
+                return Decode.HAZARD_RAW
+        for i in instr.get(Decode.INSTR_VSRC) or []:
+            if self.vectorBusyBoard[i]:
+                return Decode.HAZARD_RAW
+        sdest = instr.get(Decode.INSTR_SDEST)
+        if sdest is not None and self.scalarBusyBoard[sdest]:
+            return Decode.HAZARD_WAW
+        vdest = instr.get(Decode.INSTR_VDEST)
+        if vdest is not None and self.vectorBusyBoard[vdest]:
+            return Decode.HAZARD_WAW
+        return None
+
     def updateBusyBoard(self):
         sdest = self.instr.get(Decode.INSTR_SDEST)
         if sdest is not None:
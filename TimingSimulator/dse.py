@@ -0,0 +1,232 @@
+import argparse
+import csv
+import itertools
+import os
+import random
+
+from bounds import getBounds, getProfile
+from cache import addCacheArguments, openCache
+from main import Config, getBankCounts, getResultsPath, loadTraces, runTasks, storeResults
+from prune import formatCycles
+
+# Parameters a sweep spec can vary, in the column order of the results table.
+PARAMETERS = Config.PARAMETERS
+STRATEGIES = ["grid", "random", "lhs"]
+# Values used for the parameters that are neither swept nor given by the base config of the spec.
+BASE_PARAMETERS = {"numLanes": 32, "vdmNumBanks": 16, "dataQueueDepth": 4, "computeQueueDepth": 4,
+                   "vlsPipelineDepth": 11, "pipelineDepthAdd": 2, "pipelineDepthMul": 12, "pipelineDepthDiv": 8,
+                   "bankBusyTime": 6}
+
+
+class SweepSpec(object):
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+        self.strategy = "grid"
+        self.samples = None
+        self.seed = None
+        self.base = dict(BASE_PARAMETERS)
+        self.values = {}  # dictionary of parameter name: sorted list of candidate values
+        try:
+            with open(self.filepath, 'r') as spec:
+                lines = [line.split('#')[0].strip() for line in spec.readlines()]
+            print("SweepSpec - Spec loaded from file:", self.filepath)
+        except:
+            print("SweepSpec - ERROR: Couldn't open file in path:", self.filepath)
+            raise
+
+        for line in lines:
+            if line == '':
+                continue
+            key, value = [part.strip() for part in line.split('=', 1)]
+            if key == "strategy":
+                if value not in STRATEGIES:
+                    raise ValueError("SweepSpec - Unknown strategy " + value + ", expected one of " + str(STRATEGIES))
+                self.strategy = value
+            elif key == "samples":
+                self.samples = int(value)
+            elif key == "seed":
+                self.seed = int(value)
+            elif key == "base":
+                config = Config(os.path.dirname(self.filepath), value)
+                self.base.update(config.parameters)
+            elif key in PARAMETERS:
+                self.values[key] = self.parseValues(value)
+            else:
+                raise ValueError("SweepSpec - Unknown parameter " + key)
+
+        if self.strategy != "grid" and self.samples is None:
+            raise ValueError("SweepSpec - The " + self.strategy + " strategy needs the number of samples")
+
+    # Values are a comma separated list of integers and inclusive ranges. A range is start:stop with an optional
+    # step, either additive (2:16:2) or multiplicative (2:32:*2).
+    @staticmethod
+    def parseValues(text):
+        values = []
+        for item in text.split(','):
+            parts = [part.strip() for part in item.split(':')]
+            if len(parts) == 1:
+                values.append(int(parts[0]))
+                continue
+            start, stop = int(parts[0]), int(parts[1])
+            step = parts[2] if len(parts) > 2 else "1"
+            geometric = step.startswith('*')
+            step = int(step[1:]) if geometric else int(step)
+            if (geometric and (step <= 1 or start <= 0)) or (not geometric and step <= 0):
+                raise ValueError("SweepSpec - Range " + item.strip() + " does not terminate")
+            value = start
+            while value <= stop:
+                values.append(value)
+                value = value * step if geometric else value + step
+        return sorted(set(values))
+
+    def getSweptParameters(self):
+        return [name for name in PARAMETERS if name in self.values]
+
+    def generate(self):
+        names = self.getSweptParameters()
+        rng = random.Random(self.seed)
+        if self.strategy == "grid":
+            points = list(itertools.product(*[self.values[name] for name in names]))
+        elif self.strategy == "random":
+            points = [tuple(rng.choice(self.values[name]) for name in names) for _ in range(self.samples)]
+        else:
+            # Latin hypercube: every parameter has its value range split into as many strata as samples, and each
+            # stratum is used exactly once, so every value range is covered evenly even with few samples.
+            columns = []
+            for name in names:
+                values = self.values[name]
+                strata = list(range(self.samples))
+                rng.shuffle(strata)
+                columns.append([values[int((stratum + rng.random()) * len(values) / self.samples)]
+                                for stratum in strata])
+            points = list(zip(*columns))
+
+        configurations = []
+        seen = set()
+        for point in points:
+            if point in seen:  # Random and lhs sampling can draw the same point twice
+                continue
+            seen.add(point)
+            parameters = dict(self.base)
+            parameters.update(zip(names, point))
+            configurations.append(parameters)
+        return configurations
+
+
+def dumpTable(filepath, rows):
+    try:
+        with open(filepath, 'w', newline='') as opf:
+            writer = csv.writer(opf)
+            writer.writerow(["Point", "Trace"] + PARAMETERS + ["Cycles"])
+            writer.writerows(rows)
+        print("DSE - Dumped results table into output file in path:", filepath)
+    except:
+        print("DSE - ERROR: Couldn't open output file in path:", filepath)
+
+
+def getLowerBounds(tasks):
+    # Analytic lower bound of every point, so that points that cannot beat the best one found so far are skipped
+    profiles = {}
+    lowerBounds = []
+    for iodir, config, _ in tasks:
+        if iodir not in profiles:
+            profiles[iodir] = getProfile(iodir)
+            if profiles[iodir] is None:
+                raise SystemExit("DSE - ERROR: --bounds needs a preprocessed trace in path: " + iodir)
+        lowerBounds.append(getBounds(profiles[iodir], config)["lower"])
+    return lowerBounds
+
+
+def simulate(tasks, jobs, cache, resultsPath, options):
+    if options.get("bounds"):
+        options = dict(options, bounds=getLowerBounds(tasks))
+    results = runTasks(tasks, jobs, cache, options)
+    storeResults(list(zip(tasks, results)), filepath=resultsPath)
+    return results
+
+
+def exploreSurrogate(tasks, jobs, cache, resultsPath, options):
+    # The surrogate, trained on the results stored so far, ranks the points and only the promising ones are
+    # simulated, the others are reported with their prediction. Every simulated point checks the prediction and is
+    # added to the results the next surrogate trains on.
+    from surrogate import predictTasks, recordPredictions, selectPromising, trainSurrogate  # Needs numpy
+
+    paths = [getResultsPath(iodir, resultsPath) for iodir, _, _ in tasks]
+    model = trainSurrogate(paths)
+    if model is None:
+        print("DSE - Simulating every point to train the surrogate")
+        return simulate(tasks, jobs, cache, resultsPath, options)
+    predicted = predictTasks(model, tasks)
+    selected = selectPromising(tasks, predicted, options["surrogate"])
+    print("DSE - Surrogate selected", len(selected), "of", len(tasks), "points to simulate")
+    simulated = simulate([tasks[index] for index in selected], jobs, cache, resultsPath, options)
+    results = [{"clk": cycles + 1, "exact": False, "predicted": True} if cycles is not None else None
+               for cycles in predicted]
+    for index, result in zip(selected, simulated):
+        results[index] = result
+    errors = recordPredictions(model, [(tasks[index], results[index]) for index in selected],
+                               [predicted[index] for index in selected], [paths[index] for index in selected])
+    if errors:
+        print("DSE - Surrogate error over", len(errors), "simulated points:",
+              "{:.2f}%".format(100 * sum(abs(error) for error in errors) / len(errors)), "mean absolute,",
+              "{:+.2f}%".format(100 * sum(errors) / len(errors)), "bias")
+    return results
+
+
+def explore(spec, iodirs, jobs=1, cache=None, resultsPath=None, options=None):
+    configurations = spec.generate()
+    print("DSE -", spec.strategy, "strategy generated", len(configurations), "configurations over",
+          spec.getSweptParameters())
+    tasks = [(iodir, Config(iodir, "DSE" + str(index + 1), parameters), None)
+             for iodir in iodirs for index, parameters in enumerate(configurations)]
+    loadTraces(iodirs, bankCounts=getBankCounts(tasks))
+    options = options or {}
+    if options.get("surrogate") is not None:
+        results = exploreSurrogate(tasks, jobs, cache, resultsPath, options)
+    else:
+        results = simulate(tasks, jobs, cache, resultsPath, options)
+    return [[config.getName(), os.path.basename(iodir)] + [config.parameters[name] for name in PARAMETERS] +
+            [formatCycles(result)] for (iodir, config, _), result in zip(tasks, results)]
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Vector Core Design Space Exploration')
+    parser.add_argument('--spec', required=True, type=str,
+                        help='Path to the sweep spec file declaring the values of each parameter')
+    parser.add_argument('--iodir', default=["IODir1"], type=str, nargs='+',
+                        help='Path to the folders containing the resolved data to simulate')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of configurations simulated in parallel')
+    parser.add_argument('--output', default="DSEResults.csv", type=str,
+                        help='Results table, relative to the folder of the spec file')
+    parser.add_argument('--results', default=None, type=str,
+                        help='SQLite results database the points are added to, defaults to Results.db in each iodir')
+    parser.add_argument('--batch', action='store_true',
+                        help='Simulate points that only differ in latencies in lockstep, sharing fetch and decode')
+    parser.add_argument('--prune', default=None, type=float, metavar='MARGIN',
+                        help='Stop points whose cycles exceed by MARGIN the best comparable or cheaper point, see '
+                             'main.py --prune')
+    parser.add_argument('--bounds', action='store_true',
+                        help='Simulate the points in the order of their analytic lower bound and skip the ones whose '
+                             'bound is above the best point found so far, see bounds.py')
+    parser.add_argument('--surrogate', default=None, type=float, metavar='FRACTION',
+                        help='Rank the points with the surrogate model trained on the results database and only '
+                             'simulate the FRACTION predicted fastest and the predicted Pareto front, see '
+                             'surrogate.py')
+    parser.add_argument('--journal', default=None, type=str,
+                        help='Append-only journal of the finished points, a restarted sweep only simulates the '
+                             'missing ones, see main.py --journal')
+    addCacheArguments(parser)
+    args = parser.parse_args()
+    args.iodir = [os.path.abspath(iodir) for iodir in args.iodir]
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    spec = SweepSpec(args.spec)
+    rows = explore(spec, args.iodir, args.jobs, openCache(args), args.results,
+                   {"batch": args.batch, "prune": args.prune, "bounds": args.bounds, "surrogate": args.surrogate,
+                    "journal": args.journal})
+    dumpTable(os.path.join(os.path.dirname(spec.filepath), args.output), rows)
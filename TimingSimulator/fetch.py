@@ -1,35 +1,59 @@
+from decode import Decode
 from status import Status
+from traceReader import StreamingTrace
 
 
 class Fetch:
-    def __init__(self, instrMem, decode):
+    def __init__(self, instrMem, decode, startAddr=0, records=None):
         self.instrMem = instrMem
-        self.addr = 0
+        self.addr = startAddr
         self.decode = decode
-        self.currentVectorLength = 64
+        self.records = records  # Preprocessed instructions of the trace, see preprocess.py
+        self.record = None  # Preprocessed form of the instruction returned by the last run, if any
+        self.currentVectorLength = Fetch.getVectorLengthAt(instrMem, startAddr) if startAddr > 0 else 64
         self.__status = Status.FREE
 
     def run(self):
 
         # instr = self.instrMem.Read(self.addr)  # Reading the instruction
-        if len(self.instrMem) == self.addr or self.__status == Status.COMPLETED:
+        if self.__status == Status.COMPLETED:
+            return Status.SUCCESS, None
+        try:  # Streamed traces don't know their length up front, both raise IndexError past the end
+            instr = self.instrMem[self.addr]
+        except IndexError:
             self.__status = Status.COMPLETED
             return Status.SUCCESS, None
 
-        instr = self.instrMem[self.addr]
-
-        if instr.split()[0] == 'MTCL':
+        record = self.records[self.addr] if self.records is not None else None
+        if (record[Decode.INSTR_NAME] if record is not None else instr.split()[0]) == 'MTCL':
             if self.decode.isClear():
                 self.currentVectorLength = int(instr.split()[-1])
                 self.addr = self.addr + 1
+                self.record = record
                 return Status.SUCCESS, instr
             else:
+                self.record = None
                 return Status.SUCCESS, None
         else:
             self.addr = self.addr + 1
+            self.record = record
             return Status.SUCCESS, instr
 
 
+    # Vector length in effect before the instruction at addr, set by the closest preceding MTCL.
+    @staticmethod
+    def getVectorLengthAt(instrMem, addr):
+        if isinstance(instrMem, StreamingTrace):  # Only moves forward, the last MTCL is tracked on the way to addr
+            vectorLength = 64
+            for index in range(addr):
+                if instrMem[index].startswith('MTCL'):
+                    vectorLength = int(instrMem[index].split()[-1])
+            return vectorLength
+        for index in range(addr - 1, -1, -1):
+            if instrMem[index].startswith('MTCL'):
+                return int(instrMem[index].split()[-1])
+        return 64
+
     def getCurrentVectorLength(self):
         return self.currentVectorLength
 
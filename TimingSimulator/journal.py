@@ -0,0 +1,85 @@
+import json
+import os
+
+
+def lockFile(file, exclusive):
+    # flock where there is one, else msvcrt.locking (Windows) of the first byte, which is always exclusive. Without
+    # either, the journal is not locked.
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        return
+    try:
+        import msvcrt
+    except ImportError:
+        return
+    position = file.tell()
+    file.seek(0)
+    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+    file.seek(position)
+
+
+def unlockFile(file):
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if fcntl is not None:
+        fcntl.flock(file, fcntl.LOCK_UN)
+        return
+    try:
+        import msvcrt
+    except ImportError:
+        return
+    position = file.tell()
+    file.seek(0)
+    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+    file.seek(position)
+
+
+class SweepJournal(object):
+    # Append-only JSON lines of the finished results of sweeps, keyed like the result cache (trace hash, full
+    # parameter set, start and timing model version). Every line is written and fsync'd under an exclusive lock and
+    # read under a shared one (see lockFile), so several sweep processes can share a journal. A line cut short by a
+    # crash is skipped, and the next append starts on a new line.
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+
+    def read(self):
+        # key: result, the latest one of every key
+        try:
+            with open(self.filepath, 'r') as inf:
+                lockFile(inf, False)
+                try:
+                    lines = inf.readlines()
+                finally:
+                    unlockFile(inf)
+        except FileNotFoundError:
+            return {}
+        results = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            results[entry["key"]] = entry["result"]
+        return results
+
+    def append(self, key, trace, config, result):
+        line = json.dumps({"key": key, "trace": trace, "config": config, "result": result}) + "\n"
+        with open(self.filepath, 'a+') as opf:
+            lockFile(opf, True)
+            try:
+                opf.seek(0, os.SEEK_END)
+                if opf.tell() > 0:
+                    opf.seek(opf.tell() - 1)
+                    if opf.read(1) != "\n":  # Unfinished line of a crashed writer
+                        line = "\n" + line
+                opf.write(line)
+                opf.flush()
+                os.fsync(opf.fileno())
+            finally:
+                unlockFile(opf)
@@ -0,0 +1,133 @@
+import argparse
+import os
+
+from cache import addCacheArguments, openCache
+from dse import SweepSpec
+from main import Config, dumpOutput, getBankCounts, loadTraces, runTasks, storeResults
+from prune import RESOURCE_PARAMETERS
+
+# Ranges searched when --values is not given, in the syntax of the sweep specs. Lanes and banks keep to the powers of
+# two of the studies in IODir1/Plots, other bank counts change the conflicts rather than the capacity.
+DEFAULT_VALUES = {"numLanes": "1:64:*2", "vdmNumBanks": "1:64:*2", "dataQueueDepth": "1:32",
+                  "computeQueueDepth": "1:32", "vlsPipelineDepth": "1:32", "pipelineDepthAdd": "1:32",
+                  "pipelineDepthMul": "1:32", "pipelineDepthDiv": "1:32", "bankBusyTime": "0:16"}
+
+
+class KneeSearch(object):
+    # Saturation point of one parameter, the others fixed at the base config: the least hardware whose cycles are
+    # within `tolerance` (a fraction) of the best cycles of the range. That is the smallest value of a resource
+    # parameter, or the largest latency. Relies on the cycles improving with every step towards more hardware, so
+    # the best cycles are at the end of the range and the values within tolerance form the other end, found by
+    # bisection. With jobs > 1 every round simulates `jobs` values splitting the remaining range evenly.
+    def __init__(self, iodir, base, parameter, values, tolerance, jobs=1, cache=None):
+        self.iodir = iodir
+        self.base = base
+        self.parameter = parameter
+        # From the least to the most hardware
+        self.values = sorted(values) if parameter in RESOURCE_PARAMETERS else sorted(values, reverse=True)
+        self.tolerance = tolerance
+        self.jobs = jobs
+        self.cache = cache
+        self.results = {}  # value: result
+        self.order = []  # values in the order they were simulated
+        self.threshold = None
+        self.knee = None
+
+    def getCycles(self, value):
+        return self.results[value]["clk"] - 1
+
+    def evaluate(self, indices):
+        values = [self.values[index] for index in indices]
+        tasks = []
+        for value in values:
+            parameters = self.base.getParameters()
+            parameters[self.parameter] = value
+            tasks.append((self.iodir, Config(self.iodir, "Knee_" + self.parameter + str(value), parameters), None))
+        results = runTasks(tasks, self.jobs, self.cache)
+        storeResults(list(zip(tasks, results)))
+        for value, result in zip(values, results):
+            self.results[value] = result
+            self.order.append(value)
+
+    def isWithin(self, index):
+        return self.getCycles(self.values[index]) <= self.threshold
+
+    def run(self):
+        self.evaluate([len(self.values) - 1])
+        self.threshold = self.getCycles(self.values[-1]) * (1 + self.tolerance)
+        low, high = 0, len(self.values) - 1  # The knee is in values[low:high + 1], values[high] is within tolerance
+        while low < high:
+            count = min(self.jobs, high - low)
+            probes = sorted(set(low + (high - low) * (probe + 1) // (count + 1) for probe in range(count)))
+            self.evaluate(probes)
+            within = [index for index in probes if self.isWithin(index)]
+            if within:
+                high = within[0]
+            low = max([index + 1 for index in probes if index < high and not self.isWithin(index)] + [low])
+        self.knee = self.values[high]
+        return self.knee
+
+    def getViolations(self):
+        # Pairs of simulated values where more hardware was slower, the bisection may then have missed the knee
+        evaluated = [value for value in self.values if value in self.results]
+        return [(first, second) for first, second in zip(evaluated, evaluated[1:])
+                if self.getCycles(second) > self.getCycles(first)]
+
+    def getReportLines(self):
+        best = self.getCycles(self.values[-1])
+        knee = self.getCycles(self.knee)
+        lines = ["=================KNEE=================",
+                 "Parameter: " + self.parameter + " (others from " + self.base.getName() + ")",
+                 "Range: " + str(self.values[0]) + " to " + str(self.values[-1]) + " (" + str(len(self.values)) +
+                 " values)",
+                 "Best: " + str(self.values[-1]) + " - Clock Cycles: " + str(best),
+                 "Tolerance: " + "{:.2f}%".format(100 * self.tolerance) + " (<= " + str(int(self.threshold)) +
+                 " cycles)",
+                 "Knee: " + str(self.knee) + " - Clock Cycles: " + str(knee) + " (" +
+                 "{:+.2f}%".format(100 * (knee - best) / best) + ")",
+                 "Simulations: " + str(len(self.order)) + " of " + str(len(self.values)),
+                 "Evaluated (in order):"]
+        lines += [str(value) + " " + str(self.getCycles(value)) for value in self.order]
+        for first, second in self.getViolations():
+            lines.append("WARNING: " + str(second) + " is slower than " + str(first) +
+                         ", the cycles are not monotonic and the knee may be off")
+        lines.append("======================================")
+        return lines
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Saturation point of a hardware parameter, found by bisection')
+    parser.add_argument('--iodir', default=["IODir1"], type=str, nargs='+',
+                        help='Path to the folders containing the resolved data and the base config')
+    parser.add_argument('--config', default="Config1.txt", type=str,
+                        help='Base config in every iodir, giving the parameters that are not searched')
+    parser.add_argument('--parameter', required=True, type=str, nargs='+', choices=Config.PARAMETERS,
+                        help='Parameters to search, one after the other')
+    parser.add_argument('--values', default=None, type=str,
+                        help='Values of the parameter as in sweep specs, e.g. 1:64 or 2:32:*2, defaults per '
+                             'parameter')
+    parser.add_argument('--tolerance', default=5.0, type=float,
+                        help='Percentage of cycles over the best of the range the knee may take')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of values simulated in parallel in every round')
+    addCacheArguments(parser)
+    args = parser.parse_args()
+    args.iodir = [os.path.abspath(iodir) for iodir in args.iodir]
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    cache = openCache(args)
+    for iodir in args.iodir:
+        base = Config(iodir, args.config)
+        loadTraces([iodir], bankCounts=getBankCounts([(iodir, base, None)]))
+        for parameter in args.parameter:
+            values = SweepSpec.parseValues(args.values or DEFAULT_VALUES[parameter])
+            search = KneeSearch(iodir, base, parameter, values, args.tolerance / 100, args.jobs, cache)
+            search.run()
+            lines = search.getReportLines()
+            for line in lines:
+                print(line)
+            dumpOutput(iodir, lines, "Knee_" + parameter + ".txt")
@@ -1,19 +1,49 @@
 import argparse
+import copy
 import glob
+import hashlib
+import multiprocessing
+import queue
 
-from matplotlib import pyplot as plt, ticker
-
+from batch import BatchCore, getBatchKey
+from cache import addCacheArguments, openCache, ResultCache
+from checkpoint import CHUNK_CYCLES, Checkpointer, findCheckpoints, loadState, TerminationForwarder
 from computeEngine import ComputeEngine
+from criticalPath import CriticalPath, loadCodeLines
 from dataEngine import DataEngine
 from decode import Decode
 from fetch import Fetch
+from journal import SweepJournal
+from preprocess import loadPreprocessed, PreprocessedTrace
+from progress import Progress
+from prune import formatCycles, getOrder, Pruner
+from results import ResultsStore
 from status import Status
+from stats import dumpStatistics, Statistics
+from steadyState import SteadyStateDetector
+from telemetry import dumpTelemetry, Telemetry
+from timeline import dumpTimeline, Timeline
+from traceReader import findTrace, openTrace, readInstructions, StreamingTrace
+from traceStore import TraceStore
 import time
 import os
 
+# Version of the timing model, part of the result cache key. Bump it whenever a change alters simulated cycle counts.
+MODEL_VERSION = 1
+# Options hooking into the cycle loop of a run
+INSTRUMENTATION = ["extrapolate", "stats", "timeline", "criticalPath", "telemetry", "progress"]
+# Options whose outputs need the simulation itself, stored results don't answer them
+SIMULATION_OUTPUTS = ["timeline", "criticalPath", "telemetry"]
+
 
 class Config(object):
-    def __init__(self, iodir, fileName="Config.txt"):
+    # Every parameter of a configuration, in the column order of the results tables.
+    PARAMETERS = ["numLanes", "vdmNumBanks", "dataQueueDepth", "computeQueueDepth", "vlsPipelineDepth",
+                  "pipelineDepthAdd", "pipelineDepthMul", "pipelineDepthDiv", "bankBusyTime"]
+    # Parameters that are optional in a config file and the value used when they are left out.
+    DEFAULT_PARAMETERS = {"bankBusyTime": 6}
+
+    def __init__(self, iodir, fileName="Config.txt", parameters=None):
         self.filepath = os.path.abspath(os.path.join(iodir, fileName))
         self.parameters = {}  # dictionary of parameter name: value as strings.
         self.numberOfLanes = None
@@ -24,6 +54,11 @@ class Config(object):
         self.computeQueueDepth = None
         self.numberOfBanks = None
         self.vectorLoadStorePipelineDepth = None
+        self.bankBusyTime = None
+        if parameters is not None:  # Generated configurations are not backed by a file
+            self.parameters = dict(parameters)
+            self.parseParameters()
+            return
         try:
             with open(self.filepath, 'r') as conf:
                 self.parameters = {line.split('=')[0].strip(): int(line.split('=')[1].split('#')[0].strip()) for line in
@@ -44,80 +79,304 @@ class Config(object):
         self.addPipelineDepth = self.parameters["pipelineDepthAdd"]
         self.mulPipelineDepth = self.parameters["pipelineDepthMul"]
         self.divPipelineDepth = self.parameters["pipelineDepthDiv"]
+        self.bankBusyTime = self.parameters.get("bankBusyTime", Config.DEFAULT_PARAMETERS["bankBusyTime"])
+
+    def getParameters(self):
+        parameters = dict(Config.DEFAULT_PARAMETERS)
+        parameters.update(self.parameters)
+        return parameters
+
+    def getName(self):
+        fileName = os.path.basename(self.filepath)
+        return fileName[:fileName.index(".")] if "." in fileName else fileName
 
 
 class IMEM(object):
-    def __init__(self, iodir):
+    def __init__(self, iodir, streaming=False, bufferSize=4096, preprocess=True, instructions=None):
         self.size = pow(2, 16)  # Can hold a maximum of 2^16 instructions.
-        self.filepath = os.path.abspath(os.path.join(iodir, "Data.txt"))
+        self.filepath = findTrace(iodir) if instructions is None else None
         self.instructions = []
+        self.hash = None
+        self.streaming = streaming
+        self.bufferSize = bufferSize
+        self.preprocess = preprocess
+        self.preprocessed = None
 
         try:
-            with open(self.filepath, 'r') as insf:
-                self.instructions = [ins.split('#')[0].strip() for ins in insf.readlines() if
-                                     not (ins.startswith('#') or ins.strip() == '')]
-            print("IMEM - Instructions loaded from file:", self.filepath)
+            if instructions is not None:  # Resolved in memory by the functional simulator, see service.py
+                self.streaming = False
+                self.instructions = list(instructions)
+                print("IMEM - Instructions resolved in memory:", len(self.instructions))
+            elif self.filepath.endswith(".vtr"):  # Memory-mapped trace store, already random access
+                self.streaming = False
+                self.instructions = TraceStore(self.filepath)
+                self.hash = self.instructions.hash
+                print("IMEM - Instructions mapped from trace store:", self.filepath)
+            elif self.streaming:  # Every run streams the file itself, nothing is held in memory
+                self.instructions = None
+                open(self.filepath, 'r').close()
+                print("IMEM - Instructions streamed from file:", self.filepath)
+            else:
+                with openTrace(self.filepath) as insf:
+                    self.instructions = list(readInstructions(insf))
+                print("IMEM - Instructions loaded from file:", self.filepath)
             # print("IMEM - Instructions:", self.instructions)
         except:
             print("IMEM - ERROR: Couldn't open file in path:", self.filepath)
             raise
 
+    def getInstructions(self):
+        if self.streaming:
+            return StreamingTrace(self.filepath, self.bufferSize, decoder=Decode.decodeInstruction)
+        return self.instructions
+
+    def getHash(self):
+        if self.hash is None:
+            sha = hashlib.sha256()
+            if self.streaming:
+                with openTrace(self.filepath) as insf:
+                    for index, ins in enumerate(readInstructions(insf)):
+                        sha.update((ins if index == 0 else "\n" + ins).encode())
+            else:
+                sha.update("\n".join(self.instructions).encode())
+            self.hash = sha.hexdigest()
+        return self.hash
+
+    def preprocessTrace(self, bankCounts=()):
+        # Only traces held in memory are preprocessed, streamed traces are decoded by their reader thread and mapped
+        # traces as they are fetched
+        if self.preprocess and isinstance(self.instructions, list) and self.filepath is None:
+            # No trace file to keep the preprocessed trace next to
+            self.preprocessed = PreprocessedTrace(self.instructions, self.getHash())
+            for numberOfBanks in bankCounts:
+                self.preprocessed.addBankCount(numberOfBanks)
+        elif self.preprocess and isinstance(self.instructions, list):
+            self.preprocessed = loadPreprocessed(self.filepath, self.instructions, self.getHash(), bankCounts)
+
+    def getRecords(self, numberOfBanks):
+        if self.preprocessed is None:
+            return None
+        return self.preprocessed.getRecords(numberOfBanks)
+
 
 class Core:
-    def __init__(self, config, imem, iodir):
+    def __init__(self, config, imem, iodir, startAddr=0):
         self.config = config
         self.imem = imem
         self.iodir = iodir
         self.compute = ComputeEngine(self.config.addPipelineDepth, self.config.mulPipelineDepth,
                                      self.config.divPipelineDepth, self.config.numberOfLanes)
-        self.data = DataEngine(6, self.config.numberOfBanks, self.config.vectorLoadStorePipelineDepth)
+        self.data = DataEngine(self.config.bankBusyTime, self.config.numberOfBanks,
+                               self.config.vectorLoadStorePipelineDepth)
         self.decode = Decode(self.config.computeQueueDepth, self.config.dataQueueDepth, 8, 8, self.compute, self.data)
-        self.fetch = Fetch(self.imem.instructions, self.decode)
+        instructions, records = self.loadTrace()
+        self.fetch = Fetch(instructions, self.decode, startAddr, records)
         self.compute.setFreeBusyBoard(self.decode.freeBusyBoard)
         self.data.setFreeBusyBoard(self.decode.freeBusyBoard)
         self.clk = 1
         self.clks = []
         self.startTime = None
         self.endTime = None
+        self.detector = None
+        self.stats = None
+        self.timeline = None
+        self.criticalPath = None
+        self.telemetry = None
+        self.progress = None
+        self.probes = []  # Called at the end of every cycle, see Statistics.cycle
+        self.pruned = False  # Stopped at maxCycles before the end of the trace
+        self.checkpointer = None
+
+    def enableExtrapolation(self):
+        self.detector = SteadyStateDetector(self)
+
+    def enableStatistics(self):
+        self.stats = Statistics(self.config.numberOfBanks)
+        self.addProbe(self.stats)
+
+    def enableTimeline(self, start=0, end=None, limit=None):
+        self.timeline = Timeline(start, end, limit)
+        self.addProbe(self.timeline)
+
+    def enableCriticalPath(self):
+        self.criticalPath = CriticalPath()
+        self.addProbe(self.criticalPath)
+
+    def enableTelemetry(self, interval=100, maxSamples=4096):
+        self.telemetry = Telemetry(interval, maxSamples)
+        self.addProbe(self.telemetry)
 
-    def run(self):
+    def enableProgress(self, interval=5.0, listener=None):
+        self.progress = Progress(self.config.getName(), interval, listener)
+        self.addProbe(self.progress)
+
+    def enableCheckpoints(self, checkpointer):
+        self.checkpointer = checkpointer
+
+    def addProbe(self, probe):
+        probe.attach(self)
+        self.probes.append(probe)
+
+    # With maxCycles the run stops at that clock cycle if the trace isn't done by then, its cycles are then only known
+    # to be above it.
+    def run(self, maxCycles=None):
         print("Timing Simulation Started")
         self.startTime = time.time()
+        limit = maxCycles if maxCycles is not None else float("inf")
+        try:
+            if self.detector is None and not self.probes:
+                if self.checkpointer is not None:
+                    self.pruned = not self.runCheckpointed(limit)
+                else:
+                    self.pruned = not self.runCycles(limit)
+            else:
+                self.runInstrumented(limit)
+        finally:  # Also when the run is pruned or fails
+            self.closeTrace()
+
+        self.endTime = time.time()
+        print("Timing Simulation Successful")
+        if self.progress is not None:
+            self.progress.printReport(self)
+
+    # Plain cycle loop, returns whether the trace is done (False when the clock reached limit first)
+    def runCycles(self, limit=float("inf")):
         while not (self.fetch.getStatus() == Status.COMPLETED and self.decode.isClear()):
+            if self.clk >= limit:
+                return False
             status1, instr = self.fetch.run()
-            status2, computeInstr, dataInstr, scalarInstr = self.decode.run(instr)
+            status2, computeInstr, dataInstr, scalarInstr = self.decode.run(instr, self.fetch.record)
             self.compute.run(computeInstr, self.fetch.getCurrentVectorLength())
             self.data.run(dataInstr)
             self.clk += 1
             # print(self.fetch.addr)
+        return True
 
-        self.endTime = time.time()
-        print("Timing Simulation Successful")
+    # Same cycles in chunks, the checkpointer saves the state between two of them when due or on SIGTERM
+    def runCheckpointed(self, limit=float("inf")):
+        self.checkpointer.attach(self)
+        try:
+            while not self.runCycles(min(limit, self.clk + CHUNK_CYCLES, self.checkpointer.nextClk)):
+                if self.clk >= limit:
+                    return False
+                self.checkpointer.check(self)
+            self.checkpointer.finish()
+            return True
+        finally:
+            self.checkpointer.detach()
+
+    def runInstrumented(self, limit=float("inf")):
+        while not (self.fetch.getStatus() == Status.COMPLETED and self.decode.isClear()):
+            if self.clk >= limit:
+                self.pruned = True
+                break
+            status1, instr = self.fetch.run()
+            waiting = len(self.decode.priorityQueue) + (instr is not None)
+            status2, computeInstr, dataInstr, scalarInstr = self.decode.run(instr, self.fetch.record)
+            # Decode leaves the instruction it issued in decode.instr
+            issued = self.decode.instr if len(self.decode.priorityQueue) < waiting else None
+            self.compute.run(computeInstr, self.fetch.getCurrentVectorLength())
+            self.data.run(dataInstr)
+            for probe in self.probes:
+                probe.cycle(self, instr, issued, computeInstr, dataInstr, scalarInstr)
+            self.clk += 1
+            if self.detector is not None:
+                self.detector.run(instr)
+
+    # Simulates until fetch reaches the instruction at addr, used to warm up the core before a measured region.
+    def runUntil(self, addr):
+        while self.fetch.addr < addr and not (self.fetch.getStatus() == Status.COMPLETED and self.decode.isClear()):
+            status1, instr = self.fetch.run()
+            status2, computeInstr, dataInstr, scalarInstr = self.decode.run(instr, self.fetch.record)
+            self.compute.run(computeInstr, self.fetch.getCurrentVectorLength())
+            self.data.run(dataInstr)
+            self.clk += 1
+
+    # Instructions and records for fetch, a streamed trace has its own reader and decodes the records itself
+    def loadTrace(self):
+        instructions = self.imem.getInstructions()
+        if isinstance(instructions, StreamingTrace):
+            return instructions, instructions.records
+        return instructions, self.imem.getRecords(self.config.numberOfBanks)
+
+    # Stops the reader of a streamed trace. run() closes it, callers ending a run with runUntil close it themselves.
+    def closeTrace(self):
+        if isinstance(self.fetch.instrMem, StreamingTrace):
+            self.fetch.instrMem.close()
+
+    # Microarchitectural state of the core: fetch, decode with its window, queues and busy boards, both engines and
+    # the clock, without the trace. It pickles, so a core in another process can resume from it with setState. Probes
+    # and the steady state detector hook into the engines, states are only taken and set without them.
+    def getState(self):
+        if self.probes or self.detector is not None:
+            raise ValueError("Core - ERROR: The state of an instrumented core can't be taken")
+        memo = {id(self.fetch.instrMem): None}
+        if self.fetch.records is not None:
+            memo[id(self.fetch.records)] = None
+        return copy.deepcopy({"parameters": self.config.getParameters(), "clk": self.clk, "fetch": self.fetch,
+                              "decode": self.decode, "compute": self.compute, "data": self.data}, memo)
+
+    def setState(self, state):
+        if self.probes or self.detector is not None:
+            raise ValueError("Core - ERROR: The state of an instrumented core can't be set")
+        if state["parameters"] != self.config.getParameters():
+            raise ValueError("Core - ERROR: The state was taken with a different config")
+        state = copy.deepcopy(state)  # The same state can be set again
+        self.closeTrace()
+        self.fetch, self.decode, self.compute, self.data = state["fetch"], state["decode"], state["compute"], \
+            state["data"]
+        self.fetch.instrMem, self.fetch.records = self.loadTrace()
+        self.clk = state["clk"]
 
     def printResult(self):
         time_difference = self.endTime - self.startTime
         minutes = str(int(time_difference // 60))
         seconds = str(int(time_difference % 60))
         # milliseconds = str(int((time_difference - int(time_difference)) * 1000))
-        self.dataOutput = []
-
-        self.dataOutput.append("================RESULT================")
-        self.dataOutput.append("Clock Cycles: " + str(self.clk - 1))
-        self.dataOutput.append("Time Elapsed: " + minutes + "m " + seconds + "s")
+        self.dataOutput = getResultLines(self.clk, minutes, seconds)
+        if self.pruned:
+            self.dataOutput[1] = "Clock Cycles: >= " + str(self.clk) + " (stopped, dominated)"
+        if self.detector is not None:
+            self.dataOutput.append("Exact: " + ("Yes" if self.isExact() else "No") + " - " +
+                                   str(self.detector.extrapolatedCycles) + " cycles and " +
+                                   str(self.detector.extrapolatedInstructions) + " instructions extrapolated")
         self.dataOutput.append("======================================")
         for line in self.dataOutput:
             print(line)
 
     def dumpResult(self, fileName="Output.txt"):
-        filepath = os.path.abspath(os.path.join(iodir, fileName))
-        try:
-            with open(filepath, 'w') as opf:
-                lines = [str(line) + '\n' for line in self.dataOutput]
-                opf.writelines(lines)
-            print(fileName, "- Dumped output into output file in path:", filepath)
-        except:
-            print(fileName, "- ERROR: Couldn't open output file in path:", filepath)
-        pass
+        dumpOutput(self.iodir, self.dataOutput, fileName)
+
+    def isExact(self):
+        return not self.pruned and (self.detector is None or self.detector.extrapolatedCycles == 0)
+
+    def getResult(self):
+        result = {"clk": self.clk, "output": self.dataOutput, "exact": self.isExact(),
+                  "seconds": self.endTime - self.startTime}
+        if self.pruned:  # Lower bound, the trace needs at least one more cycle
+            result["clk"] = self.clk + 1
+            result["pruned"] = True
+        if self.stats is not None:
+            result["stats"] = self.stats.getReport()
+        return result
+
+
+def getResultLines(clk, minutes, seconds):
+    return ["================RESULT================",
+            "Clock Cycles: " + str(clk - 1),
+            "Time Elapsed: " + minutes + "m " + seconds + "s"]
+
+
+def dumpOutput(iodir, dataOutput, fileName="Output.txt"):
+    filepath = os.path.abspath(os.path.join(iodir, fileName))
+    try:
+        with open(filepath, 'w') as opf:
+            lines = [str(line) + '\n' for line in dataOutput]
+            opf.writelines(lines)
+        print(fileName, "- Dumped output into output file in path:", filepath)
+    except:
+        print(fileName, "- ERROR: Couldn't open output file in path:", filepath)
+    pass
 
 
 def dumpSummary(iodir, cycles, fileName="Summary.txt"):
@@ -142,91 +401,451 @@ def readFiles(iodir):
     return txt_files
 
 
+# Traces shared with the sweep workers, keyed by iodir. They are loaded before the pool is created so that forked
+# workers inherit the parsed instructions copy-on-write instead of re-reading Data.txt.
+sharedTraces = {}
+
+
+def initWorker(traces):
+    sharedTraces.update(traces)
+
+
+def runConfig(task):
+    iodir, config, outputName, options = task
+    print("==============================")
+    print("Running:", config.getName())
+    core = Core(config, sharedTraces[iodir], iodir, options.get("start", 0))
+    if options.get("resume"):
+        checkpoints = findCheckpoints(iodir, config, getCheckpointKey(iodir, options))
+        if checkpoints:
+            header, filepath = checkpoints[-1]
+            core.setState(loadState(filepath))
+            print("Resumed:", config.getName(), "from clock cycle", header["clk"] - 1)
+    if options.get("checkpoint") is not None:
+        core.enableCheckpoints(Checkpointer(iodir, config, getCheckpointKey(iodir, options), options["checkpoint"],
+                                            options.get("keepCheckpoints")))
+    if options.get("extrapolate"):
+        core.enableExtrapolation()
+    if options.get("stats"):
+        core.enableStatistics()
+    if options.get("timeline"):
+        core.enableTimeline(*options["timeline"])
+    if options.get("criticalPath"):
+        core.enableCriticalPath()
+    if options.get("telemetry"):
+        core.enableTelemetry(*options["telemetry"])
+    if options.get("progress"):
+        core.enableProgress(options["progress"], options.get("listener"))
+    core.run(options.get("maxCycles"))
+    core.printResult()
+    if outputName is not None:
+        core.dumpResult(outputName)
+        if core.stats is not None:
+            dumpStatistics(iodir, core.stats.getReport(), getStatisticsName(outputName))
+        if core.timeline is not None:
+            dumpTimeline(iodir, core.timeline, getTimelineName(outputName))
+        if core.criticalPath is not None:
+            dumpOutput(iodir, core.criticalPath.getReport(*loadCodeLines(iodir)),
+                       "CriticalPath" + outputName[len("Output"):])
+        if core.telemetry is not None:
+            dumpTelemetry(iodir, core.telemetry.getReport(), getTelemetryName(outputName))
+    print("==============================")
+    return core.getResult()
+
+
+def runBatch(tasks):
+    # Configs of one trace sharing their structural parameters, simulated in lockstep, see batch.py
+    iodir, options = tasks[0][0], tasks[0][3]
+    print("==============================")
+    print("Running batch:", ", ".join(config.getName() for _, config, _, _ in tasks))
+    core = BatchCore([config for _, config, _, _ in tasks], sharedTraces[iodir], options.get("start", 0))
+    clks = core.run()
+    time_difference = core.endTime - core.startTime
+    results = []
+    for (iodir, config, outputName, _), clk in zip(tasks, clks):
+        dataOutput = getResultLines(clk, str(int(time_difference // 60)), str(int(time_difference % 60)))
+        dataOutput.append("======================================")
+        print(config.getName())
+        for line in dataOutput:
+            print(line)
+        if outputName is not None:
+            dumpOutput(iodir, dataOutput, outputName)
+        results.append({"clk": clk, "output": dataOutput, "exact": True})
+    print("==============================")
+    return results
+
+
+def runUnit(tasks):
+    options = tasks[0][3]
+    journal = SweepJournal(options["journal"]) if options.get("journal") else None
+    if journal is not None:
+        # Another sweep sharing the journal may have finished the unit since this sweep started
+        journaled = journal.read()
+        results = [getReusableResult(journaled.get(getCacheKey(iodir, config, options)), options)
+                   for iodir, config, _, _ in tasks]
+        if all(result is not None for result in results):
+            for (iodir, config, outputName, _), result in zip(tasks, results):
+                reuseResult(iodir, config, outputName, result, options, "Journaled")
+            return results
+    results = [runConfig(tasks[0])] if len(tasks) == 1 else runBatch(tasks)
+    if journal is not None:
+        for task, result in zip(tasks, results):
+            journalResult(journal, task, result, options)
+    return results
+
+
+def journalResult(journal, task, result, options):
+    # Written as soon as the run finishes, so a sweep killed later keeps it. Lower bounds of pruned runs depend on
+    # the rest of the sweep and are left out, like in the result cache.
+    iodir, config = task[0], task[1]
+    if not result.get("pruned"):
+        journal.append(getCacheKey(iodir, config, options), os.path.basename(os.path.normpath(iodir)),
+                       config.getName(), result)
+
+
+def getReusableResult(result, options):
+    # A stored result (result cache or sweep journal) answers a run unless the run needs the simulation itself, the
+    # result was extrapolated for an exact run, or the run needs the counters the result was stored without
+    if result is None or any(options.get(name) for name in SIMULATION_OUTPUTS):
+        return None
+    if not (result.get("exact", True) or options.get("extrapolate")):
+        return None
+    if options.get("stats") and "stats" not in result:
+        return None
+    return result
+
+
+def reuseResult(iodir, config, outputName, result, options, source="Cached"):
+    print(source + ":", config.getName(), "- Clock Cycles:", result["clk"] - 1)
+    if outputName is not None:
+        dumpOutput(iodir, result["output"], outputName)
+        if options.get("stats"):
+            dumpStatistics(iodir, result["stats"], getStatisticsName(outputName))
+
+
+def getUnits(tasks, pending, options):
+    # Pending tasks simulated together. Batches need the plain core loop and random access to the trace, as their
+    # groups fetch from different positions once they split.
+    if not options.get("batch") or any(options.get(name) for name in INSTRUMENTATION) or \
+            options.get("checkpoint") is not None or options.get("resume"):
+        return [[index] for index in pending]
+    units = {}
+    for index in pending:
+        iodir, config, _ = tasks[index]
+        key = (iodir,) + getBatchKey(config) if not sharedTraces[iodir].streaming else index
+        units.setdefault(key, []).append(index)
+    return list(units.values())
+
+
+def getStatisticsName(outputName):
+    return outputName[:outputName.rindex(".")] + ".json"
+
+
+def getTimelineName(outputName):
+    return "Timeline" + outputName[len("Output"):outputName.rindex(".")]
+
+
+def getTelemetryName(outputName):
+    return "Telemetry" + outputName[len("Output"):outputName.rindex(".")] + ".json"
+
+
+def loadTraces(iodirs, streaming=False, bufferSize=4096, bankCounts=None, preprocess=True):
+    # Traces are decoded once here, for the bank counts of all of their configs, before the workers fork
+    for iodir in iodirs:
+        if iodir not in sharedTraces:
+            sharedTraces[iodir] = IMEM(iodir, streaming, bufferSize, preprocess)
+            sharedTraces[iodir].preprocessTrace((bankCounts or {}).get(iodir, ()))
+
+
+def getBankCounts(tasks):
+    bankCounts = {}
+    for iodir, config, _ in tasks:
+        bankCounts.setdefault(iodir, set()).add(config.numberOfBanks)
+    return {iodir: sorted(counts) for iodir, counts in bankCounts.items()}
+
+
+def getCheckpointKey(iodir, options):
+    return {"traceHash": sharedTraces[iodir].getHash(), "modelVersion": MODEL_VERSION, "start": options.get("start", 0)}
+
+
+def getCacheKey(iodir, config, options):
+    parameters = config.getParameters()
+    if options.get("start"):  # Runs starting mid-trace are different results
+        parameters["start"] = options["start"]
+    return ResultCache.getKey(sharedTraces[iodir].getHash(), parameters, MODEL_VERSION)
+
+
+def createPool(processes):
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork").Pool(processes)
+    return multiprocessing.Pool(processes, initializer=initWorker, initargs=(sharedTraces,))
+
+
+def runTasks(tasks, jobs=1, cache=None, options=None):
+    options = options or {}
+    # Results of the sweep journal and the cache are looked up in the parent, so only the misses are dispatched to
+    # the workers.
+    results = [None] * len(tasks)
+    journaled = SweepJournal(options["journal"]).read() if options.get("journal") else {}
+    if (cache is not None or journaled) and not any(options.get(name) for name in SIMULATION_OUTPUTS):
+        for index, (iodir, config, outputName) in enumerate(tasks):
+            key = getCacheKey(iodir, config, options)
+            source = "Journaled"
+            results[index] = getReusableResult(journaled.get(key), options)
+            if results[index] is None and cache is not None:
+                source = "Cached"
+                results[index] = getReusableResult(cache.get(key), options)
+            if results[index] is not None:
+                reuseResult(iodir, config, outputName, results[index], options, source)
+    pending = [index for index, result in enumerate(results) if result is None]
+    if options.get("prune") is not None or options.get("bounds"):
+        units = [[index] for index in pending]
+        simulated = runPrunedTasks(tasks, results, pending, jobs, options)
+    else:
+        units = getUnits(tasks, pending, options)
+        unitTasks = [[tasks[index] + (options,) for index in unit] for unit in units]
+        if jobs > 1 and len(units) > 1:
+            with createPool(min(jobs, len(units))) as pool, \
+                    TerminationForwarder(options.get("checkpoint") is not None):
+                simulated = pool.map(runUnit, unitTasks, chunksize=1)
+        else:
+            simulated = [runUnit(unit) for unit in unitTasks]
+
+    for index, result in zip([index for unit in units for index in unit],
+                             [result for unitResults in simulated for result in unitResults]):
+        results[index] = result
+        if cache is not None and not result.get("pruned"):  # A lower bound depends on the rest of the sweep
+            iodir, config, _ = tasks[index]
+            cache.put(getCacheKey(iodir, config, options), result)
+    if cache is not None:
+        cache.printReport()
+    return results
+
+
+def runPrunedTasks(tasks, results, pending, jobs, options):
+    # Branch and bound: the likely shortest runs go first, and every run is stopped once it is dominated by the
+    # results finished before it was started, see prune.py. With analytic lower bounds (options["bounds"], one per
+    # task, see bounds.py) tasks go in the order of their bound instead, and the ones whose bound is already above
+    # the best result of their trace are not simulated at all. Results are returned per pending task, like runUnit.
+    pruner = Pruner(options.get("prune") or 0.0)
+    for index, result in enumerate(results):
+        if result is not None:
+            pruner.add(tasks[index][0], tasks[index][1], result)
+    lowerBounds = options.get("bounds")
+    order = sorted(pending, key=lambda index: lowerBounds[index]) if lowerBounds else getOrder(tasks, pending)
+    taskOptions = dict(options, bounds=None)
+    journal = SweepJournal(options["journal"]) if options.get("journal") else None
+    simulated = {}
+
+    def getTask(index):
+        iodir, config, _ = tasks[index]
+        limit = pruner.getLimit(iodir, config) if options.get("prune") is not None else None
+        return tasks[index] + (dict(taskOptions, maxCycles=limit),)
+
+    def isBounded(index):
+        best = pruner.getBest(tasks[index][0])
+        return lowerBounds is not None and best is not None and lowerBounds[index] > best - 1
+
+    def finish(index, result):
+        simulated[index] = result
+        if not isinstance(result, Exception):
+            pruner.add(tasks[index][0], tasks[index][1], result)
+            if journal is not None:
+                journalResult(journal, tasks[index], result, options)
+
+    if jobs > 1 and len(order) > 1:
+        # Tasks are handed out one at a time as workers free up, so that each starts with the latest bounds
+        finished = queue.Queue()
+        with createPool(min(jobs, len(order))) as pool, TerminationForwarder(options.get("checkpoint") is not None):
+            running = 0
+            for index in order:
+                if running == jobs:
+                    finish(*finished.get())
+                    running -= 1
+                if isBounded(index):
+                    finish(index, getBoundedResult(tasks[index], lowerBounds[index]))
+                    continue
+                pool.apply_async(runConfig, (getTask(index),),
+                                 callback=lambda result, index=index: finished.put((index, result)),
+                                 error_callback=lambda error, index=index: finished.put((index, error)))
+                running += 1
+            while running:
+                finish(*finished.get())
+                running -= 1
+    else:
+        for index in order:
+            if isBounded(index):
+                finish(index, getBoundedResult(tasks[index], lowerBounds[index]))
+            else:
+                finish(index, runConfig(getTask(index)))
+    pruner.printReport()
+    for result in simulated.values():
+        if isinstance(result, Exception):
+            raise result
+    return [[simulated[index]] for index in pending]
+
+
+def getBoundedResult(task, lowerBound):
+    # Result of a config skipped on its analytic lower bound, which is all that is known of its cycles
+    iodir, config, outputName = task
+    dataOutput = ["================RESULT================",
+                  "Clock Cycles: >= " + str(lowerBound) + " (skipped, analytic bound)",
+                  "======================================"]
+    print("Skipped:", config.getName(), "- Clock Cycles: >=", lowerBound)
+    if outputName is not None:
+        dumpOutput(iodir, dataOutput, outputName)
+    return {"clk": lowerBound + 1, "output": dataOutput, "exact": False, "pruned": True}
+
+
+def getSweepName(iodir, configDir):
+    # The configs of the IO directory itself keep the original output names, other config sets get a suffix.
+    if os.path.abspath(configDir) == os.path.abspath(iodir):
+        return ""
+    return "_" + os.path.basename(os.path.normpath(configDir))
+
+
+def runSweep(iodirs, configDirs=None, jobs=1, cache=None, options=None):
+    options = options or {}
+    sweeps = []
+    tasks = []
+    for iodir in iodirs:
+        for configDir in (configDirs or [iodir]):
+            name = getSweepName(iodir, configDir)
+            files = readFiles(configDir)
+            sweeps.append((iodir, name, files, len(tasks)))
+            tasks += [(iodir, Config(configDir, fileName), "Output" + str(index + 1) + name + ".txt")
+                      for index, fileName in enumerate(files)]
+    loadTraces(iodirs, options.get("stream", False), options.get("buffer", 4096), getBankCounts(tasks),
+               options.get("preprocess", True))
+
+    results = runTasks(tasks, jobs, cache, options)
+
+    # Summaries are written per (iodir, config set) in the original config order, whatever order the workers finished.
+    for iodir, name, files, start in sweeps:
+        cycles = [fileName[:fileName.index(".")] + " " + formatCycles(results[start + index])
+                  for index, fileName in enumerate(files)]
+        dumpSummary(iodir, cycles, "Summary" + name + ".txt")
+    return list(zip(tasks, results))
+
+
+def getResultsPath(iodir, filepath=None):
+    # Results go to Results.db in their IO directory unless one database is given for all of them
+    return filepath or os.path.join(iodir, "Results.db")
+
+
+def storeResults(completed, options=None, filepath=None):
+    options = options or {}
+    stores = {}
+    traces = set()
+    for (iodir, config, _), result in completed:
+        path = getResultsPath(iodir, filepath)
+        if path not in stores:
+            stores[path] = ResultsStore(path, Config.PARAMETERS)
+        preprocessed = sharedTraces[iodir].preprocessed
+        if preprocessed is not None and (path, iodir) not in traces:  # Features for the surrogate model
+            traces.add((path, iodir))
+            stores[path].addTrace(os.path.basename(os.path.normpath(iodir)), preprocessed.hash,
+                                  preprocessed.getFeatures())
+        stores[path].add(os.path.basename(os.path.normpath(iodir)), sharedTraces[iodir].getHash(), config.getName(),
+                         config.getParameters(), result, MODEL_VERSION, options.get("start", 0))
+    for store in stores.values():
+        store.commit()
+        store.exportCsv()
+        store.close()
+
+
 def parseArguments():
     parser = argparse.ArgumentParser(
         description='Vector Core Performance Model')
-    parser.add_argument('--iodir', default="IODir1", type=str,
-                        help='Path to the folder containing the input files - resolved data')
+    parser.add_argument('--iodir', default=["IODir1"], type=str, nargs='+',
+                        help='Path to the folder containing the input files - resolved data. Several folders can be '
+                             'given to sweep all of them')
+    parser.add_argument('--configdir', default=None, type=str, nargs='+',
+                        help='Folders containing the ConfigN.txt sets to run against every iodir, defaults to the '
+                             'configs inside each iodir')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of configurations simulated in parallel')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream Data.txt through a bounded buffer instead of loading the whole trace')
+    parser.add_argument('--buffer', default=4096, type=int,
+                        help='Number of instructions buffered ahead of fetch when streaming')
+    parser.add_argument('--no-preprocess', dest='preprocess', action='store_false',
+                        help='Decode the trace during every run instead of once into Data.txt.pre next to it')
+    parser.add_argument('--batch', action='store_true',
+                        help='Simulate configs that only differ in latencies in lockstep, sharing fetch and decode')
+    parser.add_argument('--prune', default=None, type=float, metavar='MARGIN',
+                        help='Run the likely shortest configs first and stop a config once its cycles exceed by MARGIN '
+                             '(a fraction, negative to require an improvement) the best finished config that is '
+                             'comparable or cheaper in lanes, banks and queue depths. Stopped configs are reported as '
+                             '>=N lower bounds')
+    parser.add_argument('--start', default=0, type=int,
+                        help='Index of the instruction the simulation starts at')
+    parser.add_argument('--stats', action='store_true',
+                        help='Collect microarchitectural counters and write them to OutputN.json')
+    parser.add_argument('--timeline', default=None, type=int, nargs='*', metavar=('START', 'END'),
+                        help='Record the fetch, issue, dispatch and completion cycle of every instruction fetched '
+                             'between the START and END cycles (the whole run without them) and write them to '
+                             'TimelineN.trace.json (Chrome trace events) and TimelineN.npz')
+    parser.add_argument('--timeline-limit', default=None, type=int,
+                        help='Keep only the last N completed instructions of the timeline')
+    parser.add_argument('--critical-path', action='store_true',
+                        help='Attribute the stalls of every instruction and write the critical path, by reason, '
+                             'opcode and Code.asm line (from Lines.txt), to CriticalPathN.txt')
+    parser.add_argument('--telemetry', default=None, type=int, metavar='CYCLES',
+                        help='Sample queue depths, pipeline states and busy banks every CYCLES cycles and write the '
+                             'series to TelemetryN.json, plotted by telemetry.py')
+    parser.add_argument('--telemetry-samples', default=4096, type=int,
+                        help='Samples kept before neighbouring ones are merged and the interval doubles')
+    parser.add_argument('--progress', default=None, type=float, metavar='SECONDS',
+                        help='Print a heartbeat with the simulated cycles, speed and ETA every SECONDS seconds, and '
+                             'the host time spent in every stage at the end')
+    parser.add_argument('--extrapolate', action='store_true',
+                        help='Skip the repeated iterations of loops once the core reaches a periodic steady state')
+    parser.add_argument('--results', default=None, type=str,
+                        help='SQLite results database shared by all iodirs, defaults to Results.db in each iodir. '
+                             'The table is also exported as CSV next to it')
+    parser.add_argument('--journal', default=None, type=str,
+                        help='Append-only journal of the finished runs, shared safely by concurrent sweeps. Runs '
+                             'already in it are not simulated again, so a sweep restarted with the same journal '
+                             'only runs the missing points')
+    parser.add_argument('--checkpoint', default=None, type=int, metavar='CYCLES',
+                        help='Save the state of every run to Checkpoints in the iodir every CYCLES cycles (0 for '
+                             'never) and when the process receives SIGTERM, which then stops it')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume every run from its latest checkpoint, if it has one')
+    parser.add_argument('--keep-checkpoints', action='store_true',
+                        help='Keep all checkpoints of a completed run, e.g. for sampling.py --checkpoints, instead of '
+                             'only its latest one')
+    addCacheArguments(parser)
     args = parser.parse_args()
-    return os.path.abspath(args.iodir)
-
-#
-# def plotData(iodir, x, y, xlabel):
-#     fig, ax = plt.subplots()
-#
-#     # Plot the data on the axis
-#     ax.plot(x, y, '-o')
-#
-#     # Add labels to the axis and a title to the figure
-#     ax.set_xlabel(xlabel)
-#     ax.set_ylabel('Clock Cycles')
-#     ax.set_title('Clock Cycles vs ' + xlabel)
-#     ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-#     ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-#     filePath = os.path.abspath(
-#         os.path.join(iodir, os.path.join("Plots", "fcLayer_" + xlabel.replace(' ', '_') + ".png")))
-#     fig.savefig(filePath)
-#     # fig.savefig("dotPdtPlots_" + xlabel.replace(' ', '_') + ".png")
-#     plt.show()
-#
-#
-# def plotSubPlot(iodir, x, y):
-#     # Create a new figure and a grid of subplots with 3 rows and 1 column
-#     fig, axs = plt.subplots(nrows=2, ncols=2, figsize=(10, 10))
-#     # Plot the data on the subplots
-#     axs[0][0].plot(x[0:4], y[0:4])
-#     axs[0][0].set_title('Clk Cycles vs ' + "Number of Vector Banks")
-#     axs[0][0].set_xlabel("Number of Vector Banks")
-#
-#     axs[0][1].plot(x[4:8], y[4:8])
-#     axs[0][1].set_title('Clk Cycles vs ' + "Compute Queue Depth")
-#     axs[0][1].set_xlabel("Compute Queue Depth")
-#
-#     axs[1][0].plot(x[8:12], y[8:12])
-#     axs[1][0].set_title('Clk Cycles vs ' + "Data Queue Depth")
-#     axs[1][0].set_xlabel("Data Queue Depth")
-#
-#     axs[1][1].plot(x[12:], y[12:])
-#     axs[1][1].set_title('Clk Cycles vs ' + "Number of Lanes")
-#     axs[1][1].set_xlabel("Number of Lanes")
-#
-#     for a in axs:
-#         for ax in a:
-#             ax.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-#             ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-#             ax.set_ylabel('Performance')
-#
-#     # Adjust the layout of the subplots
-#     fig.tight_layout()
-#     figManager = plt.get_current_fig_manager()
-#     figManager.full_screen_toggle()
-#     filePath = os.path.abspath(
-#         os.path.join(iodir, os.path.join("Plots", "fcLayer.png")))
-#     fig.savefig(filePath, bbox_inches='tight')
-#     # Show the plot
-#     plt.show()
+    args.iodir = [os.path.abspath(iodir) for iodir in args.iodir]
+    if (args.checkpoint is not None or args.resume) and \
+            (args.extrapolate or args.stats or args.timeline is not None or args.critical_path or args.telemetry or
+             args.progress):
+        raise SystemExit("--checkpoint and --resume need runs without --extrapolate, --stats, --timeline, "
+                         "--critical-path, --telemetry and --progress")
+    if args.configdir is not None:
+        args.configdir = [os.path.abspath(configDir) for configDir in args.configdir]
+    return args
+
+
+def getTimelineRange(args):
+    if args.timeline is None:
+        return None
+    if len(args.timeline) > 2:
+        raise SystemExit("--timeline takes at most a START and an END cycle")
+    start = args.timeline[0] if len(args.timeline) > 0 else 0
+    end = args.timeline[1] if len(args.timeline) > 1 else None
+    return start, end, args.timeline_limit
 
 
 if __name__ == "__main__":
-    iodir = parseArguments()
-    txt_files = readFiles(iodir)
-    imem = IMEM(iodir)
-    cycles = []
-    # noOfCycels = []
-    for index, fileName in enumerate(txt_files):
-        print("==============================")
-        print("Running:", fileName)
-        config = Config(iodir, fileName)
-        core = Core(config, imem, iodir)
-        core.run()
-        core.printResult()
-        core.dumpResult("Output" + str(index + 1) + ".txt")
-        print("==============================")
-        cycles.append(fileName[:fileName.index(".")] + " " + str(core.clk))
-        # noOfCycels.append(core.clk)
-    # plotData(iodir, [32, 16, 8, 4], noOfCycels[:4], "Number of Vector Memory Banks")
-    # plotData(iodir, [16, 8, 4, 2], noOfCycels[4:8], "Depth of Compute Queue")
-    # plotData(iodir, [16, 8, 4, 2], noOfCycels[8:12], "Depth of Data Queue")
-    # plotData(iodir, [32, 16, 8, 4, 2], noOfCycels[12:], "Number of Lanes")
-    # plotSubPlot(iodir,[32, 16, 8, 4, 16, 8, 4, 2, 16, 8, 4, 2, 32, 16, 8, 4, 2], noOfCycels)
-    dumpSummary(iodir, cycles)
+    args = parseArguments()
+    options = {"extrapolate": args.extrapolate, "stream": args.stream, "buffer": args.buffer, "start": args.start,
+               "stats": args.stats, "timeline": getTimelineRange(args), "criticalPath": args.critical_path,
+               "telemetry": (args.telemetry, args.telemetry_samples) if args.telemetry else None,
+               "progress": args.progress, "preprocess": args.preprocess,
+               "batch": args.batch, "prune": args.prune, "checkpoint": args.checkpoint, "resume": args.resume,
+               "keepCheckpoints": args.keep_checkpoints, "journal": args.journal}
+    completed = runSweep(args.iodir, args.configdir, args.jobs, openCache(args), options)
+    storeResults(completed, options, args.results)
@@ -0,0 +1,150 @@
+import argparse
+import os
+import pickle
+import time
+
+from main import Config, Core, createPool, dumpOutput, loadTraces, sharedTraces
+
+
+def getStateKey(state):
+    # Everything but the clock: two cores with the same key take the same cycles from there on
+    state = dict(state)
+    del state["clk"]
+    return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def simulateSegment(task):
+    # Cycles from fetch reaching start to fetch reaching end (the end of the run for the last segment) and the state
+    # at end. Without a state the core starts cold `warmup` instructions before start.
+    iodir, config, start, end, warmup, state = task
+    imem = sharedTraces[iodir]
+    if state is None:
+        core = Core(config, imem, iodir, max(0, start - warmup))
+        core.runUntil(start)
+    else:
+        core = Core(config, imem, iodir, start)
+        core.setState(state)
+    clk = core.clk
+    if end < len(imem.instructions):
+        core.runUntil(end)
+        core.closeTrace()
+        return core.clk - clk, core.getState()
+    core.run()
+    return core.clk - clk, None
+
+
+class ParallelSimulation:
+    # Parallel in time: the trace is cut into contiguous segments simulated in their own process, each starting
+    # `warmup` instructions early from an empty core to fill the queues, busy boards and banks, and the cycles of
+    # the segments are added up. The second pass resimulates every segment from the end state the first pass
+    # reached in the segment before it. A segment whose start state is exact is exact, and the first one always is,
+    # so the pass also shows which segments are: as long as a segment ends in the same state in both passes, the
+    # state the next one started from was exact.
+    def __init__(self, iodir, config, segments=8, warmup=500):
+        self.iodir = iodir
+        self.config = config
+        self.warmup = warmup
+        length = len(sharedTraces[iodir].instructions)
+        segments = max(1, min(segments, length))
+        self.boundaries = [length * index // segments for index in range(segments + 1)]
+        self.segments = list(zip(self.boundaries[:-1], self.boundaries[1:]))
+        self.cycles = None  # Per segment, first pass
+        self.corrected = None  # Per segment, second pass
+        self.exactSegments = None  # Leading segments known exact after the second pass
+        self.seconds = []  # Host time of every pass
+
+    def runPass(self, tasks, jobs):
+        startTime = time.time()
+        if jobs > 1 and len(tasks) > 1:
+            with createPool(min(jobs, len(tasks))) as pool:
+                results = pool.map(simulateSegment, tasks, chunksize=1)
+        else:
+            results = [simulateSegment(task) for task in tasks]
+        self.seconds.append(time.time() - startTime)
+        return results
+
+    def run(self, jobs=1, correct=False):
+        results = self.runPass([(self.iodir, self.config, start, end, self.warmup, None)
+                                for start, end in self.segments], jobs)
+        self.cycles = [cycles for cycles, _ in results]
+        if not correct:
+            return
+        states = [state for _, state in results]
+        # The first segment already started from the beginning of the trace
+        corrected = self.runPass([(self.iodir, self.config, start, end, 0, states[index])
+                                  for index, (start, end) in enumerate(self.segments[1:])], jobs)
+        self.corrected = self.cycles[:1] + [cycles for cycles, _ in corrected]
+        self.exactSegments = min(2, len(self.segments))
+        for first, (_, second) in zip(states[1:], corrected):
+            if self.exactSegments == len(self.segments) or second is None or \
+                    getStateKey(first) != getStateKey(second):
+                break
+            self.exactSegments += 1
+
+    def getEstimate(self):
+        return sum(self.corrected if self.corrected is not None else self.cycles)
+
+    def getReport(self, actual=None, actualSeconds=None):
+        report = ["================PARALLEL================",
+                  "Segments: " + str(len(self.segments)) + " of about " + str(self.boundaries[1]) +
+                  " instructions, warm-up " + str(self.warmup),
+                  "First Pass Clock Cycles: " + str(sum(self.cycles)) + " (" + "{:.1f}".format(self.seconds[0]) + "s)"]
+        if self.corrected is not None:
+            correction = sum(self.corrected) - sum(self.cycles)
+            report.append("Second Pass Clock Cycles: " + str(sum(self.corrected)) + " (" +
+                          "{:.1f}".format(self.seconds[1]) + "s)")
+            report.append("Boundary Correction: " + "{:+d}".format(correction) + " (" +
+                          "{:+.3f}".format(100 * correction / sum(self.corrected)) + "%)")
+            report.append("Exact Segments: " + str(self.exactSegments) + " of " + str(len(self.segments)) +
+                          (", Exact: Yes" if self.exactSegments == len(self.segments) else ", Exact: No"))
+        report += ["Segment " + str(index + 1) + ": " + str(start) + " - " + str(end) + " " + str(cycles) +
+                   ("" if self.corrected is None else " -> " + str(self.corrected[index]))
+                   for index, ((start, end), cycles) in enumerate(zip(self.segments, self.cycles))]
+        if actual is not None:
+            report.append("Detailed Clock Cycles: " + str(actual) + " (" + "{:.1f}".format(actualSeconds) + "s)")
+            report.append("First Pass Error: " + "{:.3f}".format(100 * (sum(self.cycles) - actual) / actual) + "%")
+            if self.corrected is not None:
+                report.append("Second Pass Error: " + "{:.3f}".format(100 * (sum(self.corrected) - actual) / actual) +
+                              "%")
+        report.append("======================================")
+        return report
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Vector Core Parallel in Time Performance Model')
+    parser.add_argument('--iodir', default="IODir1", type=str,
+                        help='Path to the folder containing the input files - resolved data')
+    parser.add_argument('--config', default="Config1.txt", type=str,
+                        help='Config file inside the iodir to simulate')
+    parser.add_argument('--segments', default=8, type=int,
+                        help='Number of contiguous segments the trace is cut into')
+    parser.add_argument('--warmup', default=500, type=int,
+                        help='Number of instructions simulated before a segment to warm up the core')
+    parser.add_argument('--correct', action='store_true',
+                        help='Second pass resimulating every segment from the end state of the one before it')
+    parser.add_argument('--jobs', default=None, type=int,
+                        help='Number of segments simulated in parallel, defaults to the number of segments')
+    parser.add_argument('--verify', action='store_true',
+                        help='Also run the full detailed simulation and report the error of the stitched cycles')
+    args = parser.parse_args()
+    args.iodir = os.path.abspath(args.iodir)
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    loadTraces([args.iodir])
+    config = Config(args.iodir, args.config)
+    parallel = ParallelSimulation(args.iodir, config, args.segments, args.warmup)
+    parallel.run(args.jobs or args.segments, args.correct)
+    actual = actualSeconds = None
+    if args.verify:
+        core = Core(config, sharedTraces[args.iodir], args.iodir)
+        core.run()
+        actual = core.clk - 1
+        actualSeconds = core.endTime - core.startTime
+    report = parallel.getReport(actual, actualSeconds)
+    for line in report:
+        print(line)
+    dumpOutput(args.iodir, report, "Parallel_" + config.getName() + ".txt")
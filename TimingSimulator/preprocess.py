@@ -0,0 +1,157 @@
+import math
+import os
+import pickle
+
+from computeEngine import ComputeEngine
+from decode import Decode
+
+# Version of the preprocessed format, bump it whenever Decode changes what it extracts from a line.
+VERSION = 2
+
+PIPELINE_SCALAR = "scalar"
+PIPELINE_DATA = "data"
+
+
+def getPipeline(decoded):
+    kind = decoded[Decode.INSTR_TYPE]
+    if kind == Decode.INSTR_DATA:
+        return PIPELINE_DATA
+    if kind == Decode.INSTR_COMPUTE:
+        name = decoded[Decode.INSTR_NAME]
+        if name in ComputeEngine.addPipelineInstr:
+            return "add"
+        if name in ComputeEngine.mulPipelineInstr:
+            return "mul"
+        return "div"
+    return PIPELINE_SCALAR
+
+
+def getProducers(decoded):
+    # Dependencies of every instruction, which do not depend on the configuration: the trace indices of the last
+    # instructions before it writing its source registers (RAW) and its destination register (WAW). Registers
+    # nothing wrote yet have no producer.
+    producers = []
+    scalarWriters = {}
+    vectorWriters = {}
+    for index, instr in enumerate(decoded):
+        raw = [scalarWriters.get(register) for register in instr.get(Decode.INSTR_SSRC) or []] + \
+            [vectorWriters.get(register) for register in instr.get(Decode.INSTR_VSRC) or []]
+        waw = [scalarWriters.get(instr.get(Decode.INSTR_SDEST)), vectorWriters.get(instr.get(Decode.INSTR_VDEST))]
+        producers.append((tuple(producer for producer in raw if producer is not None),
+                          tuple(producer for producer in waw if producer is not None)))
+        if instr.get(Decode.INSTR_SDEST) is not None:
+            scalarWriters[instr[Decode.INSTR_SDEST]] = index
+        if instr.get(Decode.INSTR_VDEST) is not None:
+            vectorWriters[instr[Decode.INSTR_VDEST]] = index
+    return producers
+
+
+class PreprocessedTrace(object):
+    # Everything a timing run derives from the trace alone: the decoded instructions, their pipeline class, the
+    # producer of every source operand and the bank of every address for the bank counts in use. It is computed
+    # once per trace, shared by every config of a sweep and persisted next to the trace, keyed by its hash.
+    def __init__(self, instructions, traceHash):
+        self.hash = traceHash
+        self.decoded = [Decode.decodeInstruction(line) for line in instructions]
+        self.pipelines = [getPipeline(instr) for instr in self.decoded]
+        self.producers = getProducers(self.decoded)
+        self.residues = {}  # number of banks: tuple of the banks of every address, None for non memory instructions
+        self.records = {}  # number of banks: decoded instructions ready for Decode, built on demand
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["records"] = {}
+        return state
+
+    def addBankCount(self, numberOfBanks):
+        # Returns whether the residues were missing
+        if numberOfBanks in self.residues:
+            return False
+        self.residues[numberOfBanks] = [
+            tuple(address % numberOfBanks for address in instr[Decode.INSTR_ADDRESS])
+            if Decode.INSTR_ADDRESS in instr else None for instr in self.decoded]
+        return True
+
+    def getFeatures(self):
+        # Config independent summary of the trace for the surrogate model (surrogate.py): the opcode mix, the vector
+        # length of the compute instructions, the addresses per data instruction and a histogram of the strides
+        # between the addresses of a data instruction (unit, constant, irregular).
+        counts = dict.fromkeys([PIPELINE_SCALAR, PIPELINE_DATA, "add", "mul", "div"], 0)
+        strides = {"unit": 0, "constant": 0, "irregular": 0}
+        vectorLength = 64  # Same default as Fetch
+        vectorLengths = 0
+        addresses = 0
+        for instr, pipeline in zip(self.decoded, self.pipelines):
+            counts[pipeline] += 1
+            if pipeline == PIPELINE_SCALAR:
+                if instr[Decode.INSTR_NAME] == 'MTCL':
+                    vectorLength = int(instr[Decode.INSTR_ARGS][-1])
+            elif pipeline == PIPELINE_DATA:
+                address = instr[Decode.INSTR_ADDRESS]
+                addresses += len(address)
+                distances = set(abs(second - first) for first, second in zip(address, address[1:]))
+                if len(distances) > 1:
+                    strides["irregular"] += 1
+                elif distances and distances != {1}:
+                    strides["constant"] += 1
+                else:
+                    strides["unit"] += 1
+            else:
+                vectorLengths += vectorLength
+        instructions = max(1, len(self.decoded))
+        compute = counts["add"] + counts["mul"] + counts["div"]
+        features = {"instructions": math.log2(instructions),
+                    "vectorLength": math.log2(vectorLengths / compute) if compute else 0.0,
+                    "addresses": math.log2(1 + addresses / counts[PIPELINE_DATA]) if counts[PIPELINE_DATA] else 0.0}
+        features.update(("mix." + name, count / instructions) for name, count in counts.items())
+        features.update(("stride." + name, count / max(1, counts[PIPELINE_DATA])) for name, count in strides.items())
+        return features
+
+    def getRecords(self, numberOfBanks):
+        # The data engine only uses an address to find its bank, so memory instructions carry the banks instead
+        records = self.records.get(numberOfBanks)
+        if records is None:
+            self.addBankCount(numberOfBanks)
+            records = []
+            for instr, residues in zip(self.decoded, self.residues[numberOfBanks]):
+                if residues is not None:
+                    instr = dict(instr)
+                    instr[Decode.INSTR_ADDRESS] = residues
+                records.append(instr)
+            self.records[numberOfBanks] = records
+        return records
+
+
+def getPreprocessedPath(traceFile):
+    return traceFile + ".pre"
+
+
+def loadPreprocessed(traceFile, instructions, traceHash, bankCounts=()):
+    filepath = getPreprocessedPath(traceFile)
+    trace = None
+    try:
+        with open(filepath, 'rb') as inf:
+            version, trace = pickle.load(inf)
+        if version != VERSION or trace.hash != traceHash:
+            trace = None
+    except Exception:  # Only a cache, whatever is wrong with it is decoded again, e.g. a stale or foreign pickle
+        trace = None
+
+    changed = trace is None
+    if trace is None:
+        trace = PreprocessedTrace(instructions, traceHash)
+        print("Preprocess - Decoded", len(trace.decoded), "instructions of", traceFile)
+    for numberOfBanks in bankCounts:
+        changed = trace.addBankCount(numberOfBanks) or changed
+    if changed:
+        try:
+            temporary = filepath + ".tmp"
+            with open(temporary, 'wb') as opf:
+                pickle.dump((VERSION, trace), opf, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, filepath)
+            print("Preprocess - Saved preprocessed trace in path:", filepath)
+        except OSError:
+            print("Preprocess - ERROR: Couldn't save preprocessed trace in path:", filepath)
+    else:
+        print("Preprocess - Loaded preprocessed trace from path:", filepath)
+    return trace
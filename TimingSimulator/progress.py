@@ -0,0 +1,108 @@
+import time
+
+from status import Status
+
+STAGES = ["fetch", "decode", "compute", "data"]
+
+
+class Progress:
+    # Host side view of a run: a heartbeat every `interval` seconds with the simulated cycles, the completed
+    # instructions, the simulation speed and an ETA from the trace position, and at the end the host time spent in
+    # every stage of the core. The stage timers wrap the run methods of the stages, so the plain loop is untouched
+    # when progress is off.
+    CHECK_CYCLES = 1024  # Cycles between two looks at the host clock
+
+    def __init__(self, name="", interval=5.0, listener=None):
+        self.name = name
+        self.interval = interval
+        self.listener = listener  # Called with every heartbeat instead of printing it, see asyncApi.py
+        self.hostTime = dict.fromkeys(STAGES, 0.0)
+        self.countdown = Progress.CHECK_CYCLES
+        self.startTime = None
+        self.nextHeartbeat = None
+        self.startClk = 0
+        self.startAddr = 0
+
+    def attach(self, core):
+        core.fetch.run = self.timeStage("fetch", core.fetch.run)
+        core.decode.run = self.timeStage("decode", core.decode.run)
+        core.compute.run = self.timeStage("compute", core.compute.run)
+        core.data.run = self.timeStage("data", core.data.run)
+        self.startTime = time.perf_counter()
+        self.nextHeartbeat = self.startTime + self.interval
+        self.startClk = core.clk
+        self.startAddr = core.fetch.addr
+
+    def timeStage(self, name, run):
+        hostTime = self.hostTime
+
+        def timed(*args):
+            start = time.perf_counter()
+            result = run(*args)
+            hostTime[name] += time.perf_counter() - start
+            return result
+
+        return timed
+
+    def cycle(self, core, instr, issued, computeInstr, dataInstr, scalarInstr):
+        self.countdown -= 1
+        if self.countdown:
+            return
+        self.countdown = Progress.CHECK_CYCLES
+        now = time.perf_counter()
+        if now >= self.nextHeartbeat:
+            self.nextHeartbeat = now + self.interval
+            heartbeat = self.getHeartbeat(core, now)
+            if self.listener is not None:
+                self.listener(heartbeat)
+            else:
+                self.printHeartbeat(heartbeat)
+
+    def getCompleted(self, core):
+        # Fetched instructions that left the window and the queues and are not executing anymore
+        decode = core.decode
+        executing = sum(1 for status in core.compute.getPipelineStatus() + (core.data.getStatus(),)
+                        if status == Status.BUSY)
+        waiting = len(decode.priorityQueue) + len(decode.computeQueue) + len(decode.dataQueue) + len(decode.scalarQueue)
+        return core.fetch.addr - self.startAddr - waiting - executing
+
+    def getHeartbeat(self, core, now):
+        # The trace fraction and the ETA in seconds are None for streamed traces, which don't know their length
+        elapsed = now - self.startTime
+        heartbeat = {"cycles": core.clk - 1, "instructions": self.getCompleted(core),
+                     "speed": (core.clk - self.startClk) / elapsed, "trace": None, "eta": None}
+        try:
+            length = len(core.fetch.instrMem)
+        except TypeError:
+            length = None
+        if length:
+            heartbeat["trace"] = (core.fetch.addr - self.startAddr) / max(1, length - self.startAddr)
+            if heartbeat["trace"] > 0:
+                heartbeat["eta"] = elapsed * (1 - heartbeat["trace"]) / heartbeat["trace"]
+        return heartbeat
+
+    def printHeartbeat(self, heartbeat):
+        line = "Progress" + (" " + self.name if self.name else "") + " - Cycles: " + str(heartbeat["cycles"]) + \
+               ", Instructions: " + str(heartbeat["instructions"]) + \
+               ", Speed: " + str(int(heartbeat["speed"])) + " cycles/s"
+        if heartbeat["trace"] is not None:
+            line += ", Trace: " + "{:.1f}".format(100 * heartbeat["trace"]) + "%"
+            if heartbeat["eta"] is not None:
+                line += ", ETA: " + formatSeconds(heartbeat["eta"])
+        print(line)
+
+    def printReport(self, core):
+        elapsed = time.perf_counter() - self.startTime
+        print("Host Time" + (" " + self.name if self.name else "") + " - " + formatSeconds(elapsed) + ", " +
+              str(int((core.clk - self.startClk) / max(elapsed, 1e-9))) + " cycles/s")
+        other = elapsed - sum(self.hostTime.values())
+        for name, seconds in list(self.hostTime.items()) + [("loop and instrumentation", other)]:
+            print("  " + name + ": " + "{:.2f}".format(seconds) + "s (" +
+                  "{:.1f}".format(100 * seconds / max(elapsed, 1e-9)) + "%)")
+
+
+def formatSeconds(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return str(seconds // 3600) + "h " + str(seconds % 3600 // 60) + "m"
+    return str(seconds // 60) + "m " + str(seconds % 60) + "s"
@@ -0,0 +1,60 @@
+import math
+
+# Parameters costing hardware. A config needing no more of any of them than another is comparable or cheaper, the
+# latencies are not counted as cost.
+RESOURCE_PARAMETERS = ["numLanes", "vdmNumBanks", "dataQueueDepth", "computeQueueDepth"]
+LATENCY_PARAMETERS = ["vlsPipelineDepth", "pipelineDepthAdd", "pipelineDepthMul", "pipelineDepthDiv", "bankBusyTime"]
+
+
+def getResources(config):
+    parameters = config.getParameters()
+    return tuple(parameters[name] for name in RESOURCE_PARAMETERS)
+
+
+def getOrder(tasks, indices):
+    # Cheapest first, by the total of the log2 resources, so every config runs after the comparable or cheaper configs
+    # that bound it. Within a resource class the shortest latencies go first, the fastest of the class then bounds
+    # the rest of it.
+    def key(index):
+        parameters = tasks[index][1].getParameters()
+        return (sum(math.log2(max(1, parameters[name])) for name in RESOURCE_PARAMETERS),
+                tuple(parameters[name] for name in RESOURCE_PARAMETERS),
+                sum(parameters[name] for name in LATENCY_PARAMETERS))
+
+    return sorted(indices, key=key)
+
+
+def formatCycles(result):
+    # Lower bounds of stopped runs as >=N, surrogate predictions of points that were not simulated as ~N
+    return (">=" if result.get("pruned") else "~" if result.get("predicted") else "") + str(result["clk"])
+
+
+class Pruner(object):
+    # Exact results finished so far, per trace. A config is dominated once its cycles exceed by `margin` (a fraction,
+    # negative to require an improvement) the best of the finished configs that are comparable or cheaper, so its
+    # run can be stopped there and recorded as a lower bound.
+    def __init__(self, margin=0.0):
+        self.margin = margin
+        self.finished = {}  # iodir: list of (resources, clk)
+        self.pruned = 0
+
+    def add(self, iodir, config, result):
+        if result.get("pruned"):
+            self.pruned += 1
+        elif result.get("exact", True):  # Extrapolated cycles are not a safe bound
+            self.finished.setdefault(iodir, []).append((getResources(config), result["clk"]))
+
+    def getLimit(self, iodir, config):
+        resources = getResources(config)
+        bounds = [clk for cheaper, clk in self.finished.get(iodir, [])
+                  if all(value <= other for value, other in zip(cheaper, resources))]
+        if not bounds:
+            return None
+        return int(min(bounds) * (1 + self.margin))
+
+    def getBest(self, iodir):
+        finished = self.finished.get(iodir)
+        return min(clk for _, clk in finished) if finished else None
+
+    def printReport(self):
+        print("Pruner -", self.pruned, "configs stopped early or skipped")
@@ -0,0 +1,49 @@
+import argparse
+import os
+
+from main import Config, getBankCounts, loadTraces, readFiles, runTasks
+
+# This file verifies --prune on a config sweep: the sweep is run with and without pruning, every stopped config must
+# have a lower bound at most its actual cycles, every other config the same cycles, and at least one config must be
+# stopped, else the order of the runs never lets a cheaper config bound a more expensive one.
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Verification of the pruning of config sweeps')
+    parser.add_argument('--iodir', default="IODir1", type=str,
+                        help='Path to the folder containing the resolved data and the configs')
+    parser.add_argument('--margin', default=0.0, type=float,
+                        help='Pruning margin, as in main.py --prune')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of configs simulated in parallel')
+    args = parser.parse_args()
+    args.iodir = os.path.abspath(args.iodir)
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    tasks = [(args.iodir, Config(args.iodir, fileName), None) for fileName in readFiles(args.iodir)]
+    loadTraces([args.iodir], bankCounts=getBankCounts(tasks))
+    print("=========RUNNING SIMULATOR========")
+    full = runTasks(tasks, args.jobs)
+    pruned = runTasks(tasks, args.jobs, options={"prune": args.margin})
+
+    print("==============RESULT==============")
+    failures = 0
+    stopped = 0
+    for (_, config, _), actual, result in zip(tasks, full, pruned):
+        if result.get("pruned"):
+            stopped += 1
+            valid = result["clk"] <= actual["clk"]
+        else:
+            valid = result["clk"] == actual["clk"]
+        failures += not valid
+        print(config.getName(), actual["clk"] - 1, (">=" if result.get("pruned") else "") + str(result["clk"] - 1) +
+              ("" if valid else " - WRONG"))
+    print("Stopped:", stopped, "of", len(tasks))
+    if failures or not stopped:
+        print("Verification Failed")
+    else:
+        print("Verification Successful")
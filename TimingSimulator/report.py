@@ -0,0 +1,137 @@
+import argparse
+import glob
+import math
+import multiprocessing
+import os
+
+from main import Config
+from results import ResultsStore
+from telemetry import plotTelemetry
+
+PARAMETERS = Config.PARAMETERS
+LABELS = {"numLanes": "Number of Lanes", "vdmNumBanks": "Number of Vector Memory Banks",
+          "dataQueueDepth": "Depth of Data Queue", "computeQueueDepth": "Depth of Compute Queue",
+          "vlsPipelineDepth": "Depth of Load Store Pipeline", "pipelineDepthAdd": "Depth of Add Pipeline",
+          "pipelineDepthMul": "Depth of Mul Pipeline", "pipelineDepthDiv": "Depth of Div Pipeline",
+          "bankBusyTime": "Bank Busy Time"}
+
+
+def getSensitivities(rows):
+    # For every parameter with several values, the cycles of the results that differ from the baseline only in that
+    # parameter. The baseline takes the most common value of each parameter, which is the base config of a one at a
+    # time sweep. Sampled sweeps rarely share a baseline, their parameters are plotted against all of the results.
+    baseline = {}
+    for name in PARAMETERS:
+        values = [row[name] for row in rows]
+        baseline[name] = max(sorted(set(values)), key=values.count)
+    sensitivities = []
+    for name in PARAMETERS:
+        if len(set(row[name] for row in rows)) < 2:
+            continue
+        points = {row[name]: row["cycles"] for row in rows
+                  if all(row[other] == baseline[other] for other in PARAMETERS if other != name)}
+        if len(points) > 1:
+            values = sorted(points)
+            sensitivities.append((name, values, [points[value] for value in values], True))
+        else:
+            sensitivities.append((name, [row[name] for row in rows], [row["cycles"] for row in rows], False))
+    return sensitivities
+
+
+def plotSensitivity(axis, name, x, y, connected):
+    from matplotlib import ticker
+
+    axis.plot(x, y, '-o' if connected else 'o')
+    axis.set_xlabel(LABELS[name])
+    axis.set_ylabel('Clock Cycles')
+    axis.set_title('Clock Cycles vs ' + LABELS[name])
+    axis.xaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    axis.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+
+
+def renderPlot(task):
+    # Runs in a worker; matplotlib is imported here so that simulations never pay for it
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import pyplot as plt
+
+    kind, plotPath, content = task
+    if kind == "telemetry":
+        plotTelemetry(content, plotPath)
+        return plotPath
+    if kind == "sensitivity":
+        fig, axis = plt.subplots()
+        plotSensitivity(axis, *content)
+    else:  # Overview of all the sensitivities of a trace
+        columns = min(2, len(content))
+        rows = int(math.ceil(len(content) / columns))
+        fig, axes = plt.subplots(nrows=rows, ncols=columns, figsize=(5 * columns, 5 * rows), squeeze=False)
+        for axis, sensitivity in zip([axis for row in axes for axis in row], content):
+            plotSensitivity(axis, *sensitivity)
+        for axis in [axis for row in axes for axis in row][len(content):]:
+            axis.set_visible(False)
+        fig.tight_layout()
+    fig.savefig(plotPath, bbox_inches='tight')
+    plt.close(fig)
+    print("Report - Plot saved in path:", plotPath)
+    return plotPath
+
+
+def getTasks(store, plotDir, telemetryDir=None, modelVersion=None):
+    rows = store.getRows(modelVersion)
+    traces = {}
+    for row in rows:  # Rows come oldest first, a rerun of the same point replaces the older result
+        if row["pruned"]:  # Only a lower bound
+            continue
+        key = tuple(row[name] for name in PARAMETERS) + (row["start"],)
+        traces.setdefault(row["trace"], {})[key] = row
+
+    tasks = []
+    for trace, points in sorted(traces.items()):
+        sensitivities = getSensitivities([row for row in points.values() if row["start"] == 0])
+        for sensitivity in sensitivities:
+            fileName = trace + "_" + LABELS[sensitivity[0]].replace(' ', '_') + ".png"
+            tasks.append(("sensitivity", os.path.join(plotDir, fileName), sensitivity))
+        if sensitivities:
+            tasks.append(("overview", os.path.join(plotDir, trace + ".png"), sensitivities))
+    if telemetryDir is not None:
+        for filepath in sorted(glob.glob(os.path.join(telemetryDir, "Telemetry*.json"))):
+            name = os.path.basename(filepath)
+            tasks.append(("telemetry", os.path.join(plotDir, name[:name.rindex(".")] + ".png"), filepath))
+    return tasks
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Plot the results stored by the timing simulator')
+    parser.add_argument('--results', default=os.path.join("IODir1", "Results.db"), type=str,
+                        help='Path to the SQLite results database')
+    parser.add_argument('--output', default=None, type=str,
+                        help='Folder the plots are written to, defaults to Plots next to the database')
+    parser.add_argument('--model', default=None, type=int,
+                        help='Only plot the results of this timing model version')
+    parser.add_argument('--telemetry', action='store_true',
+                        help='Also plot the TelemetryN.json files next to the database')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of plots rendered in parallel')
+    args = parser.parse_args()
+    args.results = os.path.abspath(args.results)
+    args.output = os.path.abspath(args.output or os.path.join(os.path.dirname(args.results), "Plots"))
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    if not os.path.exists(args.results):
+        raise SystemExit("Report - ERROR: No results database in path: " + args.results)
+    store = ResultsStore(args.results, PARAMETERS)
+    tasks = getTasks(store, args.output, os.path.dirname(args.results) if args.telemetry else None, args.model)
+    store.close()
+    os.makedirs(args.output, exist_ok=True)
+    if args.jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(args.jobs, len(tasks))) as pool:
+            pool.map(renderPlot, tasks, chunksize=1)
+    else:
+        for task in tasks:
+            renderPlot(task)
+    print("Report -", len(tasks), "plots rendered into", args.output)
@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+import sqlite3
+import time
+
+
+class ResultsStore(object):
+    # SQLite table of timing results, one row per trace and full parameter set, with the collected statistics
+    # alongside as JSON. Rerunning a configuration updates its row. The table is exported as CSV next to the
+    # database for spreadsheets; report.py reads the database to plot.
+    def __init__(self, filepath, parameters):
+        self.filepath = os.path.abspath(filepath)
+        self.parameters = list(parameters)
+        self.connection = sqlite3.connect(self.filepath)
+        self.key = ", ".join(["traceHash"] + self.parameters + ["start", "modelVersion"])
+        columns = ", ".join(name + " INTEGER" for name in self.parameters)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (trace TEXT, traceHash TEXT, config TEXT, " +
+                                columns + ", start INTEGER, modelVersion INTEGER, cycles INTEGER, exact INTEGER, "
+                                "stats TEXT, updated REAL, pruned INTEGER DEFAULT 0, UNIQUE(" + self.key + "))")
+        columns = [column[1] for column in self.connection.execute("PRAGMA table_info(results)")]
+        if "pruned" not in columns:  # Databases written before pruned runs were recorded
+            self.connection.execute("ALTER TABLE results ADD COLUMN pruned INTEGER DEFAULT 0")
+        # Config independent features of every trace, so the surrogate model trains without the traces themselves,
+        # and every prediction of the surrogate next to the detailed result it was checked against
+        self.connection.execute("CREATE TABLE IF NOT EXISTS traces (traceHash TEXT PRIMARY KEY, trace TEXT, "
+                                "features TEXT)")
+        columns = ", ".join(name + " INTEGER" for name in self.parameters)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS predictions (trace TEXT, traceHash TEXT, config TEXT, " +
+                                columns + ", modelVersion INTEGER, predicted INTEGER, cycles INTEGER, "
+                                "trainingRows INTEGER, updated REAL)")
+
+    def add(self, trace, traceHash, config, parameters, result, modelVersion, start=0):
+        stats = result.get("stats")
+        row = [trace, traceHash, config] + [parameters[name] for name in self.parameters] + \
+              [start, modelVersion, result["clk"], int(result.get("exact", True)),
+               json.dumps(stats) if stats is not None else None, time.time(), int(result.get("pruned", False))]
+        # A rerun without statistics keeps the ones already stored for the same point, and the lower bound of a
+        # pruned run never replaces a finished one
+        self.connection.execute("INSERT INTO results VALUES (" + ", ".join("?" * len(row)) + ") ON CONFLICT(" +
+                                self.key + ") DO UPDATE SET trace = excluded.trace, config = excluded.config, "
+                                "cycles = excluded.cycles, exact = excluded.exact, "
+                                "stats = COALESCE(excluded.stats, stats), updated = excluded.updated, "
+                                "pruned = excluded.pruned WHERE excluded.pruned = 0 OR results.pruned = 1", row)
+
+    def addTrace(self, trace, traceHash, features):
+        self.connection.execute("INSERT OR REPLACE INTO traces VALUES (?, ?, ?)",
+                                [traceHash, trace, json.dumps(features)])
+
+    def getTraceFeatures(self):
+        return {traceHash: json.loads(features)
+                for traceHash, features in self.connection.execute("SELECT traceHash, features FROM traces")}
+
+    def addPrediction(self, trace, traceHash, config, parameters, predicted, cycles, trainingRows, modelVersion):
+        row = [trace, traceHash, config] + [parameters[name] for name in self.parameters] + \
+              [modelVersion, predicted, cycles, trainingRows, time.time()]
+        self.connection.execute("INSERT INTO predictions VALUES (" + ", ".join("?" * len(row)) + ")", row)
+
+    def getPredictions(self):
+        cursor = self.connection.execute("SELECT * FROM predictions ORDER BY updated")
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, values)) for values in cursor.fetchall()]
+
+    def commit(self):
+        self.connection.commit()
+
+    def getRows(self, modelVersion=None):
+        query = "SELECT * FROM results"
+        arguments = []
+        if modelVersion is not None:  # Results of older models may no longer be comparable
+            query += " WHERE modelVersion = ?"
+            arguments.append(modelVersion)
+        cursor = self.connection.execute(query + " ORDER BY trace, updated", arguments)
+        names = [column[0] for column in cursor.description]
+        rows = []
+        for values in cursor.fetchall():
+            row = dict(zip(names, values))
+            row["stats"] = json.loads(row["stats"]) if row["stats"] is not None else None
+            rows.append(row)
+        return rows
+
+    def exportCsv(self, filepath=None):
+        # Statistics are flattened into columns, leaving out the occupancy histograms and the per bank counters
+        filepath = filepath or self.filepath[:self.filepath.rindex(".")] + ".csv"
+        rows = self.getRows()
+        statColumns = sorted(set(key for row in rows for key in flattenStatistics(row["stats"])))
+        try:
+            with open(filepath, 'w', newline='') as opf:
+                writer = csv.writer(opf)
+                columns = ["trace", "traceHash", "config"] + self.parameters + ["start", "modelVersion", "cycles",
+                                                                               "exact", "pruned"]
+                writer.writerow(columns + statColumns)
+                for row in rows:
+                    stats = flattenStatistics(row["stats"])
+                    writer.writerow([row[column] for column in columns] + [stats.get(key, "") for key in statColumns])
+            print("ResultsStore - Exported", len(rows), "results into output file in path:", filepath)
+        except:
+            print("ResultsStore - ERROR: Couldn't open output file in path:", filepath)
+
+    def close(self):
+        self.connection.close()
+
+
+def flattenStatistics(stats, prefix="stats."):
+    flat = {}
+    for key, value in (stats or {}).items():
+        if key == "queueOccupancy" or (prefix.endswith(".bankConflictCycles.") and key != "total"):
+            continue
+        if isinstance(value, dict):
+            flat.update(flattenStatistics(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
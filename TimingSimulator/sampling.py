@@ -0,0 +1,257 @@
+import argparse
+import math
+import os
+import random
+
+from checkpoint import findCheckpoints, loadState
+from main import Config, Core, createPool, dumpOutput, getCheckpointKey, loadTraces, sharedTraces
+from decode import Decode
+from fetch import Fetch
+from steadyState import SteadyStateDetector
+
+# Two-sided 95% quantile of Student's t distribution by degrees of freedom, 1.96 past the table
+T_QUANTILES = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145,
+               2.131, 2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048,
+               2.045, 2.042]
+
+
+def getTQuantile(degrees):
+    if degrees >= len(T_QUANTILES) + 1:
+        return 1.96
+    return T_QUANTILES[max(1, int(degrees)) - 1]
+
+
+def getIntervalFeatures(trace, start, end):
+    # Opcode mix and basic block vector of the interval, plus the vector elements handled per instruction since the
+    # vector length scales the time spent in the pipelines.
+    features = {}
+    block = []
+    vectorLength = Fetch.getVectorLengthAt(trace, start)
+    for addr in range(start, end):
+        args = trace[addr].split()
+        name = args[0]
+        features["op:" + name] = features.get("op:" + name, 0) + 1
+        if name == "MTCL":
+            vectorLength = int(args[-1])
+        if Decode.INS.get(name) == Decode.INSTR_DATA:
+            features["elements:data"] = features.get("elements:data", 0) + (args[-1].count(',') + 1) / 64
+        elif Decode.INS.get(name) == Decode.INSTR_COMPUTE:
+            features["elements:compute"] = features.get("elements:compute", 0) + vectorLength / 64
+        block.append(name)
+        if name in SteadyStateDetector.BRANCH_INSTR:
+            key = "bb:" + " ".join(block)
+            features[key] = features.get(key, 0) + len(block)
+            block = []
+    return {key: value / (end - start) for key, value in features.items()}
+
+
+def getDistance(a, b):
+    return sum((x - y) * (x - y) for x, y in zip(a, b))
+
+
+def cluster(vectors, k, rng, iterations=50):
+    # k-means with k-means++ seeding
+    centroids = [vectors[rng.randrange(len(vectors))]]
+    while len(centroids) < k:
+        distances = [min(getDistance(vector, centroid) for centroid in centroids) for vector in vectors]
+        total = sum(distances)
+        if total == 0:
+            break
+        threshold = rng.random() * total
+        for vector, distance in zip(vectors, distances):
+            threshold -= distance
+            if threshold <= 0:
+                centroids.append(vector)
+                break
+
+    assignment = None
+    for _ in range(iterations):
+        newAssignment = [min(range(len(centroids)), key=lambda c: getDistance(vector, centroids[c]))
+                         for vector in vectors]
+        if newAssignment == assignment:
+            break
+        assignment = newAssignment
+        for c in range(len(centroids)):
+            members = [vector for vector, label in zip(vectors, assignment) if label == c]
+            if members:
+                centroids[c] = [sum(column) / len(members) for column in zip(*members)]
+    return assignment, centroids
+
+
+def simulateInterval(task):
+    # Warmed up from the checkpoint if there is one, which gives the exact state at start, else from a cold core
+    iodir, config, start, end, warmup, checkpoint = task
+    imem = sharedTraces[iodir]
+    if checkpoint is not None:
+        core = Core(config, imem, iodir)
+        core.setState(loadState(checkpoint))
+    else:
+        core = Core(config, imem, iodir, max(0, start - warmup))
+    core.runUntil(start)
+    clk = core.clk
+    if end < len(imem.instructions):
+        core.runUntil(end)
+        core.closeTrace()
+    else:  # The last interval includes draining the core
+        core.run()
+    return core.clk - clk
+
+
+def simulateFull(iodir, config, boundaries):
+    # Detailed run recording the cycles of every interval, used to check the sampled estimate.
+    core = Core(config, sharedTraces[iodir], iodir)
+    cycles = []
+    clk = core.clk
+    for end in boundaries[1:-1]:
+        core.runUntil(end)
+        cycles.append(core.clk - clk)
+        clk = core.clk
+    core.run()
+    cycles.append(core.clk - clk)
+    return cycles
+
+
+class SampledSimulation:
+    def __init__(self, iodir, config, intervalSize=1000, warmup=200, clusters=8, samplesPerCluster=2, seed=1,
+                 checkpoints=False):
+        self.iodir = iodir
+        self.config = config
+        self.intervalSize = intervalSize
+        self.warmup = warmup
+        self.clusters = clusters
+        self.samplesPerCluster = max(2, samplesPerCluster)  # Every cluster of several intervals gets its own variance
+        self.rng = random.Random(seed)
+        self.checkpoints = checkpoints
+        self.warmStarts = 0  # Sampled intervals started from a checkpoint
+        trace = sharedTraces[iodir].instructions
+        self.boundaries = list(range(0, len(trace), intervalSize)) + [len(trace)]
+        self.intervals = list(zip(self.boundaries[:-1], self.boundaries[1:]))
+        self.assignment = None
+        self.samples = {}  # interval index: simulated cycles
+        self.estimate = None
+        self.confidence = None
+
+    def selectSamples(self):
+        trace = sharedTraces[self.iodir].instructions
+        features = [getIntervalFeatures(trace, start, end) for start, end in self.intervals]
+        keys = sorted(set(key for feature in features for key in feature))
+        vectors = [[feature.get(key, 0) for key in keys] for feature in features]
+        self.assignment, centroids = cluster(vectors, min(self.clusters, len(vectors)), self.rng)
+
+        selected = []
+        for c, centroid in enumerate(centroids):
+            members = [index for index, label in enumerate(self.assignment) if label == c]
+            if not members:
+                continue
+            # The interval closest to the centroid represents the cluster, extra random members measure its spread
+            members.sort(key=lambda index: getDistance(vectors[index], centroid))
+            selected.append(members[0])
+            selected += self.rng.sample(members[1:], min(self.samplesPerCluster - 1, len(members) - 1))
+        return sorted(selected)
+
+    def getCheckpoint(self, start, checkpoints):
+        # Latest checkpoint of a full run of the config at most one interval before start
+        candidates = [filepath for header, filepath in checkpoints
+                      if start - self.intervalSize <= header["addr"] <= start]
+        return candidates[-1] if candidates else None
+
+    def run(self, jobs=1):
+        selected = self.selectSamples()
+        checkpoints = findCheckpoints(self.iodir, self.config, getCheckpointKey(self.iodir, {})) \
+            if self.checkpoints else []
+        tasks = [(self.iodir, self.config) + self.intervals[index] +
+                 (self.warmup, self.getCheckpoint(self.intervals[index][0], checkpoints)) for index in selected]
+        self.warmStarts = sum(task[-1] is not None for task in tasks)
+        if jobs > 1 and len(tasks) > 1:
+            with createPool(min(jobs, len(tasks))) as pool:
+                cycles = pool.map(simulateInterval, tasks, chunksize=1)
+        else:
+            cycles = [simulateInterval(task) for task in tasks]
+        self.samples = dict(zip(selected, cycles))
+        self.estimateCycles()
+
+    def estimateCycles(self):
+        # Stratified estimate over the clusters: the mean cycles per instruction of the sampled intervals of a
+        # cluster scales to all of its instructions, and the sample variance gives the standard error. With a few
+        # samples per cluster the variances are rough, so the interval uses Student's t with the Satterthwaite
+        # degrees of freedom rather than the normal quantile. It covers the sampling error only: the error of the
+        # cold warm-up of every sampled interval isn't included, --verify measures the total error.
+        self.estimate = 0
+        variance = 0
+        degrees = 0  # Denominator of the Satterthwaite degrees of freedom
+        for c in sorted(set(self.assignment)):
+            members = [index for index, label in enumerate(self.assignment) if label == c]
+            instructions = sum(self.intervals[index][1] - self.intervals[index][0] for index in members)
+            cpis = [self.samples[index] / (self.intervals[index][1] - self.intervals[index][0])
+                    for index in members if index in self.samples]
+            mean = sum(cpis) / len(cpis)
+            self.estimate += mean * instructions
+            if len(cpis) < len(members):  # Fully sampled clusters are exact, others have at least two samples
+                sampleVariance = sum((cpi - mean) ** 2 for cpi in cpis) / (len(cpis) - 1)
+                stratum = instructions * instructions * sampleVariance / len(cpis) * (1 - len(cpis) / len(members))
+                variance += stratum
+                degrees += stratum * stratum / (len(cpis) - 1)
+        self.confidence = getTQuantile(variance * variance / degrees if degrees else float("inf")) * \
+            math.sqrt(variance)
+
+    def getReport(self, actual=None):
+        simulated = sum(self.intervals[index][1] - self.intervals[index][0] for index in self.samples)
+        total = self.boundaries[-1]
+        report = ["================SAMPLING================",
+                  "Intervals: " + str(len(self.intervals)) + " of " + str(self.intervalSize) + " instructions, " +
+                  str(len(set(self.assignment))) + " clusters",
+                  "Simulated Intervals: " + str(len(self.samples)) + " (" + str(simulated) + " of " + str(total) +
+                  " instructions, warm-up " + str(self.warmup) + ", " + str(self.warmStarts) +
+                  " from checkpoints)",
+                  "Estimated Clock Cycles: " + str(int(round(self.estimate))),
+                  "95% Confidence (sampling error only): +/- " + str(int(round(self.confidence))) + " (" +
+                  "{:.2f}".format(100 * self.confidence / self.estimate) + "%)"]
+        if actual is not None:
+            report.append("Detailed Clock Cycles: " + str(actual))
+            report.append("Error: " + "{:.2f}".format(100 * (self.estimate - actual) / actual) + "%")
+        report.append("======================================")
+        return report
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Vector Core Sampled Performance Model')
+    parser.add_argument('--iodir', default="IODir1", type=str,
+                        help='Path to the folder containing the input files - resolved data')
+    parser.add_argument('--config', default="Config1.txt", type=str,
+                        help='Config file inside the iodir to simulate')
+    parser.add_argument('--interval', default=1000, type=int,
+                        help='Number of instructions per interval')
+    parser.add_argument('--warmup', default=200, type=int,
+                        help='Number of instructions simulated before a sampled interval to warm up the core')
+    parser.add_argument('--clusters', default=8, type=int,
+                        help='Number of interval clusters')
+    parser.add_argument('--samples', default=2, type=int,
+                        help='Number of intervals simulated per cluster, at least 2')
+    parser.add_argument('--seed', default=1, type=int,
+                        help='Seed of the clustering and of the sample selection')
+    parser.add_argument('--jobs', default=1, type=int,
+                        help='Number of intervals simulated in parallel')
+    parser.add_argument('--checkpoints', action='store_true',
+                        help='Start every sampled interval from the latest checkpoint of the config (main.py '
+                             '--checkpoint --keep-checkpoints) at most one interval before it instead of a cold '
+                             'warm-up')
+    parser.add_argument('--verify', action='store_true',
+                        help='Also run the full detailed simulation and report the error of the estimate')
+    args = parser.parse_args()
+    args.iodir = os.path.abspath(args.iodir)
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    loadTraces([args.iodir])
+    config = Config(args.iodir, args.config)
+    sampled = SampledSimulation(args.iodir, config, args.interval, args.warmup, args.clusters, args.samples, args.seed,
+                                args.checkpoints)
+    sampled.run(args.jobs)
+    actual = sum(simulateFull(args.iodir, config, sampled.boundaries)) if args.verify else None
+    report = sampled.getReport(actual)
+    for line in report:
+        print(line)
+    dumpOutput(args.iodir, report, "Sampling_" + config.getName() + ".txt")
@@ -0,0 +1,517 @@
+import argparse
+import collections
+import contextlib
+import gc
+import http.client
+import http.server
+import importlib.util
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from cache import addCacheArguments, ResultCache
+from main import Config, IMEM, loadTraces, runTasks, sharedTraces
+from traceReader import findTrace
+
+FUNCTIONAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "FunctionalSimulator")
+JOB_TYPES = ["functional", "timing", "e2e"]
+TIMING_OPTIONS = ["start", "stats", "extrapolate"]  # Options a timing job may set, the others write files or signal
+SDMEM_ADDRESS_LEN = 13  # As in the command line of the functional simulator
+VDMEM_ADDRESS_LEN = 25
+HISTORY = 1000  # Finished jobs kept for GET /jobs/<id>
+
+
+def loadFunctionalSimulator():
+    # FunctionalSimulator/main.py has the name of the timing main module, so it is loaded under another one. Its
+    # instructions module is found at the end of the path, after the modules of the timing simulator, and imports
+    # main itself, which stands for the functional one while it is loaded.
+    if FUNCTIONAL_DIR not in sys.path:
+        sys.path.append(FUNCTIONAL_DIR)
+    spec = importlib.util.spec_from_file_location("functionalMain", os.path.join(FUNCTIONAL_DIR, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    timingMain = sys.modules.get("main")
+    sys.modules["main"] = module
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.modules["main"] = timingMain
+    return module
+
+
+def getSignature(paths):
+    # Files a cached entry was built from, it is stale as soon as one of them changes
+    signature = []
+    for filepath in paths:
+        try:
+            stat = os.stat(filepath)
+            signature.append((filepath, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((filepath, None, None))
+    return tuple(signature)
+
+
+class LRUCache(object):
+    # In-memory cache of a worker holding at most `capacity` entries, the least recently used is evicted first and
+    # handed to `evicted`. An entry is only returned for the signature it was stored with.
+    def __init__(self, capacity, evicted=None):
+        self.capacity = capacity
+        self.evicted = evicted
+        self.entries = collections.OrderedDict()  # key: (signature, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, signature=None):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] != signature:  # Its files changed since
+            self.remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def take(self, key):
+        # Removes the entry for exclusive use, e.g. a memory, which is put back after the job
+        value = self.get(key)
+        if value is not None:
+            del self.entries[key]
+        return value
+
+    def put(self, key, value, signature=None):
+        self.entries[key] = (signature, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        _, value = self.entries.pop(key)
+        if self.evicted is not None:
+            self.evicted(key, value)
+
+    def getReport(self):
+        return {"entries": len(self.entries), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
+class FunctionalProgress(object):
+    # Pre-execution handler of the functional core passing a heartbeat of the executed instructions to `listener`
+    # every `interval` seconds
+    CHECK_INSTRUCTIONS = 1024  # Instructions between two looks at the host clock
+
+    def __init__(self, listener, interval):
+        self.listener = listener
+        self.interval = interval
+        self.executed = 0
+        self.startTime = time.perf_counter()
+        self.nextHeartbeat = self.startTime + interval
+
+    def __call__(self, instr, current_PC):
+        self.executed += 1
+        if self.executed % FunctionalProgress.CHECK_INSTRUCTIONS == 0:
+            now = time.perf_counter()
+            if now >= self.nextHeartbeat:
+                self.nextHeartbeat = now + self.interval
+                self.listener({"stage": "functional", "instructions": self.executed,
+                               "speed": self.executed / (now - self.startTime)})
+        return True
+
+
+class Worker(object):
+    # Runs the jobs of one worker process. Its caches outlive the jobs: decoded and preprocessed timing traces by IO
+    # directory, functional programs (Code.asm and the memory inputs) by IO directory, and the data memories of the
+    # functional simulator, allocated once and zeroed after every job instead of allocating 2^25 words again. With a
+    # listener, jobs pass it a heartbeat every `interval` seconds while they simulate.
+    STATUS = {1: "success", 0: "failed", -1: "infinite"}
+
+    def __init__(self, settings):
+        self.functional = loadFunctionalSimulator()
+        self.traces = LRUCache(settings["traces"], lambda key, imem: sharedTraces.pop(key, None))
+        self.programs = LRUCache(settings["programs"])
+        self.memories = LRUCache(settings["memories"])
+        self.cache = ResultCache(settings["cachedir"], settings["cacheSize"]) if settings["cache"] else None
+        self.listener = None
+        self.interval = None
+        self.frozen = False  # Whether the memories of the first functional job were moved out of the collector's reach
+
+    def run(self, job, listener=None, interval=1.0):
+        log = io.StringIO()
+        startTime = time.perf_counter()
+        self.listener = listener
+        self.interval = interval
+        with contextlib.redirect_stdout(log):
+            try:
+                if job["type"] == "functional":
+                    result, _, _ = self.runFunctional(job)
+                elif job["type"] == "timing":
+                    self.loadTrace(job["iodir"])
+                    result = self.runTiming(job, job["iodir"])
+                else:
+                    result = self.runEndToEnd(job)
+            except Exception as error:
+                result = {"error": type(error).__name__ + ": " + str(error)}
+        result["hostSeconds"] = time.perf_counter() - startTime
+        if job.get("log"):
+            result["log"] = log.getvalue()
+        return result
+
+    def getReport(self):
+        return {"traces": self.traces.getReport(), "programs": self.programs.getReport(),
+                "memories": self.memories.getReport()}
+
+    def openMemory(self, program, name, iodir, addressLen):
+        memory = self.memories.take((name, addressLen))
+        if memory is None:
+            memory = [0x0] * pow(2, addressLen)
+        dmem = self.functional.DMEM(name, iodir, addressLen, memory, program.get(name))
+        if name not in program:
+            program[name] = dmem.data[:dmem.loaded]
+        return dmem
+
+    def runFunctional(self, job):
+        iodir = job["iodir"]
+        signature = getSignature([os.path.join(iodir, name) for name in ["Code.asm", "SDMEM.txt", "VDMEM.txt"]])
+        program = self.programs.get(iodir, signature)
+        if program is None:
+            program = {"imem": self.functional.IMEM(iodir)}
+            self.programs.put(iodir, program, signature)
+        sdmem = self.openMemory(program, "SDMEM", iodir, SDMEM_ADDRESS_LEN)
+        vdmem = self.openMemory(program, "VDMEM", iodir, VDMEM_ADDRESS_LEN)
+        if not self.frozen:  # Full collections would walk the 2^25 words of VDMEM every time, the lists are reused
+            gc.freeze()
+            self.frozen = True
+        try:
+            core = self.functional.Core(program["imem"], sdmem, vdmem)
+            if self.listener is not None:
+                core.setHandlers(FunctionalProgress(self.listener, self.interval))
+            startTime = time.perf_counter()
+            status = core.run()
+            result = {"status": Worker.STATUS.get(status, "failed"), "instructions": len(core.resolvedData),
+                      "seconds": time.perf_counter() - startTime}
+            if job.get("dump"):  # As the command line does, the 2^25 words of VDMEM take seconds
+                core.dumpRegs(iodir)
+                core.dumpResolvedData(iodir)
+                sdmem.dump()
+                vdmem.dump()
+        finally:
+            for dmem, addressLen in [(sdmem, SDMEM_ADDRESS_LEN), (vdmem, VDMEM_ADDRESS_LEN)]:
+                self.memories.put((dmem.name, addressLen), dmem.release())
+        return result, core, signature
+
+    def loadTrace(self, iodir):
+        signature = getSignature([findTrace(iodir)])
+        if self.traces.get(iodir, signature) is None:
+            loadTraces([iodir])
+            self.traces.put(iodir, sharedTraces[iodir], signature)
+
+    def runTiming(self, job, iodir, configDir=None):
+        if job.get("parameters") is not None:
+            config = Config(configDir or iodir, job.get("name", "Service"), job["parameters"])
+        else:
+            config = Config(configDir or iodir, job.get("config", "Config1.txt"))
+        options = {name: value for name, value in job.get("options", {}).items() if name in TIMING_OPTIONS}
+        if self.listener is not None:
+            options["progress"] = self.interval
+            options["listener"] = lambda heartbeat: self.listener(dict(heartbeat, stage="timing"))
+        cache = self.cache if job.get("cache", True) else None
+        result = dict(runTasks([(iodir, config, job.get("output"))], 1, cache, options)[0])
+        result["config"] = config.getName()
+        result["cycles"] = result["clk"] - 1
+        return result
+
+    def runEndToEnd(self, job):
+        # The resolved trace goes from the functional to the timing simulator in memory, under a key of
+        # sharedTraces that is not a directory, so the timing run writes no files. Configs are read from "configdir",
+        # by default the functional IO directory.
+        functionalResult, core, signature = self.runFunctional(job)
+        if functionalResult["status"] != "success":
+            return {"functional": functionalResult, "error": "Functional simulation " + functionalResult["status"]}
+        key = os.path.join(job["iodir"], "resolvedData")
+        if self.traces.get(key, signature) is None:
+            sharedTraces[key] = IMEM(job["iodir"], instructions=core.resolvedData)
+            sharedTraces[key].preprocessTrace()
+            self.traces.put(key, sharedTraces[key], signature)
+        job = dict(job, output=None)
+        return {"functional": functionalResult, "timing": self.runTiming(job, key, job.get("configdir", job["iodir"]))}
+
+
+def serveJobs(index, jobs, results, settings):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The service shuts the workers down
+    worker = Worker(settings)
+    while True:
+        item = jobs.get()
+        if item is None:
+            return
+        jobId, job = item
+        result = worker.run(job)
+        results.put((jobId, index, result, worker.getReport()))
+
+
+def checkJob(job):
+    # Error message of a malformed job, None if it can be run
+    if not isinstance(job, dict):
+        return "A job is a JSON object"
+    if job.get("type") not in JOB_TYPES:
+        return "Unknown job type: " + str(job.get("type")) + ", one of " + ", ".join(JOB_TYPES)
+    if not isinstance(job.get("iodir"), str) or not os.path.isdir(job["iodir"]):
+        return "Not a directory: " + str(job.get("iodir"))
+    if not isinstance(job.get("options", {}), dict) or not set(job.get("options", {})) <= set(TIMING_OPTIONS):
+        return "Timing options are a JSON object of " + ", ".join(TIMING_OPTIONS)
+    if job.get("parameters") is not None and not set(Config.PARAMETERS) - set(Config.DEFAULT_PARAMETERS) <= \
+            set(job["parameters"]):
+        return "Parameters need every one of " + ", ".join(Config.PARAMETERS)
+    return None
+
+
+class Service(object):
+    # Worker processes fed through one queue each. A job goes to an idle worker that ran a job of its IO directory
+    # before, so its caches are warm, else to any idle one, else to the least busy warm one. Finished jobs are
+    # collected by a thread and kept for the last HISTORY jobs.
+    def __init__(self, workers, settings):
+        self.results = multiprocessing.Queue()
+        self.queues = [multiprocessing.Queue() for _ in range(workers)]
+        self.processes = [multiprocessing.Process(target=serveJobs, args=(index, queue, self.results, settings),
+                                                  daemon=True) for index, queue in enumerate(self.queues)]
+        for process in self.processes:
+            process.start()
+        self.capacity = settings["traces"] + settings["programs"]
+        self.jobs = collections.OrderedDict()  # id: job record
+        self.pending = [0] * workers
+        self.warm = [collections.OrderedDict() for _ in range(workers)]  # IO directories of the latest jobs
+        self.caches = [None] * workers  # Cache report of every worker after its latest job
+        self.counter = itertools.count(1)
+        self.condition = threading.Condition()
+        threading.Thread(target=self.collect, daemon=True).start()
+
+    def chooseWorker(self, iodir):
+        workers = range(len(self.queues))
+        warm = [worker for worker in workers if iodir in self.warm[worker]]
+        for candidates in [[worker for worker in warm if self.pending[worker] == 0],
+                           [worker for worker in workers if self.pending[worker] == 0], warm, workers]:
+            if candidates:
+                return min(candidates, key=lambda worker: self.pending[worker])
+
+    def submit(self, job):
+        error = checkJob(job)
+        if error is not None:
+            raise ValueError(error)
+        job = dict(job, iodir=os.path.abspath(job["iodir"]))
+        if job.get("configdir") is not None:
+            job["configdir"] = os.path.abspath(job["configdir"])
+        with self.condition:
+            jobId = str(next(self.counter))
+            worker = self.chooseWorker(job["iodir"])
+            self.warm[worker][job["iodir"]] = True
+            self.warm[worker].move_to_end(job["iodir"])
+            while len(self.warm[worker]) > self.capacity:
+                self.warm[worker].popitem(last=False)
+            self.pending[worker] += 1
+            self.jobs[jobId] = {"id": jobId, "type": job["type"], "iodir": job["iodir"], "status": "pending",
+                                "worker": worker, "submitted": time.time()}
+        self.queues[worker].put((jobId, job))
+        return jobId
+
+    def collect(self):
+        while True:
+            jobId, worker, result, caches = self.results.get()
+            with self.condition:
+                record = self.jobs[jobId]
+                record["status"] = "failed" if "error" in result else "done"
+                record["result"] = result
+                record["finished"] = time.time()
+                self.pending[worker] -= 1
+                self.caches[worker] = caches
+                finished = [key for key, job in self.jobs.items() if job["status"] != "pending"]
+                for key in finished[:max(0, len(finished) - HISTORY)]:
+                    del self.jobs[key]
+                self.condition.notify_all()
+
+    def getJob(self, jobId, timeout=0):
+        with self.condition:
+            if jobId not in self.jobs:
+                return None
+            self.condition.wait_for(lambda: jobId not in self.jobs or self.jobs[jobId]["status"] != "pending",
+                                    timeout)
+            return dict(self.jobs[jobId]) if jobId in self.jobs else None
+
+    def getStatus(self):
+        with self.condition:
+            counts = collections.Counter(job["status"] for job in self.jobs.values())
+            return {"workers": [{"pending": pending, "alive": process.is_alive(), "caches": caches}
+                                for pending, process, caches in zip(self.pending, self.processes, self.caches)],
+                    "jobs": dict(counts)}
+
+    def close(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+    # POST /jobs runs a job and answers with it once finished, or right away with its id if "wait" is false.
+    # GET /jobs/<id>?wait=<seconds> polls a job, GET /status reports the workers and their caches.
+    protocol_version = "HTTP/1.1"  # Clients keep their connection for the next job
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self.reply(404, {"error": "Unknown path: " + self.path})
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            jobId = self.server.service.submit(job)
+        except ValueError as error:
+            return self.reply(400, {"error": str(error)})
+        if not job.get("wait", True):
+            return self.reply(202, self.server.service.getJob(jobId))
+        self.reply(200, self.server.service.getJob(jobId, None))
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path.rstrip("/") == "/status":
+            return self.reply(200, self.server.service.getStatus())
+        if not path.startswith("/jobs/"):
+            return self.reply(404, {"error": "Unknown path: " + self.path})
+        try:
+            timeout = float(dict(field.partition("=")[::2] for field in query.split("&") if field).get("wait", 0))
+        except ValueError:
+            return self.reply(400, {"error": "wait is a number of seconds"})
+        job = self.server.service.getJob(path[len("/jobs/"):].rstrip("/"), timeout)
+        if job is None:
+            return self.reply(404, {"error": "Unknown job: " + path[len("/jobs/"):]})
+        self.reply(200, job)
+
+    def reply(self, code, body):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "local"  # Unix sockets have no client address
+
+    def log_message(self, format, *args):
+        pass  # Interactive jobs come in too fast for a line each
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socketPath, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socketPath = socketPath
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socketPath)
+
+
+class ServiceClient(object):
+    # Client of a running service over TCP or a Unix socket, reusing one connection
+    def __init__(self, port=None, host="127.0.0.1", socketPath=None):
+        if socketPath is not None:
+            self.connection = UnixHTTPConnection(socketPath)
+        else:
+            self.connection = http.client.HTTPConnection(host, port)
+
+    def request(self, method, path, body=None):
+        content = None if body is None else json.dumps(body)
+        headers = {} if body is None else {"Content-Type": "application/json"}
+        self.connection.request(method, path, content, headers)
+        response = self.connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def submit(self, job):
+        # Paths relative to the client, the service may run in another directory
+        job = dict(job, **{name: os.path.abspath(job[name]) for name in ["iodir", "configdir"]
+                           if isinstance(job.get(name), str)})
+        return self.request("POST", "/jobs", job)[1]
+
+    def getJob(self, jobId, wait=0):
+        return self.request("GET", "/jobs/" + jobId + "?wait=" + str(wait))[1]
+
+    def getStatus(self):
+        return self.request("GET", "/status")[1]
+
+    def close(self):
+        self.connection.close()
+
+
+def createServer(args, service):
+    if args.socket is not None:
+        if os.path.exists(args.socket):  # Left behind by a service that was killed
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, ServiceHandler)
+    else:
+        server = http.server.ThreadingHTTPServer((args.host, args.port), ServiceHandler)
+    server.service = service
+    return server
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Vector Core simulation service, keeping traces, programs and memories loaded between jobs')
+    parser.add_argument('--host', default="127.0.0.1", type=str,
+                        help='Address the HTTP API listens on')
+    parser.add_argument('--port', default=8765, type=int,
+                        help='Port the HTTP API listens on')
+    parser.add_argument('--socket', default=None, type=str,
+                        help='Path of a Unix socket to serve the API on instead of a port')
+    parser.add_argument('--workers', default=1, type=int,
+                        help='Number of worker processes running jobs')
+    parser.add_argument('--traces', default=8, type=int,
+                        help='Number of timing traces every worker keeps loaded')
+    parser.add_argument('--programs', default=8, type=int,
+                        help='Number of functional programs every worker keeps loaded')
+    parser.add_argument('--memories', default=2, type=int,
+                        help='Number of functional data memories every worker keeps allocated')
+    parser.add_argument('--submit', default=None, type=str,
+                        help='Submit a job, as JSON, to a running service and print the result, e.g. '
+                             '\'{"type": "timing", "iodir": "IODir1", "config": "Config1.txt"}\'')
+    parser.add_argument('--status', action='store_true',
+                        help='Print the status of a running service')
+    addCacheArguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    if args.submit is not None or args.status:
+        client = ServiceClient(args.port, args.host, args.socket)
+        try:
+            reply = client.submit(json.loads(args.submit)) if args.submit is not None else client.getStatus()
+        except (OSError, ValueError) as error:
+            print("Service - ERROR: Couldn't reach the service:", error)
+            sys.exit(1)
+        finally:
+            client.close()
+        print(json.dumps(reply, indent=2))
+        sys.exit()
+    settings = {"traces": args.traces, "programs": args.programs, "memories": args.memories, "cache": args.cache,
+                "cachedir": args.cachedir, "cacheSize": args.cache_size * 1024 * 1024}
+    service = Service(args.workers, settings)
+    server = createServer(args, service)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    print("Service - Listening on", args.socket or args.host + ":" + str(args.port), "with", args.workers, "workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,110 @@
+import copy
+import json
+import os
+
+from decode import Decode
+from status import Status
+
+
+class Statistics:
+    # Microarchitectural counters, sampled once per cycle by Core while attached. A core without statistics runs
+    # the plain cycle loop, so counters cost nothing when they are off.
+    STALL_EMPTY = "empty"  # No instruction waiting, fetch is starved or waiting for the core to drain on MTCL
+    STALL_RAW = "raw"
+    STALL_WAW = "waw"
+    STALL_COMPUTE_QUEUE = "computeQueueFull"
+    STALL_DATA_QUEUE = "dataQueueFull"
+
+    def __init__(self, numberOfBanks):
+        self.counters = {
+            "cycles": 0,
+            "busyCycles": {"add": 0, "mul": 0, "div": 0, "data": 0},
+            "queueOccupancy": {"compute": {}, "data": {}, "window": {}},
+            "bankConflictCycles": {str(bank): 0 for bank in range(numberOfBanks)},
+            "issueStalls": {},
+            "retired": {"add": 0, "mul": 0, "div": 0, "load": 0, "store": 0, "scalar": 0},
+        }
+        self.pipelineStatus = (Status.FREE, Status.FREE, Status.FREE)
+        self.dataStatus = Status.FREE
+
+    def attach(self, core):
+        core.data.addBankConflictHandler(self.recordBankConflict)
+
+    def recordBankConflict(self, bankNo):
+        self.counters["bankConflictCycles"][str(bankNo)] += 1
+
+    def cycle(self, core, instr, issued, computeInstr, dataInstr, scalarInstr):
+        counters = self.counters
+        counters["cycles"] += 1
+        decode = core.decode
+
+        busy = counters["busyCycles"]
+        retired = counters["retired"]
+        pipelineStatus = core.compute.getPipelineStatus()
+        for name, status, previous in zip(["add", "mul", "div"], pipelineStatus, self.pipelineStatus):
+            if status == Status.BUSY:
+                busy[name] += 1
+            elif previous == Status.BUSY:
+                retired[name] += 1
+        self.pipelineStatus = pipelineStatus
+        dataStatus = core.data.getStatus()
+        if dataStatus == Status.BUSY:
+            busy["data"] += 1
+        elif self.dataStatus == Status.BUSY:
+            retired["load" if core.data.instr.get(Decode.INSTR_NAME).startswith('L') else "store"] += 1
+        self.dataStatus = dataStatus
+        if scalarInstr is not None:
+            retired["scalar"] += 1
+
+        occupancy = counters["queueOccupancy"]
+        for name, length in [("compute", len(decode.computeQueue)), ("data", len(decode.dataQueue)),
+                             ("window", len(decode.priorityQueue))]:
+            occupancy[name][str(length)] = occupancy[name].get(str(length), 0) + 1
+
+        if issued is None:
+            reason = self.getStallReason(decode)
+            counters["issueStalls"][reason] = counters["issueStalls"].get(reason, 0) + 1
+
+    @staticmethod
+    def getStallReason(decode):
+        # Decode issues the oldest instruction that can go, so a cycle without issue is attributed to the oldest one.
+        if len(decode.priorityQueue) == 0:
+            return Statistics.STALL_EMPTY
+        instr = decode.priorityQueue[0]
+        if instr.get(Decode.INSTR_TYPE) == Decode.INSTR_COMPUTE and decode.getComputeStatus() == Status.BUSY:
+            return Statistics.STALL_COMPUTE_QUEUE
+        if instr.get(Decode.INSTR_TYPE) == Decode.INSTR_DATA and decode.getDataStatus() == Status.BUSY:
+            return Statistics.STALL_DATA_QUEUE
+        return Statistics.STALL_RAW if decode.getHazard(instr) == Decode.HAZARD_RAW else Statistics.STALL_WAW
+
+    def snapshot(self):
+        return copy.deepcopy(self.counters)
+
+    # Adds the counters accumulated since the snapshot once more for each of the extrapolated iterations.
+    def extrapolate(self, snapshot, iterations):
+        def scale(current, previous):
+            for key, value in current.items():
+                if isinstance(value, dict):
+                    scale(value, previous.get(key, {}))
+                else:
+                    current[key] = value + iterations * (value - previous.get(key, 0))
+
+        scale(self.counters, snapshot)
+
+    def getReport(self):
+        report = copy.deepcopy(self.counters)
+        cycles = max(1, report["cycles"])
+        report["utilization"] = {name: busy / cycles for name, busy in report["busyCycles"].items()}
+        report["bankConflictCycles"]["total"] = sum(report["bankConflictCycles"].values())
+        report["retired"]["total"] = sum(report["retired"].values())
+        return report
+
+
+def dumpStatistics(iodir, report, fileName="Output.json"):
+    filepath = os.path.abspath(os.path.join(iodir, fileName))
+    try:
+        with open(filepath, 'w') as opf:
+            json.dump(report, opf, indent=2)
+        print(fileName, "- Dumped statistics into output file in path:", filepath)
+    except:
+        print(fileName, "- ERROR: Couldn't open output file in path:", filepath)
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+
+from decode import Decode
+
+
+class SteadyStateDetector:
+    # Loop traces repeat the same body with shifted addresses. The detector fingerprints the microarchitectural state
+    # every time a branch is fetched; only the bank of an address affects timing, so addresses are kept modulo the
+    # number of banks. When a fingerprint recurs, the state evolves with a fixed period for as long as the trace
+    # keeps repeating the lines fetched during that period, so those iterations are skipped in one step.
+    BRANCH_INSTR = ['BEQ', 'BNE', 'BGT', 'BLT', 'BGE', 'BLE']
+
+    def __init__(self, core, maxBoundaries=4096):
+        self.core = core
+        self.numberOfBanks = core.config.numberOfBanks
+        self.maxBoundaries = maxBoundaries
+        self.boundaries = OrderedDict()  # fingerprint: (clk, addr, statistics) of the boundary it was last seen at
+        self.residues = {}  # address list token: tuple of the addresses modulo the number of banks
+        self.extrapolatedCycles = 0
+        self.extrapolatedInstructions = 0
+
+    def run(self, instr):
+        if instr is None or instr.split()[0] not in SteadyStateDetector.BRANCH_INSTR:
+            return
+        fingerprint = self.getFingerprint()
+        previous = self.boundaries.pop(fingerprint, None)
+        if previous is not None and self.extrapolate(*previous):
+            self.boundaries.clear()  # The boundaries seen so far belong to the loop that was just skipped
+        snapshot = self.core.stats.snapshot() if self.core.stats is not None else None
+        self.boundaries[fingerprint] = (self.core.clk, self.core.fetch.addr, snapshot)
+        if len(self.boundaries) > self.maxBoundaries:
+            self.boundaries.popitem(last=False)
+
+    def extrapolate(self, clk, addr, snapshot):
+        fetch = self.core.fetch
+        period = self.core.clk - clk
+        length = fetch.addr - addr
+        trace = fetch.instrMem
+        try:
+            reference = [self.getLineSignature(trace[index].split()) for index in range(addr, fetch.addr)]
+        except ValueError:  # A streamed trace already released the lines of a period this long
+            return False
+
+        iterations = 0
+        start = fetch.addr
+        while self.matchesBlock(trace, start, reference):
+            iterations += 1
+            start += length
+        if iterations == 0:
+            return False
+
+        fetch.addr += iterations * length
+        self.core.clk += iterations * period
+        if snapshot is not None:  # Counters grow by what one period added, once per skipped iteration
+            self.core.stats.extrapolate(snapshot, iterations)
+        self.extrapolatedCycles += iterations * period
+        self.extrapolatedInstructions += iterations * length
+        return True
+
+    def matchesBlock(self, trace, start, reference):
+        try:
+            return all(self.getLineSignature(trace[start + offset].split()) == signature
+                       for offset, signature in enumerate(reference))
+        except IndexError:  # The trace ends inside the block
+            return False
+
+    def getResidues(self, token):
+        residues = self.residues.get(token)
+        if residues is None:
+            residues = tuple(int(address) % self.numberOfBanks for address in token.strip('()').split(','))
+            if len(self.residues) > 4096:  # Keep the memo bounded on long traces
+                self.residues.clear()
+            self.residues[token] = residues
+        return residues
+
+    def getLineSignature(self, args):
+        if Decode.INS.get(args[0]) == Decode.INSTR_DATA:
+            return tuple(args[:-1]), self.getResidues(args[-1])
+        return tuple(args)
+
+    def getInstrSignature(self, instr):
+        if instr is None:
+            return None
+        return self.getLineSignature(instr.get(Decode.INSTR_ARGS))
+
+    def getFingerprint(self):
+        fetch = self.core.fetch
+        decode = self.core.decode
+        compute = self.core.compute
+        data = self.core.data
+        addStatus, mulStatus, divStatus = compute.getPipelineStatus()
+        return (fetch.getCurrentVectorLength(), fetch.getStatus(),
+                tuple(self.getInstrSignature(instr) for instr in decode.priorityQueue),
+                tuple(self.getInstrSignature(instr) for instr in decode.computeQueue),
+                tuple(self.getInstrSignature(instr) for instr in decode.dataQueue),
+                tuple(self.getInstrSignature(instr) for instr in decode.scalarQueue),
+                decode.getComputeStatus(), decode.getDataStatus(),
+                tuple(decode.vectorBusyBoard), tuple(decode.scalarBusyBoard),
+                compute.addCycle, compute.mulCycle, compute.divCycle, addStatus, mulStatus, divStatus,
+                self.getInstrSignature(compute.currentAddInstr),
+                self.getInstrSignature(compute.currentMulInstr),
+                self.getInstrSignature(compute.currentDivInstr),
+                # The data engine frees the destination of its last instruction on every idle cycle, so that
+                # instruction is part of the state even after it completed.
+                data.getStatus(), self.getInstrSignature(data.instr),
+                tuple(address % self.numberOfBanks for address in data.addresses),
+                tuple(None if address is None else address % self.numberOfBanks for address in data.pipeline),
+                tuple(data.bankBusyBoard))
@@ -0,0 +1,227 @@
+import argparse
+import math
+import os
+import random
+
+import numpy
+
+from main import Config, dumpOutput, MODEL_VERSION, sharedTraces
+from prune import getResources
+from results import ResultsStore
+
+PARAMETERS = Config.PARAMETERS
+# Trace features of PreprocessedTrace.getFeatures used as inputs, next to the logarithm of every config parameter
+TRACE_FEATURES = ["instructions", "vectorLength", "addresses", "mix.scalar", "mix.data", "mix.add", "mix.mul",
+                  "mix.div", "stride.unit", "stride.constant", "stride.irregular"]
+PENALTIES = [1e-5, 1e-4, 1e-3, 1e-2, 1e-1]  # Ridge penalties tried by cross validation
+FOLDS = 5
+MIN_ROWS = 20  # Fewer results than this are not enough to rank anything
+
+
+def getInputs(parameters, features):
+    return [math.log2(1 + parameters[name]) for name in PARAMETERS] + \
+        [features.get(name, 0.0) for name in TRACE_FEATURES]
+
+
+def expand(inputs):
+    # Second degree polynomial: every input and every product of two inputs. Cycles are close to products of
+    # counts and latencies over lanes or banks, which are sums in log space.
+    inputs = numpy.asarray(inputs, dtype=float)
+    count = inputs.shape[1]
+    products = [inputs[:, first] * inputs[:, second] for first in range(count) for second in range(first, count)]
+    return numpy.column_stack([inputs] + products)
+
+
+class Surrogate(object):
+    # Ridge regression of the logarithm of the cycles over the expanded inputs, standardized column by column
+    def __init__(self, penalty=1e-3):
+        self.penalty = penalty
+        self.mean = None
+        self.scale = None
+        self.offset = 0.0
+        self.weights = None
+        self.rows = 0
+        self.error = None  # Cross validated mean absolute relative error, set by train
+
+    def fit(self, inputs, cycles):
+        columns = expand(inputs)
+        self.mean = columns.mean(axis=0)
+        self.scale = columns.std(axis=0)
+        self.scale[self.scale == 0] = 1.0  # Constant columns, e.g. trace features of a single trace
+        columns = (columns - self.mean) / self.scale
+        targets = numpy.log(numpy.asarray(cycles, dtype=float))
+        self.offset = targets.mean()
+        self.rows = len(targets)
+        gram = columns.T @ columns + self.penalty * self.rows * numpy.eye(columns.shape[1])
+        self.weights = numpy.linalg.solve(gram, columns.T @ (targets - self.offset))
+        return self
+
+    def predict(self, inputs):
+        columns = (expand(inputs) - self.mean) / self.scale
+        return numpy.exp(columns @ self.weights + self.offset)
+
+
+def getError(predicted, cycles):
+    cycles = numpy.asarray(cycles, dtype=float)
+    return float(numpy.mean(numpy.abs(numpy.asarray(predicted) - cycles) / cycles))
+
+
+def train(inputs, cycles):
+    # The penalty with the lowest error over FOLDS held out folds is used to fit every row
+    inputs = numpy.asarray(inputs, dtype=float)
+    cycles = numpy.asarray(cycles, dtype=float)
+    order = list(range(len(cycles)))
+    random.Random(0).shuffle(order)
+    folds = [numpy.array(order[fold::FOLDS]) for fold in range(FOLDS)]
+    best = None
+    for penalty in PENALTIES:
+        predicted = numpy.empty(len(cycles))
+        for fold in folds:
+            mask = numpy.ones(len(cycles), dtype=bool)
+            mask[fold] = False
+            predicted[fold] = Surrogate(penalty).fit(inputs[mask], cycles[mask]).predict(inputs[fold])
+        error = getError(predicted, cycles)
+        if best is None or error < best[0]:
+            best = (error, penalty)
+    model = Surrogate(best[1]).fit(inputs, cycles)
+    model.error = best[0]
+    return model
+
+
+def getTrainingData(paths):
+    # Exact finished results of the current timing model whose trace features are known, once per trace and
+    # parameter set over all databases
+    inputs = []
+    cycles = []
+    seen = set()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        store = ResultsStore(path, PARAMETERS)
+        features = store.getTraceFeatures()
+        for row in store.getRows(MODEL_VERSION):
+            key = (row["traceHash"],) + tuple(row[name] for name in PARAMETERS)
+            if row["pruned"] or not row["exact"] or row["start"] or row["traceHash"] not in features or key in seen:
+                continue
+            seen.add(key)
+            inputs.append(getInputs(row, features[row["traceHash"]]))
+            cycles.append(row["cycles"] - 1)
+        store.close()
+    return inputs, cycles
+
+
+def trainSurrogate(paths):
+    # None while the databases hold too few results
+    inputs, cycles = getTrainingData(sorted(set(paths)))
+    if len(cycles) < max(MIN_ROWS, FOLDS):
+        print("Surrogate -", len(cycles), "results to train on, at least", MIN_ROWS, "are needed")
+        return None
+    model = train(inputs, cycles)
+    print("Surrogate - Trained on", model.rows, "results, cross validated error",
+          "{:.2f}%".format(100 * model.error), "(penalty " + str(model.penalty) + ")")
+    return model
+
+
+def predictTasks(model, tasks):
+    # Predicted cycles of every task, None for the traces that were not preprocessed
+    predicted = [None] * len(tasks)
+    features = {}
+    indices = []
+    inputs = []
+    for index, (iodir, config, _) in enumerate(tasks):
+        if iodir not in features:
+            trace = sharedTraces[iodir].preprocessed
+            features[iodir] = trace.getFeatures() if trace is not None else None
+        if features[iodir] is not None:
+            indices.append(index)
+            inputs.append(getInputs(config.getParameters(), features[iodir]))
+    if inputs:
+        for index, cycles in zip(indices, model.predict(inputs)):
+            predicted[index] = int(round(cycles))
+    return predicted
+
+
+def selectPromising(tasks, predicted, fraction):
+    # Per trace, the `fraction` of the points predicted fastest, and every point predicted on the Pareto front of
+    # hardware cost and cycles (no comparable or cheaper point predicted faster), since a cheap point can be worth it
+    # even when slow. Points without a prediction are always selected.
+    selected = set(index for index, cycles in enumerate(predicted) if cycles is None)
+    traces = {}
+    for index, (iodir, _, _) in enumerate(tasks):
+        if predicted[index] is not None:
+            traces.setdefault(iodir, []).append(index)
+    for indices in traces.values():
+        ranked = sorted(indices, key=lambda index: predicted[index])
+        selected.update(ranked[:max(1, math.ceil(fraction * len(ranked)))])
+        resources = {index: getResources(tasks[index][1]) for index in indices}
+        for index in indices:
+            if not any(predicted[other] < predicted[index] and
+                       all(value <= limit for value, limit in zip(resources[other], resources[index]))
+                       for other in indices):
+                selected.add(index)
+    return sorted(selected)
+
+
+def recordPredictions(model, completed, predicted, filepaths):
+    # Every detailed run checked against its prediction, kept in the predictions table of its results database.
+    # Returns the errors of this sweep.
+    stores = {}
+    errors = []
+    for ((iodir, config, _), result), cycles, path in zip(completed, predicted, filepaths):
+        if cycles is None or result.get("pruned") or not result.get("exact", True):
+            continue
+        if path not in stores:
+            stores[path] = ResultsStore(path, PARAMETERS)
+        stores[path].addPrediction(os.path.basename(os.path.normpath(iodir)), sharedTraces[iodir].getHash(),
+                                   config.getName(), config.getParameters(), cycles, result["clk"] - 1, model.rows,
+                                   MODEL_VERSION)
+        errors.append((cycles - (result["clk"] - 1)) / (result["clk"] - 1))
+    for store in stores.values():
+        store.commit()
+        store.close()
+    return errors
+
+
+def getReportLines(model, paths):
+    lines = ["===============SURROGATE==============="]
+    if model is not None:
+        lines += ["Training Results: " + str(model.rows),
+                  "Inputs: " + str(len(PARAMETERS) + len(TRACE_FEATURES)) + ", Coefficients: " +
+                  str(len(model.weights)),
+                  "Penalty: " + str(model.penalty),
+                  "Cross Validated Error: " + "{:.2f}%".format(100 * model.error)]
+    predictions = []
+    for path in sorted(set(paths)):
+        if os.path.exists(path):
+            store = ResultsStore(path, PARAMETERS)
+            predictions += store.getPredictions()
+            store.close()
+    # Error of every prediction the DSE checked against a detailed run, overall and for the latest ones
+    errors = [(row["predicted"] - row["cycles"]) / row["cycles"] for row in sorted(predictions,
+                                                                                   key=lambda row: row["updated"])]
+    lines.append("Tracked Predictions: " + str(len(errors)))
+    for name, window in [("All", errors), ("Last 50", errors[-50:])]:
+        if window:
+            lines.append(name + " - Mean Absolute Error: " +
+                         "{:.2f}%".format(100 * sum(abs(error) for error in window) / len(window)) +
+                         ", Mean Error (bias): " + "{:+.2f}%".format(100 * sum(window) / len(window)))
+    lines.append("======================================")
+    return lines
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Surrogate cycle model trained on the stored timing results')
+    parser.add_argument('--results', default=["IODir1/Results.db"], type=str, nargs='+',
+                        help='SQLite results databases to train on')
+    args = parser.parse_args()
+    args.results = [os.path.abspath(path) for path in args.results]
+    return args
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    lines = getReportLines(trainSurrogate(args.results), args.results)
+    for line in lines:
+        print(line)
+    dumpOutput(os.path.dirname(args.results[0]), lines, "Surrogate.txt")
@@ -0,0 +1,112 @@
+import argparse
+import glob
+import json
+import os
+
+from status import Status
+
+COLUMNS = ["cycle", "computeQueue", "dataQueue", "window", "add", "mul", "div", "data", "busyBanks"]
+
+
+class Telemetry:
+    # Queue depths, issue window size, pipeline states and number of busy banks sampled every `interval` cycles.
+    # Once `maxSamples` samples are held, neighbouring samples are averaged pairwise and the interval doubles, so
+    # memory stays bounded however long the run is and a sample is the mean of the samples it covers.
+    def __init__(self, interval=100, maxSamples=4096):
+        self.interval = interval
+        self.maxSamples = max(2, maxSamples)
+        self.countdown = 1
+        self.columns = {column: [] for column in COLUMNS}
+
+    def attach(self, core):
+        pass
+
+    def cycle(self, core, instr, issued, computeInstr, dataInstr, scalarInstr):
+        self.countdown -= 1
+        if self.countdown:
+            return
+        self.countdown = self.interval
+        decode = core.decode
+        columns = self.columns
+        columns["cycle"].append(core.clk)
+        columns["computeQueue"].append(len(decode.computeQueue))
+        columns["dataQueue"].append(len(decode.dataQueue))
+        columns["window"].append(len(decode.priorityQueue))
+        for name, status in zip(["add", "mul", "div"], core.compute.getPipelineStatus()):
+            columns[name].append(1 if status == Status.BUSY else 0)
+        columns["data"].append(1 if core.data.getStatus() == Status.BUSY else 0)
+        columns["busyBanks"].append(sum(1 for busy in core.data.bankBusyBoard if busy))
+        if len(columns["cycle"]) >= self.maxSamples:
+            self.decimate()
+
+    def decimate(self):
+        for column, values in self.columns.items():
+            if column == "cycle":  # A merged sample starts where the first of the pair started
+                self.columns[column] = values[::2]
+            else:
+                merged = [(values[index] + values[index + 1]) / 2 for index in range(0, len(values) - 1, 2)]
+                self.columns[column] = merged + values[len(merged) * 2:]
+        self.interval *= 2  # The next sample is already due one old interval after the last merged pair
+
+    def getReport(self):
+        report = {"interval": self.interval}
+        report.update(self.columns)
+        return report
+
+
+def dumpTelemetry(iodir, report, fileName="Telemetry.json"):
+    filepath = os.path.abspath(os.path.join(iodir, fileName))
+    try:
+        with open(filepath, 'w') as opf:
+            json.dump(report, opf, separators=(',', ':'))
+        print(fileName, "- Dumped telemetry into output file in path:", filepath)
+    except:
+        print(fileName, "- ERROR: Couldn't open output file in path:", filepath)
+
+
+def plotTelemetry(filepath, plotPath):
+    from matplotlib import pyplot as plt  # Only needed to render, simulation never imports it
+
+    with open(filepath, 'r') as inf:
+        report = json.load(inf)
+    cycles = report["cycle"]
+    fig, (queues, pipelines, banks) = plt.subplots(3, 1, sharex=True, figsize=(10, 8))
+
+    for column, label in [("computeQueue", "Compute queue"), ("dataQueue", "Data queue"), ("window", "Issue window")]:
+        queues.plot(cycles, report[column], label=label)
+    queues.set_ylabel('Instructions')
+    queues.legend(loc='upper right')
+
+    for column in ["add", "mul", "div", "data"]:
+        pipelines.plot(cycles, report[column], label=column.capitalize())
+    pipelines.set_ylabel('Busy fraction')
+    pipelines.set_ylim(-0.05, 1.05)
+    pipelines.legend(loc='upper right')
+
+    banks.plot(cycles, report["busyBanks"])
+    banks.set_ylabel('Busy banks')
+    banks.set_xlabel('Clock cycle')
+
+    queues.set_title(os.path.basename(filepath) + " - occupancy over time")
+    fig.tight_layout()
+    plt.savefig(plotPath)
+    plt.close(fig)
+    print("Telemetry - Plot saved in path:", plotPath)
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Plot the telemetry written by main.py --telemetry')
+    parser.add_argument('--iodir', default="IODir1", type=str,
+                        help='Path to the folder containing the TelemetryN.json files, plots go to its Plots folder')
+    args = parser.parse_args()
+    return os.path.abspath(args.iodir)
+
+
+if __name__ == "__main__":
+    iodir = parseArguments()
+    plotDir = os.path.join(iodir, "Plots")
+    os.makedirs(plotDir, exist_ok=True)
+    for filepath in sorted(glob.glob(os.path.join(iodir, "Telemetry*.json"))):
+        name = os.path.basename(filepath)
+        plotTelemetry(filepath, os.path.join(plotDir, name[:name.rindex(".")] + ".png"))
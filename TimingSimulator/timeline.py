@@ -0,0 +1,161 @@
+import json
+import os
+from collections import deque
+
+from computeEngine import ComputeEngine
+from decode import Decode
+from status import Status
+
+# Record fields, one list per dynamic instruction
+SEQUENCE = 0
+ADDRESS = 1
+NAME = 2
+UNIT = 3
+FETCH = 4
+ISSUE = 5
+DISPATCH = 6
+COMPLETE = 7
+
+UNITS = ["add", "mul", "div", "data", "scalar"]
+STAGES = [("window", FETCH, ISSUE), ("queue", ISSUE, DISPATCH)]
+
+
+class Timeline:
+    # Fetch, issue (window to compute/data/scalar queue), dispatch (queue to engine) and completion cycle of every
+    # dynamic instruction. Only instructions fetched in the cycle range [start, end) are recorded, and with `limit`
+    # only the last `limit` completed ones are kept. Outside of the range a cycle costs a few comparisons.
+    def __init__(self, start=0, end=None, limit=None):
+        self.start = start
+        self.end = end
+        self.records = deque(maxlen=limit)
+        self.inFlight = {}  # id of the decoded instruction: record, the record keeps the instruction alive
+        self.running = {}  # unit: (instruction, record) executing on it
+        self.sequence = 0
+        self.tail = None  # id of the last instruction of the window at the end of the previous cycle
+
+    def attach(self, core):
+        pass
+
+    def cycle(self, core, instr, issued, computeInstr, dataInstr, scalarInstr):
+        clk = core.clk
+        window = core.decode.priorityQueue
+        tail = self.tail
+        self.tail = id(window[-1]) if window else None
+        if not self.inFlight and (clk < self.start or (self.end is not None and clk >= self.end)):
+            if instr is not None:
+                self.sequence += 1
+            return
+        inFlight = self.inFlight
+
+        if instr is not None:
+            # The fetched instruction was appended to the window and is its last one, unless decode issued it right
+            # away, the window then ends like in the previous cycle. Instructions fetched before the recorded range
+            # aren't in flight, so only the window tells them apart from the fetched one.
+            new = issued if issued is not None and (not window or id(window[-1]) == tail) else window[-1]
+            if clk >= self.start and (self.end is None or clk < self.end):
+                record = [self.sequence, core.fetch.addr - 1, new.get(Decode.INSTR_NAME), None, None, None, None, None]
+                inFlight[id(new)] = record
+                self.setEvent(new, record, FETCH, clk)
+            self.sequence += 1
+        if issued is not None:
+            record = inFlight.get(id(issued))
+            if record is not None:
+                self.setEvent(issued, record, ISSUE, clk)
+
+        if computeInstr is not None:
+            self.dispatch(computeInstr, self.getComputeUnit(computeInstr), clk)
+        if dataInstr is not None:
+            self.dispatch(dataInstr, "data", clk)
+        if scalarInstr is not None:  # Scalar instructions retire in the cycle they leave their queue
+            record = self.dispatch(scalarInstr, "scalar", clk)
+            if record is not None:
+                self.complete(scalarInstr, record, clk)
+                del self.running["scalar"]
+
+        if self.running:
+            addStatus, mulStatus, divStatus = core.compute.getPipelineStatus()
+            status = {"add": addStatus, "mul": mulStatus, "div": divStatus, "data": core.data.getStatus()}
+            for unit, (instr, record) in list(self.running.items()):
+                if status[unit] == Status.FREE:
+                    self.complete(instr, record, clk)
+                    del self.running[unit]
+
+    @staticmethod
+    def getComputeUnit(instr):
+        name = instr.get(Decode.INSTR_NAME)
+        if name in ComputeEngine.addPipelineInstr:
+            return "add"
+        if name in ComputeEngine.mulPipelineInstr:
+            return "mul"
+        return "div"
+
+    def dispatch(self, instr, unit, clk):
+        record = self.inFlight.get(id(instr))
+        if record is not None:
+            record[UNIT] = unit
+            self.setEvent(instr, record, DISPATCH, clk)
+            self.running[unit] = (instr, record)
+        return record
+
+    def complete(self, instr, record, clk):
+        self.setEvent(instr, record, COMPLETE, clk)
+        del self.inFlight[id(instr)]
+        self.records.append(record)
+
+    # Called for every event of a recorded instruction, subclasses extend it to track more than the cycle
+    def setEvent(self, instr, record, event, clk):
+        record[event] = clk
+
+    def getRecords(self):
+        return sorted(self.records, key=lambda record: record[SEQUENCE])
+
+    def getTraceEvents(self):
+        # One cycle is shown as one microsecond. Engines execute one instruction at a time, so execution is a
+        # complete event on the thread of its engine; waiting in the window and in the queues overlaps, so those are
+        # async events.
+        events = [{"name": "process_name", "ph": "M", "pid": 0, "args": {"name": "Vector Core"}}]
+        for tid, unit in enumerate(UNITS):
+            events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": unit}})
+        for record in self.getRecords():
+            name = record[NAME]
+            args = {"sequence": record[SEQUENCE], "address": record[ADDRESS]}
+            for stage, begin, end in STAGES:
+                if record[end] > record[begin]:
+                    events.append({"name": name, "cat": stage, "ph": "b", "id": record[SEQUENCE], "pid": 0,
+                                   "tid": UNITS.index(record[UNIT]), "ts": record[begin], "args": args})
+                    events.append({"name": name, "cat": stage, "ph": "e", "id": record[SEQUENCE], "pid": 0,
+                                   "tid": UNITS.index(record[UNIT]), "ts": record[end]})
+            events.append({"name": name, "cat": "execute", "ph": "X", "pid": 0, "tid": UNITS.index(record[UNIT]),
+                           "ts": record[DISPATCH], "dur": max(1, record[COMPLETE] - record[DISPATCH]), "args": args})
+        return events
+
+    def dumpTraceEvents(self, filepath):
+        with open(filepath, 'w') as opf:
+            json.dump({"traceEvents": self.getTraceEvents(), "displayTimeUnit": "ms"}, opf)
+
+    def dumpColumns(self, filepath):
+        import numpy  # Only needed for the columnar export
+
+        records = self.getRecords()
+        names = sorted(set(record[NAME] for record in records))
+        columns = {"sequence": SEQUENCE, "address": ADDRESS, "fetch": FETCH, "issue": ISSUE, "dispatch": DISPATCH,
+                   "complete": COMPLETE}
+        arrays = {column: numpy.array([record[field] for record in records], dtype=numpy.int64)
+                  for column, field in columns.items()}
+        arrays["opcode"] = numpy.array([names.index(record[NAME]) for record in records], dtype=numpy.int16)
+        arrays["opcodes"] = numpy.array(names)
+        arrays["unit"] = numpy.array([UNITS.index(record[UNIT]) for record in records], dtype=numpy.int8)
+        arrays["units"] = numpy.array(UNITS)
+        numpy.savez_compressed(filepath, **arrays)
+
+
+def dumpTimeline(iodir, timeline, fileName="Output"):
+    for suffix, dump in [(".trace.json", timeline.dumpTraceEvents), (".npz", timeline.dumpColumns)]:
+        filepath = os.path.abspath(os.path.join(iodir, fileName + suffix))
+        try:
+            dump(filepath)
+            print(fileName + suffix, "- Dumped timeline into output file in path:", filepath)
+        except ImportError:
+            print(fileName + suffix, "- ERROR: numpy is required for the columnar timeline")
+        except:
+            print(fileName + suffix, "- ERROR: Couldn't open output file in path:", filepath)
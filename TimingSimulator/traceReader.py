@@ -0,0 +1,141 @@
+import gzip
+import lzma
+import os
+import queue
+import threading
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+
+def findTrace(iodir, fileName="Data.txt", storeName="Data.vtr"):
+    # Compressed traces can be stored as Data.txt.gz or Data.txt.xz next to the configs. A trace store converted
+    # from the text trace is preferred unless the text trace was modified after the conversion.
+    textPath = os.path.abspath(os.path.join(iodir, fileName))
+    for name in [fileName, fileName + ".gz", fileName + ".xz"]:
+        filepath = os.path.abspath(os.path.join(iodir, name))
+        if os.path.exists(filepath):
+            textPath = filepath
+            break
+    if storeName is None:
+        return textPath
+    storePath = os.path.abspath(os.path.join(iodir, storeName))
+    if os.path.exists(storePath) and (not os.path.exists(textPath) or
+                                      os.path.getmtime(storePath) >= os.path.getmtime(textPath)):
+        return storePath
+    return textPath
+
+
+def openTrace(filepath):
+    with open(filepath, 'rb') as insf:
+        magic = insf.read(6)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(filepath, 'rt')
+    if magic.startswith(XZ_MAGIC):
+        return lzma.open(filepath, 'rt')
+    return open(filepath, 'r')
+
+
+def readInstructions(insf):
+    for ins in insf:
+        if not (ins.startswith('#') or ins.strip() == ''):
+            yield ins.split('#')[0].strip()
+
+
+class TraceError(Exception):
+    pass
+
+
+class StreamingRecords:
+    # Decoded instructions of a StreamingTrace, indexed like the records of a preprocessed trace. Only the
+    # instructions in the window of the trace are available, fetch reads the record of the address it just read.
+    def __init__(self, trace):
+        self.trace = trace
+
+    def __getitem__(self, addr):
+        return self.trace.decoded[addr - self.trace.base]
+
+
+class StreamingTrace:
+    # Trace read on a background thread through a bounded buffer, so memory does not grow with the trace length.
+    # Instructions are indexed like a list, but only moving forward: reading an address releases every instruction
+    # more than `history` addresses behind it. Reading past the end raises IndexError like a list, a trace that
+    # can't be read or decompressed raises TraceError where the error happened. With a decoder the reader thread
+    # also decodes every instruction, `records` then gives them to fetch so the simulation doesn't decode them.
+    END = None
+
+    def __init__(self, filepath, bufferSize=4096, history=2048, chunkSize=256, decoder=None):
+        self.filepath = filepath
+        self.history = history
+        self.chunkSize = chunkSize
+        self.decoder = decoder
+        self.base = 0  # address of the first instruction in the window
+        self.window = []
+        self.decoded = []  # decoded instructions of the window, when there is a decoder
+        self.records = StreamingRecords(self) if decoder is not None else None
+        self.length = None  # known once the reader reached the end of the trace
+        self.error = None  # set once the reader failed
+        self.stopped = threading.Event()
+        self.chunks = queue.Queue(maxsize=max(1, bufferSize // chunkSize))
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        try:
+            with openTrace(self.filepath) as insf:
+                chunk = []
+                for ins in readInstructions(insf):
+                    chunk.append(ins)
+                    if len(chunk) == self.chunkSize:
+                        if not self.put(self.getChunk(chunk)):
+                            return
+                        chunk = []
+                if chunk and not self.put(self.getChunk(chunk)):
+                    return
+        except Exception as error:  # Handed to the simulation thread, which raises it
+            self.put(error)
+            return
+        self.put(StreamingTrace.END)
+
+    def getChunk(self, chunk):
+        return chunk, [self.decoder(ins) for ins in chunk] if self.decoder is not None else None
+
+    def put(self, chunk):
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def __getitem__(self, addr):
+        if addr < self.base:
+            raise ValueError("StreamingTrace - Instruction " + str(addr) + " was already released")
+        while addr >= self.base + len(self.window):
+            if self.error is not None:
+                raise self.error
+            if self.length is not None:
+                raise IndexError(addr)
+            chunk = self.chunks.get()
+            if chunk is StreamingTrace.END:
+                self.length = self.base + len(self.window)
+                raise IndexError(addr)
+            if isinstance(chunk, Exception):
+                self.error = TraceError("StreamingTrace - ERROR: Couldn't read trace in path: " + self.filepath +
+                                        " (" + type(chunk).__name__ + ": " + str(chunk) + ")")
+                raise self.error from chunk
+            release = min(addr - self.history - self.base, len(self.window))
+            if release > 0:
+                del self.window[:release]
+                if self.decoder is not None:
+                    del self.decoded[:release]
+                self.base += release
+            self.window += chunk[0]
+            if self.decoder is not None:
+                self.decoded += chunk[1]
+        return self.window[addr - self.base]
+
+    def close(self):
+        # Stops the reader thread, which closes the file. Called by the core once its run ends.
+        self.stopped.set()
@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from traceReader import findTrace, openTrace, readInstructions
+
+# Layout of a .vtr trace store, all little endian:
+#   header    magic, version, instruction count, records offset, address pool offset, trace hash, opcode table size
+#   opcodes   JSON list of the opcode names, indexed by the records
+#   records   one fixed-width record per instruction, so instruction N is found at recordsOffset + N * RECORD.size
+#   pool      the address lists of the vector memory instructions, stored out of line as uint32
+MAGIC = b'VTRC'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQQ64sI')
+# opcode, operand kinds, operand values, first address in the pool, number of addresses
+RECORD = struct.Struct('<BBBBiiiQI')
+ADDRESS = struct.Struct('<I')
+MAX_OPERANDS = 3
+OPERAND_NONE = 0
+OPERAND_SCALAR = 1
+OPERAND_VECTOR = 2
+OPERAND_IMMEDIATE = 3
+REGISTER_PREFIX = {OPERAND_SCALAR: "SR", OPERAND_VECTOR: "VR"}
+
+
+def encodeOperand(token):
+    if token.startswith("SR"):
+        return OPERAND_SCALAR, int(token[2:])
+    if token.startswith("VR"):
+        return OPERAND_VECTOR, int(token[2:])
+    return OPERAND_IMMEDIATE, int(token)
+
+
+def convertTrace(textPath, storePath):
+    # Everything is written to temporary files next to the store, which replaces the store once it is complete, so
+    # a failed or interrupted conversion never leaves a truncated store that findTrace would prefer to the trace.
+    temporary = storePath + "." + str(os.getpid()) + ".tmp"
+    # The opcode table is only known at the end, records and addresses go to their own files until then
+    recordsPath = temporary + ".records"
+    poolPath = temporary + ".pool"
+    try:
+        count = writeStore(textPath, temporary, recordsPath, poolPath)
+        os.replace(temporary, storePath)
+    finally:
+        for path in [temporary, recordsPath, poolPath]:
+            if os.path.exists(path):
+                os.remove(path)
+    print("TraceStore - Converted", count, "instructions from", textPath, "into", storePath)
+    return count
+
+
+def writeStore(textPath, storePath, recordsPath, poolPath):
+    opcodes = []
+    opcodeIndex = {}
+    sha = hashlib.sha256()
+    count = 0
+    poolCount = 0
+    with open(storePath, 'wb') as store, open(poolPath, 'wb') as pool, openTrace(textPath) as insf:
+        with open(recordsPath, 'wb') as records:
+            for ins in readInstructions(insf):
+                sha.update((ins if count == 0 else "\n" + ins).encode())
+                args = ins.split()
+                addresses = []
+                if args[-1].startswith('('):
+                    addresses = [int(address) for address in args.pop().strip('()').split(',')]
+                if len(args) - 1 > MAX_OPERANDS:
+                    raise ValueError("TraceStore - Too many operands in instruction " + str(count) + ": " + ins)
+                if args[0] not in opcodeIndex:
+                    opcodeIndex[args[0]] = len(opcodes)
+                    opcodes.append(args[0])
+                operands = [encodeOperand(token) for token in args[1:]]
+                operands += [(OPERAND_NONE, 0)] * (MAX_OPERANDS - len(operands))
+                records.write(RECORD.pack(opcodeIndex[args[0]], *[kind for kind, _ in operands],
+                                          *[value for _, value in operands], poolCount, len(addresses)))
+                pool.write(struct.pack('<' + str(len(addresses)) + 'I', *addresses))
+                poolCount += len(addresses)
+                count += 1
+
+        table = json.dumps(opcodes).encode()
+        recordsOffset = HEADER.size + len(table)
+        recordsOffset += -recordsOffset % 8
+        poolOffset = recordsOffset + count * RECORD.size
+        store.write(HEADER.pack(MAGIC, VERSION, count, recordsOffset, poolOffset, sha.hexdigest().encode(), len(table)))
+        store.write(table)
+        store.write(b'\0' * (recordsOffset - HEADER.size - len(table)))
+        pool.flush()
+        for path in [recordsPath, poolPath]:
+            with open(path, 'rb') as part:
+                while True:
+                    block = part.read(1 << 20)
+                    if not block:
+                        break
+                    store.write(block)
+    return count
+
+
+class TraceStore:
+    # Read-only, memory-mapped view of a .vtr trace. Indexing returns the instruction text like the list of IMEM,
+    # without parsing anything before it. Forked workers share the mapping, spawned workers map the file again.
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+        self.open()
+
+    def open(self):
+        with open(self.filepath, 'rb') as store:
+            self.buffer = mmap.mmap(store.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.recordsOffset, self.poolOffset, traceHash, tableSize = \
+            HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("TraceStore - Not a version " + str(VERSION) + " trace store: " + self.filepath)
+        self.hash = traceHash.decode()
+        self.opcodes = json.loads(self.buffer[HEADER.size:HEADER.size + tableSize].decode())
+
+    def __getstate__(self):
+        return {"filepath": self.filepath}
+
+    def __setstate__(self, state):
+        self.filepath = state["filepath"]
+        self.open()
+
+    def __len__(self):
+        return self.count
+
+    def getRecord(self, addr):
+        if addr < 0 or addr >= self.count:
+            raise IndexError(addr)
+        opcode, kind0, kind1, kind2, value0, value1, value2, poolStart, poolCount = \
+            RECORD.unpack_from(self.buffer, self.recordsOffset + addr * RECORD.size)
+        operands = [(kind, value) for kind, value in [(kind0, value0), (kind1, value1), (kind2, value2)]
+                    if kind != OPERAND_NONE]
+        addresses = struct.unpack_from('<' + str(poolCount) + 'I', self.buffer,
+                                       self.poolOffset + poolStart * ADDRESS.size)
+        return self.opcodes[opcode], operands, addresses
+
+    def __getitem__(self, addr):
+        name, operands, addresses = self.getRecord(addr)
+        tokens = [name] + [REGISTER_PREFIX.get(kind, "") + str(value) for kind, value in operands]
+        if addresses:
+            tokens.append("(" + ",".join(str(address) for address in addresses) + ")")
+        return " ".join(tokens)
+
+    def close(self):
+        self.buffer.close()
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Convert a resolved data trace into a memory-mapped trace store')
+    parser.add_argument('--iodir', default="IODir1", type=str,
+                        help='Path to the folder containing Data.txt, the store is written next to it as Data.vtr')
+    args = parser.parse_args()
+    return os.path.abspath(args.iodir)
+
+
+if __name__ == "__main__":
+    iodir = parseArguments()
+    convertTrace(findTrace(iodir, storeName=None), os.path.join(iodir, "Data.vtr"))
@@ -0,0 +1,86 @@
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+
+from main import Config, Core, IMEM
+from traceStore import convertTrace
+
+# This file verifies that a trace gives the same cycles whichever way it is read: held in memory, mapped from a trace
+# store, streamed and streamed from a gzip file. The synthetic trace sets the vector length once, near its start,
+# and every run also starts at --start, far enough past it that a streamed trace has already released the MTCL.
+
+
+def writeTrace(filepath, length, vectorLength):
+    with open(filepath, 'w') as opf:
+        opf.write("LS SR1 SR0 0\nMTCL SR1 " + str(vectorLength) + "\n")
+        for index in range(length - 2):
+            base = (index * 64) % 4096
+            if index % 4 == 0:
+                opf.write("LV VR" + str(index % 3 + 1) + " SR0 (" +
+                          ",".join(str(base + element) for element in range(vectorLength)) + ")\n")
+            elif index % 4 == 1:
+                opf.write("MULVV VR4 VR1 VR2\n")
+            elif index % 4 == 2:
+                opf.write("ADDVV VR5 VR4 VR3\n")
+            else:
+                opf.write("ADD SR2 SR2 SR1\n")
+
+
+def simulate(iodir, config, start, streaming=False):
+    core = Core(config, IMEM(iodir, streaming), iodir, start)
+    core.run()
+    return core.clk - 1
+
+
+def parseArguments():
+    parser = argparse.ArgumentParser(
+        description='Verification of the trace readers of the timing simulator')
+    parser.add_argument('--config', default="IODir0/Config1.txt", type=str,
+                        help='Path to the config simulated')
+    parser.add_argument('--length', default=4000, type=int,
+                        help='Number of instructions of the synthetic trace')
+    parser.add_argument('--start', default=3000, type=int,
+                        help='Instruction the second run of every reader starts at, past the streaming history')
+    parser.add_argument('--vector-length', default=16, type=int,
+                        help='Vector length set by the MTCL at the start of the trace')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parseArguments()
+    directory = tempfile.mkdtemp()
+    try:
+        readers = {}
+        for name in ["text", "store", "gzip"]:
+            readers[name] = os.path.join(directory, name)
+            os.makedirs(readers[name])
+            shutil.copy(args.config, readers[name])
+        textPath = os.path.join(readers["text"], "Data.txt")
+        writeTrace(textPath, args.length, args.vector_length)
+        convertTrace(textPath, os.path.join(readers["store"], "Data.vtr"))
+        with open(textPath, 'rb') as inf, gzip.open(os.path.join(readers["gzip"], "Data.txt.gz"), 'wb') as opf:
+            shutil.copyfileobj(inf, opf)
+
+        print("=========RUNNING SIMULATOR========")
+        fileName = os.path.basename(args.config)
+        runs = [("memory", readers["text"], False), ("store", readers["store"], False),
+                ("stream", readers["text"], True), ("stream gzip", readers["gzip"], True)]
+        results = {}
+        for start in [0, args.start]:
+            for name, iodir, streaming in runs:
+                results[(name, start)] = simulate(iodir, Config(iodir, fileName), start, streaming)
+
+        print("==============RESULT==============")
+        failures = 0
+        for (name, start), cycles in results.items():
+            valid = cycles == results[("memory", start)]
+            failures += not valid
+            print(name, "from", start, str(cycles) + ("" if valid else " - WRONG"))
+        if failures:
+            print("Verification Failed")
+        else:
+            print("Verification Successful")
+    finally:
+        shutil.rmtree(directory)